@@ -0,0 +1,291 @@
+"""
+This module contains the Autoscaler class, which adds capacity to the VMSS's ahead of demand,
+and the ScaleInController class, which removes VMs that have been idle for a while.
+"""
+
+import asyncio
+import math
+import os
+import time
+from typing import TYPE_CHECKING
+
+from custom_logger import main_logger
+from models import JudgeRequest, MachineType
+
+if TYPE_CHECKING:
+    from azureevaluator import AzureEvaluator, JudgeVMSS
+
+# Initialize the logger
+logger = main_logger.getChild("autoscaler")
+
+# The time in seconds between two scaling rounds, if not woken up by pending requests earlier
+AUTOSCALER_INTERVAL = float(os.getenv("AUTOSCALER_INTERVAL", "10"))
+
+# The time in seconds to wait after being woken up, so a burst of requests is handled in one scaling round
+AUTOSCALER_DEBOUNCE = float(os.getenv("AUTOSCALER_DEBOUNCE", "1"))
+
+# The time window in seconds over which the arrival rate of requests is measured
+AUTOSCALER_RATE_WINDOW = float(os.getenv("AUTOSCALER_RATE_WINDOW", "300"))
+
+# The expected time in seconds it takes to provision a VM, demand arriving within this time is provisioned ahead
+AUTOSCALER_LEAD_TIME = float(os.getenv("AUTOSCALER_LEAD_TIME", "60"))
+
+# The maximum amount of VMs in a single VMSS
+AUTOSCALER_MAX_VMS = int(os.getenv("AUTOSCALER_MAX_VMS", "50"))
+
+
+def parse_warm_pool(value: str) -> dict[str, int]:
+    """
+    Parse the warm pool setting, formatted as `Standard_B1s=2,Standard_B2s=1`.
+    """
+    warm_pool = {}
+    for entry in value.split(","):
+        if entry.strip() == "":
+            continue
+
+        name, count = entry.split("=", 1)
+        warm_pool[name.strip()] = int(count)
+
+    return warm_pool
+
+
+# The amount of idle VMs to keep available per machine type name
+WARM_POOL = parse_warm_pool(os.getenv("WARM_POOL", ""))
+
+# The time in seconds between two rounds of the scale-in controller
+SCALE_IN_INTERVAL = float(os.getenv("SCALE_IN_INTERVAL", "30"))
+
+# The time in seconds a VM should be idle before it is removed
+SCALE_IN_GRACE_PERIOD = float(os.getenv("SCALE_IN_GRACE_PERIOD", "300"))
+
+
+def vms_needed(judge_requests: list[JudgeRequest], free_cpu: int, free_memory: int, vm_size: tuple[int, int] | None,
+               max_containers: int | None = None, free_slots: int = 0) -> int:
+    """
+    Estimate the amount of VMs needed for the given requests, next to the given free resources.
+    If the size of a VM is unknown, every request is assumed to need its own VM.
+    If the runners declare the amount of containers they can run, a VM holds at most that many requests.
+    Requests that do not fit on a single VM are left out, as no amount of VMs can take them on.
+    """
+    if vm_size is None:
+        return len(judge_requests)
+
+    cpus, memory = vm_size
+    judge_requests = [judge_request for judge_request in judge_requests if judge_request.cpus <= cpus and judge_request.memory <= memory]
+    needed_cpu = sum(judge_request.cpus for judge_request in judge_requests) - free_cpu
+    needed_memory = sum(judge_request.memory for judge_request in judge_requests) - free_memory
+    needed = max(0, math.ceil(needed_cpu / cpus), math.ceil(needed_memory / memory))
+
+    if max_containers:
+        needed = max(needed, math.ceil((len(judge_requests) - free_slots) / max_containers))
+
+    return needed
+
+
+class Autoscaler:
+    """
+    Watches the pending requests and their arrival rate, and adds capacity to the VMSS's in batches.
+
+    Runs as a task on the event loop it was started on, and can be woken up from any thread.
+    """
+
+    evaluator: 'AzureEvaluator'
+    warm_pool: dict[str, int]
+    interval: float
+    debounce: float
+    rate_window: float
+    lead_time: float
+    loop: asyncio.AbstractEventLoop = None
+    wakeup: asyncio.Event
+    locks: dict[MachineType, asyncio.Lock]
+    """
+    Locks per machine type, making sure capacity changes of a single VMSS do not overlap.
+    """
+    task: asyncio.Task = None
+
+    def __init__(self, evaluator: 'AzureEvaluator', warm_pool: dict[str, int] = WARM_POOL, interval: float = AUTOSCALER_INTERVAL,
+                 debounce: float = AUTOSCALER_DEBOUNCE, rate_window: float = AUTOSCALER_RATE_WINDOW, lead_time: float = AUTOSCALER_LEAD_TIME):
+        self.evaluator = evaluator
+        self.warm_pool = warm_pool
+        self.interval = interval
+        self.debounce = debounce
+        self.rate_window = rate_window
+        self.lead_time = lead_time
+        self.locks = {}
+
+    def start(self):
+        """
+        Start the autoscaler on the running event loop.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.task = self.loop.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def notify(self, machine_type: MachineType = None):
+        """
+        Wake up the autoscaler, e.g. because a request is waiting for capacity. Can be called from any thread.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def run(self):
+        """
+        The main loop of the autoscaler.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+                await asyncio.sleep(self.debounce)
+            except TimeoutError:
+                pass
+            self.wakeup.clear()
+
+            for judgevmss in list(self.evaluator.judgevmss_dict.values()):
+                try:
+                    # Make sure the size of the VMs is known, so the needed amount of VMs can be estimated
+                    await judgevmss.get_sku_size()
+                    self.scale(judgevmss)
+                except Exception:
+                    logger.error(f"An unexpected error has occured while scaling VMSS {judgevmss.judgevmss_name}", exc_info=1)
+
+    def scale(self, judgevmss: 'JudgeVMSS'):
+        """
+        Add the needed capacity to the given VMSS, in a single capacity change.
+        """
+        with judgevmss.lock:
+            count = self.capacity_delta(judgevmss)
+            if count <= 0:
+                return
+
+            # Account for the VMs straight away, so the next round does not request them again
+            judgevmss.provisioning += count
+
+        logger.info(f"Adding {count} VM(s) to VMSS {judgevmss.judgevmss_name}")
+        self.loop.create_task(self.add_capacity(judgevmss, count))
+
+    async def add_capacity(self, judgevmss: 'JudgeVMSS', count: int):
+        lock = self.locks.setdefault(judgevmss.machine_type, asyncio.Lock())
+
+        try:
+            async with lock:
+                await judgevmss.add_capacity(count)
+        except Exception:
+            logger.error(f"Failed to add {count} VM(s) to VMSS {judgevmss.judgevmss_name}", exc_info=1)
+        finally:
+            with judgevmss.lock:
+                judgevmss.provisioning -= count
+
+            # Re-evaluate, in case requests are still waiting
+            self.notify()
+
+    def capacity_delta(self, judgevmss: 'JudgeVMSS') -> int:
+        """
+        Calculate the amount of VMs to add to the given VMSS. Should be called while holding the lock.
+        """
+        machine_type = judgevmss.machine_type
+        scheduler = self.evaluator.scheduler
+        judgevms = list(judgevmss.judgevm_dict.values())
+        vm_size = judgevmss.vm_size()
+        max_containers = judgevmss.max_containers()
+
+        # Pending requests did not fit on any VM, so they need new VMs
+        pending = scheduler.pending_requests(machine_type)
+        needed = vms_needed(pending, 0, 0, vm_size, max_containers)
+
+        # Requests expected to arrive while provisioning may use the free resources left on the VMs
+        arrivals = scheduler.recent_arrivals(machine_type, self.rate_window)
+        expected = arrivals[:math.ceil(len(arrivals) * min(1, self.lead_time / self.rate_window))]
+        idle_vms = sum(1 for judgevm in judgevms if not judgevm.is_busy())
+        if vm_size is None:
+            predicted = max(0, len(expected) - idle_vms)
+        else:
+            free_cpu = sum(judgevm.free_cpu for judgevm in judgevms)
+            free_memory = sum(judgevm.free_memory for judgevm in judgevms)
+            free_slots = sum(min(judgevm.free_slots(), len(expected)) for judgevm in judgevms)
+            predicted = vms_needed(expected, free_cpu, free_memory, vm_size, max_containers, free_slots)
+
+        # Keep the warm pool of idle VMs filled
+        warm = max(0, self.warm_pool.get(machine_type.name, 0) - idle_vms)
+
+        # VMs that are still being provisioned or waiting for their runner will take on part of the demand
+        pending_vms = judgevmss.pending_vms()
+        needed += max(predicted, warm) - pending_vms
+
+        # Do not go over the maximum size of the VMSS
+        return min(needed, AUTOSCALER_MAX_VMS - len(judgevms) - pending_vms)
+
+
+class ScaleInController:
+    """
+    Removes VMs that have been idle for longer than the grace period, in a single deletion per VMSS.
+    """
+
+    evaluator: 'AzureEvaluator'
+    warm_pool: dict[str, int]
+    grace_period: float
+    interval: float
+    task: asyncio.Task = None
+
+    def __init__(self, evaluator: 'AzureEvaluator', warm_pool: dict[str, int] = WARM_POOL, grace_period: float = SCALE_IN_GRACE_PERIOD,
+                 interval: float = SCALE_IN_INTERVAL):
+        self.evaluator = evaluator
+        self.warm_pool = warm_pool
+        self.grace_period = grace_period
+        self.interval = interval
+
+    def start(self):
+        """
+        Start the scale-in controller on the running event loop.
+        """
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    async def run(self):
+        """
+        The main loop of the scale-in controller.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+
+            scale_ins = [self.scale_in(judgevmss) for judgevmss in list(self.evaluator.judgevmss_dict.values())]
+            await asyncio.gather(*scale_ins)
+
+    async def scale_in(self, judgevmss: 'JudgeVMSS'):
+        """
+        Remove the VMs of the given VMSS that have been idle for too long.
+        """
+        with judgevmss.lock:
+            vm_names = self.idle_vms(judgevmss)
+
+            # Take the VMs out of the dict while holding the lock, so no requests will be placed on them anymore
+            for vm_name in vm_names:
+                judgevmss.judgevm_dict.pop(vm_name)
+
+        if len(vm_names) == 0:
+            return
+
+        logger.info(f"Deleting {len(vm_names)} idle VM(s) from VMSS {judgevmss.judgevmss_name}: {', '.join(vm_names)}")
+        try:
+            await judgevmss.delete_vms(vm_names)
+        except Exception:
+            logger.error(f"Failed to delete idle VMs from VMSS {judgevmss.judgevmss_name}", exc_info=1)
+
+    def idle_vms(self, judgevmss: 'JudgeVMSS') -> list[str]:
+        """
+        Get the names of the VMs to remove from the given VMSS. Should be called while holding the lock.
+        """
+        now = time.monotonic()
+        idle = [judgevm for judgevm in judgevmss.judgevm_dict.values() if not judgevm.is_busy()]
+
+        # Keep the most recently used VMs as warm pool
+        idle.sort(key=lambda judgevm: judgevm.idle_since, reverse=True)
+        idle = idle[self.warm_pool.get(judgevmss.machine_type.name, 0):]
+
+        return [judgevm.vm.name for judgevm in idle if now - judgevm.idle_since >= self.grace_period]
@@ -1,21 +1,32 @@
 import asyncio
+import math
 import os
 import threading
+import time
 
 from azure.mgmt.compute.models import (
     VirtualMachineScaleSet,
     VirtualMachineScaleSetVM,
 )
 
+import metrics
+from autoscaler import Autoscaler, ScaleInController
 from azurewrap import Azure
 from custom_logger import main_logger
 from evaluators import SubmissionEvaluator
+from health_monitor import HealthMonitor, RunnerState
 from models import JudgeRequest, JudgeResult, MachineType
-from protocol.judge.commands import CheckCommand, StartCommand
+from protocol import judge_protocol_handler
+from protocol.judge import JudgeProtocol
+from protocol.judge.commands import StartCommand
 from protocol.judge_protocol_handler import (
     get_protocol_from_machine_name,
     is_machine_name_connected,
+    wait_for_connection,
 )
+from reconciler import STARTUP_CONNECT_TIMEOUT, Reconciler
+from scheduler import Scheduler, UnplaceableError
+from substitution import MACHINE_TYPE_SUBSTITUTES, Substitutor
 
 # Initialize the logger
 logger = main_logger.getChild("azureevaluator")
@@ -29,17 +40,65 @@ VMAPP_GALLERY = os.getenv("AZURE_VMAPP_GALLERY")
 VMAPP_NAME = os.getenv("AZURE_VMAPP_NAME")
 VMAPP_VERSION = os.getenv("AZURE_VMAPP_VERSION")
 
+# The time in seconds a new VM gets for its runner to connect, before it is considered a failed boot
+VM_CONNECT_TIMEOUT = float(os.getenv("VM_CONNECT_TIMEOUT", "600"))
+
+# The maximum amount of vms the benchmark instances of a single request are split over, 1 to never split requests
+FAN_OUT_MAX_SHARDS = int(os.getenv("FAN_OUT_MAX_SHARDS", "1"))
+
+# The minimum amount of benchmark instances in every part of a split request
+FAN_OUT_MIN_SHARD_SIZE = max(1, int(os.getenv("FAN_OUT_MIN_SHARD_SIZE", "1")))
+
+REQUESTS = metrics.counter("judgequeuer_requests_total", "The amount of judge requests evaluated, by their outcome: ok, error or exception", ("machine_type", "status"))
+REQUEST_DURATION = metrics.histogram("judgequeuer_request_seconds", "The time from submitting a judge request until its result",
+                                     ("machine_type",))
+EVALUATION_DURATION = metrics.histogram("judgequeuer_evaluation_seconds", "The time a runner takes to evaluate a judge request, or part of one",
+                                        ("machine_type",))
+VM_PROVISIONING_DURATION = metrics.histogram("judgequeuer_vm_provisioning_seconds", "The time Azure takes to add VMs to a VMSS", ("machine_type",))
+VM_BOOT_DURATION = metrics.histogram("judgequeuer_vm_boot_seconds", "The time from a new VM being listed until its runner connects",
+                                     ("machine_type",))
+VM_BOOT_FAILURES = metrics.counter("judgequeuer_vm_boot_failures_total", "The amount of new VMs of which the runner did not connect in time",
+                                   ("machine_type",))
+QUEUE_DEPTH = metrics.gauge("judgequeuer_queue_depth", "The amount of judge requests waiting to be placed on a VM", ("machine_type",))
+VMS = metrics.gauge("judgequeuer_vms", "The amount of VMs that are `available` for requests, `unavailable` or `pending`",
+                    ("machine_type", "state"))
+CPU_UTILIZATION = metrics.gauge("judgequeuer_cpu_utilization", "The fraction of the cpus of the VMs that is reserved for requests",
+                                ("machine_type",))
+MEMORY_UTILIZATION = metrics.gauge("judgequeuer_memory_utilization", "The fraction of the memory of the VMs that is reserved for requests",
+                                   ("machine_type",))
+
 class AzureEvaluator(SubmissionEvaluator):
     """
     An evaluator using Azure Virtual Machine Scale Set.
     """
     judgevmss_dict: dict['MachineType', 'JudgeVMSS']
     azure: Azure
+    scheduler: Scheduler
+    autoscaler: Autoscaler
+    scale_in_controller: ScaleInController
+    reconciler: Reconciler
+    health_monitor: HealthMonitor
+    creation_locks: dict[MachineType, asyncio.Lock]
+    """
+    Locks per machine type, making sure concurrent requests for a new machine type create its VMSS only once.
+    """
+    substitutor: Substitutor
     
-    def __init__(self, azure: Azure):
+    def __init__(self, azure: Azure, substitutes: dict[MachineType, list[MachineType]] = MACHINE_TYPE_SUBSTITUTES):
         super().__init__()
+        self.substitutor = Substitutor(self, substitutes)
         self.judgevmss_dict = {}
+        self.creation_locks = {}
         self.azure = azure
+        self.scheduler = Scheduler()
+        self.autoscaler = Autoscaler(self)
+        self.scale_in_controller = ScaleInController(self)
+        self.reconciler = Reconciler(self)
+        self.health_monitor = HealthMonitor()
+
+        # Wake up the autoscaler whenever a request has to wait for capacity
+        self.scheduler.set_pending_listener(self.autoscaler.notify)
+        self.health_monitor.set_state_listener(self.on_runner_state)
 
     async def initialize(self):
         """
@@ -51,48 +110,138 @@ class AzureEvaluator(SubmissionEvaluator):
             judgevmss_name = azure_vmss.name
             machine_type = MachineType(azure_vmss.sku.name, azure_vmss.sku.tier)
 
-            judge_vmss = JudgeVMSS(machine_type=machine_type, judgevmss_name=judgevmss_name, vmss=azure_vmss, azure=self.azure)
+            judge_vmss = JudgeVMSS(machine_type=machine_type, judgevmss_name=judgevmss_name, vmss=azure_vmss, azure=self.azure,
+                                   scheduler=self.scheduler, health_monitor=self.health_monitor)
 
             # Store VMSS in the cache dict
             self.judgevmss_dict[machine_type] = judge_vmss
 
-    async def submit(self, judge_request: JudgeRequest) -> JudgeResult:
+        metrics.add_collector(self.collect_metrics)
+
+        # Load the existing vms of all vmss's before accepting requests, so these are placed right away
+        await self.reconciler.preload(STARTUP_CONNECT_TIMEOUT)
+
+        # Start keeping the vms up to date, and adding and removing capacity in the background
+        judge_protocol_handler.add_load_listener(self.dispatch_all)
+        self.health_monitor.start()
+        self.reconciler.start(reconcile_now=False)
+        self.autoscaler.start()
+        if os.getenv("NO_DOWN_SIZING", "False") != "True":
+            self.scale_in_controller.start()
+
+    async def close(self):
+        judge_protocol_handler.remove_load_listener(self.dispatch_all)
+        metrics.remove_collector(self.collect_metrics)
+        for component in (self.health_monitor, self.reconciler, self.autoscaler, self.scale_in_controller):
+            component.stop()
+
+    def collect_metrics(self):
+        """
+        Update the gauges of the queue and the vms of every vmss, before the metrics are read.
+        """
+        for machine_type, judgevmss in list(self.judgevmss_dict.items()):
+            with judgevmss.lock:
+                judgevms = list(judgevmss.judgevm_dict.values())
+                available = len(judgevmss.available_vms())
+                QUEUE_DEPTH.labels(machine_type.name).set(self.scheduler.queue_depth(machine_type))
+
+                cpus = sum(judgevm.cpus for judgevm in judgevms)
+                memory = sum(judgevm.memory for judgevm in judgevms)
+                free_cpu = sum(judgevm.free_cpu for judgevm in judgevms)
+                free_memory = sum(judgevm.free_memory for judgevm in judgevms)
+
+            VMS.labels(machine_type.name, "available").set(available)
+            VMS.labels(machine_type.name, "unavailable").set(len(judgevms) - available)
+            VMS.labels(machine_type.name, "pending").set(judgevmss.pending_vms())
+            CPU_UTILIZATION.labels(machine_type.name).set(1 - free_cpu / cpus if cpus > 0 else 0)
+            MEMORY_UTILIZATION.labels(machine_type.name).set(1 - free_memory / memory if memory > 0 else 0)
+
+    def on_runner_state(self, machine_name: str, state: RunnerState):
+        """
+        Listener for state changes of runners in the health monitor.
+        """
+        if state == RunnerState.ALIVE:
+            # A recovered runner can take on pending requests again
+            self.dispatch_all()
+        elif state == RunnerState.DEAD:
+            # Let the reconciler replace the vm of the dead runner
+            self.reconciler.trigger()
+
+    def dispatch_all(self, machine_name: str = None):
+        """
+        Place the pending requests of every vmss on the vms that have room for them.
+        Also the listener for runners reporting a lower load, of which the freed container slots can take on pending requests.
+        """
+        for judgevmss in list(self.judgevmss_dict.values()):
+            with judgevmss.lock:
+                judgevmss.dispatch()
+
+    async def evaluate(self, judge_request: JudgeRequest) -> JudgeResult:
         """
         Handles finding, creating and deletion of vmss that is appropriate for this judgeRequest.
         """
         logger.info(f"Starting of submission for judge request {judge_request}")
 
-        # Get the right VMSS, or make one if needed
+        # Use a substitute machine type if it can take on the request right away while its own machine type cannot
         machine_type = judge_request.machine_type
-        if machine_type in self.judgevmss_dict:
-            judgevmss = self.judgevmss_dict[machine_type]
-        else:
-            judgevmss_name = "benchlab_judge_" + machine_type.name
+        substitute = self.substitutor.substitute(judge_request)
+        if substitute is not None:
+            judge_request = judge_request.substitute(substitute)
 
-            logger.info(f"Creating VMSS {judgevmss_name}")
+        # Get the right VMSS, or make one if needed
+        elif machine_type not in self.judgevmss_dict:
+            async with self.creation_locks.setdefault(machine_type, asyncio.Lock()):
+                if machine_type not in self.judgevmss_dict:
+                    await self.create_judgevmss(machine_type)
+
+        # Then forward call to that, recording requests that raise or are cancelled as well
+        start = time.monotonic()
+        status = "exception"
+        try:
+            judge_result = await self.judgevmss_dict[judge_request.machine_type].submit(judge_request)
 
-            await self.azure.create_vmss(judgevmss_name,
-                machine_type_name=machine_type.name,
-                machine_type_tier=machine_type.tier,
-                application_resource_group_name=VMAPP_RESOURCE_GROUP,
-                application_gallery=VMAPP_GALLERY,
-                application_definition=VMAPP_NAME,
-                application_version=VMAPP_VERSION,
-                nsg_name=NSG_NAME,
-                virtual_network_name=VNET_NAME,
-                virtual_network_subnet=VNET_SUBNET_NAME
-            )
+            # Record the machine type the request was evaluated on
+            judge_result.metadata["machine_type"] = judge_request.machine_type.name
+            if substitute is not None:
+                judge_result.metadata["substituted_for"] = machine_type.name
 
-            vmss = await self.azure.get_vmss(judgevmss_name)
+            status = "ok" if judge_result.result is not None else "error"
+            return judge_result
+        finally:
+            REQUEST_DURATION.labels(machine_type.name).observe(time.monotonic() - start)
+            REQUESTS.labels(machine_type.name, status).inc()
 
-            # Create JudgeVMSS and add it to the cache
-            judgevmss = JudgeVMSS(machine_type, judgevmss_name, vmss, self.azure)
-            self.judgevmss_dict[machine_type] = judgevmss
+    def cached_metadata(self, judge_request: JudgeRequest) -> dict:
+        """
+        Results of requests placed on a substitute are not cached, so cached results were evaluated on the requested machine type.
+        """
+        return {"machine_type": judge_request.machine_type.name}
 
-        # Then forward call to that.
-        judge_result = await judgevmss.submit(judge_request)
+    async def create_judgevmss(self, machine_type: MachineType):
+        """
+        Create the VMSS of the given machine type in Azure, and add it to the cache.
+        """
+        judgevmss_name = "benchlab_judge_" + machine_type.name
 
-        return judge_result
+        logger.info(f"Creating VMSS {judgevmss_name}")
+
+        await self.azure.create_vmss(judgevmss_name,
+            machine_type_name=machine_type.name,
+            machine_type_tier=machine_type.tier,
+            application_resource_group_name=VMAPP_RESOURCE_GROUP,
+            application_gallery=VMAPP_GALLERY,
+            application_definition=VMAPP_NAME,
+            application_version=VMAPP_VERSION,
+            nsg_name=NSG_NAME,
+            virtual_network_name=VNET_NAME,
+            virtual_network_subnet=VNET_SUBNET_NAME
+        )
+
+        vmss = await self.azure.get_vmss(judgevmss_name)
+
+        # Create JudgeVMSS and add it to the cache
+        judgevmss = JudgeVMSS(machine_type, judgevmss_name, vmss, self.azure, self.scheduler, self.health_monitor)
+        self.judgevmss_dict[machine_type] = judgevmss
 
 class JudgeVMSS:
     """
@@ -103,124 +252,291 @@ class JudgeVMSS:
     judgevm_dict: dict[str, 'JudgeVM']
     vmss: VirtualMachineScaleSet
     azure: Azure
+    scheduler: Scheduler
+    health_monitor: HealthMonitor
     lock: threading.Lock
+    """
+    The lock of the scheduler, guarding the judgevm_dict and the reservations on the vms.
+    """
+    provisioning: int
+    """
+    The amount of vms the autoscaler is currently adding to this vmss.
+    """
+    sku_size: tuple[int, int] | None
+    """
+    The amount of cpus and memory of a vm in this vmss, once loaded from the size catalog.
+    """
+    registrations: dict[str, asyncio.Task]
+    """
+    The registration tasks of new vms by name, which wait for the runner of the vm to connect.
+    """
+    deleting: set[str]
+    """
+    The names of the vms that are currently being deleted, these should not be added to the judgevm_dict again.
+    """
 
-    def __init__(self, machine_type: MachineType, judgevmss_name: str, vmss: VirtualMachineScaleSet , azure: Azure):
+    def __init__(self, machine_type: MachineType, judgevmss_name: str, vmss: VirtualMachineScaleSet , azure: Azure, scheduler: Scheduler,
+                 health_monitor: HealthMonitor):
         self.machine_type = machine_type
         self.judgevmss_name = judgevmss_name
         self.judgevm_dict = {}
         self.vmss = vmss
         self.azure = azure
-        self.lock = threading.Lock()
+        self.scheduler = scheduler
+        self.health_monitor = health_monitor
+        self.lock = scheduler.lock
+        self.provisioning = 0
+        self.sku_size = None
+        self.registrations = {}
+        self.deleting = set()
 
     async def submit(self, judge_request: JudgeRequest) -> JudgeResult:
         """
         Handle the request for this machine type vmss, an available vm will be found/created and assigned.
+        Large requests are split over several vms with free capacity, of which the results are merged.
         """
 
-        # TODO: remove lock, fix concurrency properly without reducing efficiency
         with self.lock:
-            # Get a right vm that is available
-            vm = await self.check_available_vm(judge_request.cpus, judge_request.memory)
+            shard_count = self.shard_count(judge_request)
 
-            # If no available vm then add capacity
-            if vm is None:
-                logger.info("No VM available, increasing capacity...")
-                # Get available vm after the added capacity, error if no available
-                await self.add_capacity()
+        if shard_count <= 1:
+            return await self.submit_shard(judge_request)
 
-                # TODO: if concurrency, this may give issues (between line above and below, other thread may have used new capacity, so it is no longer available)
-                vm = await self.check_available_vm(judge_request.cpus, judge_request.memory)
+        shards = judge_request.split(shard_count)
+        logger.info(f"Splitting judge request with {len(judge_request.benchmark_instances)} benchmark instances over {len(shards)} VMs")
+
+        judge_results = await asyncio.gather(*(self.submit_shard(shard) for shard in shards))
+        return JudgeResult.merge(judge_results)
+
+    def shard_count(self, judge_request: JudgeRequest) -> int:
+        """
+        Get the amount of parts to split the judge request into, one for every vm that can take it on right away.
+        Should be called while holding the lock.
+        """
+        max_shards = min(FAN_OUT_MAX_SHARDS, len(judge_request.benchmark_instances) // FAN_OUT_MIN_SHARD_SIZE)
+        if max_shards <= 1:
+            return 1
 
-                if vm is None:
-                    raise Exception("No vm available for judge request, even after adding capacity")
+        free_vms = sum(1 for judgevm in self.available_vms() if judgevm.check_capacity(judge_request.cpus, judge_request.memory))
+        return max(1, min(max_shards, free_vms))
 
+    async def submit_shard(self, judge_request: JudgeRequest) -> JudgeResult:
+        """
+        Submit a judge request, or part of one, to a single vm.
+        """
+
+        # Wait for the scheduler to place the request on a VM, which reserves its resources
+        try:
+            judgevm = await self.reserve_vm(judge_request)
+        except UnplaceableError as exception:
+            logger.error(f"Rejecting judge request {judge_request}: {exception}")
+            return JudgeResult.error("machine_type_too_small")
+        except TimeoutError:
+            logger.error(f"Judge request {judge_request} was not placed on a VM within {self.scheduler.placement_timeout}s")
+            return JudgeResult.error("placement_timeout")
+        judge_request.report_placement(judgevm.machine_name)
+
+        start = time.monotonic()
+        try:
             # Submit using the vm the judge request
-            judgevm = self.judgevm_dict[vm.name]
-            judge_result = await judgevm.submit(judge_request)
+            return await judgevm.submit(judge_request)
+        finally:
+            EVALUATION_DURATION.labels(self.machine_type.name).observe(time.monotonic() - start)
+            with self.lock:
+                # Give the reserved resources back to the VM, and place pending requests on the freed resources
+                judgevm.release(judge_request)
+                self.dispatch()
+
+    async def reserve_vm(self, judge_request: JudgeRequest) -> 'JudgeVM':
+        """
+        Queue the judge request and wait until the scheduler places it on a vm.
+        Raises a TimeoutError if it has not been placed within the placement timeout of the scheduler.
+        """
 
-            # Downsize capacity if low usage
-            if not judgevm.is_busy() and os.getenv("NO_DOWN_SIZING", "False") != "True":
-                logger.info(f"Deleting VM {vm.name} because it is idle")
-                # TODO make sure this doesnt give concurrency issues
-                await self.azure.delete_vm(vm.name, vmss_name=self.vmss.name, block=True)
+        # The judgevm_dict is kept up to date by the reconciler, so placement only needs the lock
+        with self.lock:
+            job = self.scheduler.enqueue(judge_request)
+            self.dispatch()
 
-            return judge_result
+        # If no available vm then let the autoscaler add capacity
+        if not job.is_placed():
+            logger.info("No VM available, waiting for capacity...")
+            self.scheduler.notify_pending(self.machine_type)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(job.future), self.scheduler.placement_timeout)
+        except BaseException:
+            with self.lock:
+                self.scheduler.cancel(job)
+            raise
 
-    async def add_capacity(self):
+    async def get_sku_size(self) -> tuple[int, int]:
         """
-        Increases capacity of vmss using Azure which could increase the amount of vmss.
+        Get the amount of cpus and memory of a vm in this vmss, from the size catalog shared by all vmss's.
         """
-        vmss = await self.azure.get_vmss(self.vmss.name)
-        # Increase capacity of vmss with 1 capacity
-        capacity = vmss.sku.capacity
-        await self.azure.set_capacity(capacity + 1, self.judgevmss_name)
-        
-        # Update judgevm_dict, vm(s) could have been added
-        await self.__update_vm_dict()
+        if self.sku_size is None:
+            self.sku_size = await self.azure.get_sku_size(self.machine_type.name, self.vmss.location)
+
+        return self.sku_size
 
-    async def check_available_vm(self, cpus: int, memory: int) -> VirtualMachineScaleSetVM | None:
+    def vm_size(self) -> tuple[int, int] | None:
         """
-        Goes through list of vms in this vmss and checks whether they have enough capacity to take on the resource allocation.
-        Returns a vm with enough capacity or None if there is none.
+        Get the amount of cpus and memory of a vm in this vmss, or None if it is not known yet.
+        The resources reported by a connected runner take precedence over the size of the sku.
         """
+        for judgevm in self.judgevm_dict.values():
+            return judgevm.cpus, judgevm.memory
 
-        # Update vm_dict, make sure the dict is up to date
-        await self.__update_vm_dict()
+        return self.sku_size
+
+    def max_containers(self) -> int | None:
+        """
+        Get the amount of containers a vm in this vmss can run at the same time, or None if its runners do not declare it.
+        """
+        for judgevm in self.judgevm_dict.values():
+            return judgevm.max_containers
 
-        # Get the azure vm class instance associated to the vm
-        for vm_name in self.judgevm_dict:
-            judgevm = self.judgevm_dict[vm_name]
-        
-            # Check if there is enough free resource capacity on this vm
-            if await judgevm.check_capacity(cpus, memory):
-                return judgevm.vm
-            
-        # No vm found
         return None
-    
-    async def __update_vm_dict(self):
+
+    def dispatch(self):
+        """
+        Place pending judge requests on the vms of this vmss. Should be called while holding the lock.
+        Requests that do not fit on a single vm are rejected, once the size of the vms is known.
+        """
+        vm_size = self.vm_size()
+        if vm_size is not None:
+            self.scheduler.reject_unplaceable(self.machine_type, *vm_size)
+
+        self.scheduler.dispatch(self.machine_type, self.available_vms())
+
+    def available_vms(self) -> list['JudgeVM']:
         """
-        Internal method to update the vm_dict,
-        checks whether vm is missing from dict and if vm is included when it has already been deleted
+        Get the vms requests can be placed on, of which the runner is known to be alive. Should be called while holding the lock.
+        """
+        return [judgevm for judgevm in self.judgevm_dict.values() if self.health_monitor.is_alive(judgevm.machine_name)]
+
+    def pending_vms(self) -> int:
+        """
+        Get the amount of vms that are being added to this vmss, but can not be used yet.
+        """
+        return self.provisioning + len(self.registrations)
+
+    async def add_capacity(self, count: int = 1):
+        """
+        Increases capacity of vmss using Azure with the given amount of vms, in a single capacity change.
+        """
+        start = time.monotonic()
+        await self.azure.add_capacity(count, self.judgevmss_name)
+        VM_PROVISIONING_DURATION.labels(self.machine_type.name).observe(time.monotonic() - start)
+        
+        # Update judgevm_dict, vm(s) have been added
+        await self.reconcile()
+
+    async def reconcile(self):
+        """
+        Update the vm_dict with the vms listed by Azure.
+        New vms are registered in the background once their runner connects, and vms that are gone are removed.
         """
         vms = await self.azure.list_vms(self.judgevmss_name)
 
         for vm in vms:
-            # Check if each vm has a judgevm class stored to it in dict
-            if vm.name not in self.judgevm_dict:
-                avm = await self.azure.get_vm(vm.name)
-                machine_name = avm.os_profile.computer_name
+            # Check if each vm has a judgevm class stored to it in dict, skipping vms that are being deleted
+            if vm.name in self.judgevm_dict or vm.name in self.registrations or vm.name in self.deleting:
+                continue
 
-                if not is_machine_name_connected(machine_name):
-                    logger.info(f"Waiting for VM {vm.name} with machine name {machine_name} to connect")
+            # Register the new vms concurrently, as each may have to wait for its runner to connect
+            self.registrations[vm.name] = asyncio.create_task(self.__register_vm(vm))
 
-                    # TODO: notification from judge protocol handler instead of polling
-                    while not is_machine_name_connected(machine_name):
-                        await asyncio.sleep(1)
-                        # TODO: implement timeout
-
-                cpus, memory = await self.azure.get_vm_size(vm.name)
-                
-                # Create and safe vm class
-                judgevm = JudgeVM(vm, machine_name, self.azure, cpus, memory)
-                self.judgevm_dict[vm.name] = judgevm
+        vm_names = set(vm.name for vm in vms)
+        with self.lock:
+            for key in list(self.judgevm_dict):
+                if key not in vm_names:
+                    logger.info(f"Removing VM {key} because it no longer exists")
+                    self.judgevm_dict.pop(key)
 
-        for key in list(self.judgevm_dict):
-            judgevm = self.judgevm_dict[key]
-            # Check if the vms in the dictionary are still alive
-            if not await judgevm.alive():
+        with self.lock:
+            # Remove the vms of which the runner is dead according to the health monitor
+            dead = [key for key, judgevm in self.judgevm_dict.items()
+                    if self.health_monitor.get_state(judgevm.machine_name) == RunnerState.DEAD]
+            for key in dead:
                 logger.info(f"Deleting VM {key} because it is no longer alive")
-                # Remove judgevm from dictionary
                 self.judgevm_dict.pop(key)
-                # Delete the VM
-                await self.azure.delete_vm(key, self.judgevmss_name, block=True)
+
+        if len(dead) > 0:
+            await self.delete_vms(dead)
+
+    def remove_machine(self, machine_name: str):
+        """
+        Remove the vm with the given machine name from the vm_dict, e.g. because its runner disconnected.
+        It is added again by the reconciler once its runner reconnects.
+        """
+        with self.lock:
+            for key, judgevm in list(self.judgevm_dict.items()):
+                if judgevm.machine_name == machine_name:
+                    logger.info(f"Removing VM {key} because its runner disconnected")
+                    self.judgevm_dict.pop(key)
+
+    async def __register_vm(self, vm: VirtualMachineScaleSetVM):
+        """
+        Internal method to add a vm to the vm_dict once its runner has connected.
+        If the runner does not connect in time, the vm is deleted so the autoscaler replaces it.
+        """
+        try:
+            # The listing of the vmss usually holds the machine name already, saving a call per vm
+            if vm.os_profile is not None and vm.os_profile.computer_name is not None:
+                machine_name = vm.os_profile.computer_name
+            else:
+                avm = await self.azure.get_vm(vm.name)
+                machine_name = avm.os_profile.computer_name
+
+            if not is_machine_name_connected(machine_name):
+                logger.info(f"Waiting for VM {vm.name} with machine name {machine_name} to connect")
+
+            start = time.monotonic()
+            try:
+                protocol = await wait_for_connection(machine_name, VM_CONNECT_TIMEOUT)
+            except TimeoutError:
+                logger.error(f"VM {vm.name} with machine name {machine_name} did not connect within {VM_CONNECT_TIMEOUT}s, replacing it")
+                VM_BOOT_FAILURES.labels(self.machine_type.name).inc()
+
+                await self.delete_vms([vm.name])
+                self.scheduler.notify_pending(self.machine_type)
+                return
+
+            VM_BOOT_DURATION.labels(self.machine_type.name).observe(time.monotonic() - start)
+            cpus, memory = await self.get_sku_size()
+
+            # The runner knows best what it can use for containers, e.g. when part of the vm is reserved for the runner itself
+            info = protocol.info
+            if info is not None:
+                cpus = info.cores if info.cores is not None else cpus
+                memory = info.memory if info.memory is not None else memory
+
+            # Create and safe vm class, and place pending requests on it
+            judgevm = JudgeVM(vm, machine_name, self.azure, cpus, memory, info.max_containers if info is not None else None, protocol)
+            with self.lock:
+                self.judgevm_dict.setdefault(vm.name, judgevm)
+                self.dispatch()
+        except Exception:
+            logger.error(f"An unexpected error has occured while registering VM {vm.name}", exc_info=1)
+        finally:
+            self.registrations.pop(vm.name, None)
+
+    async def delete_vms(self, vm_names: list[str]):
+        """
+        Delete the given vms from this vmss in a single operation. The vms should already be removed from the judgevm_dict.
+        """
+        self.deleting.update(vm_names)
+        try:
+            await self.azure.delete_vms(vm_names, self.judgevmss_name, block=True)
+        finally:
+            self.deleting.difference_update(vm_names)
 
     async def is_empty(self) -> bool:
         """
         Check if there are no vms part of this vmss
         """
-        await self.__update_vm_dict()
+        await self.reconcile()
         if len(self.judgevm_dict) > 0:
             # Not empty
             return False
@@ -242,70 +558,108 @@ class JudgeVM:
     vm: VirtualMachineScaleSetVM
     machine_name: str
     azure: Azure
+    cpus: int
+    memory: int
     free_cpu: int
     free_memory: int
-    tasks = []
+    max_containers: int | None
+    """
+    The amount of containers the runner can run at the same time, or None if it does not declare it.
+    """
+    protocol: JudgeProtocol | None
+    """
+    The connection to the runner, through which it reports its load.
+    """
+    tasks: list[JudgeRequest]
+    idle_since: float | None
+    """
+    The time since which this vm has no tasks, or None if it is busy.
+    """
 
-    def __init__(self, vm: VirtualMachineScaleSetVM, machine_name: str, azure: Azure, cpus: int, memory: int):
+    def __init__(self, vm: VirtualMachineScaleSetVM, machine_name: str, azure: Azure, cpus: int, memory: int,
+                 max_containers: int | None = None, protocol: JudgeProtocol | None = None):
         self.vm = vm
         self.machine_name = machine_name
         self.azure = azure
+        self.cpus = cpus
+        self.memory = memory
+        self.max_containers = max_containers
+        self.protocol = protocol
         self.free_cpu = cpus
         self.free_memory = memory
+        self.tasks = []
+        self.idle_since = time.monotonic()
 
-    async def check_capacity(self, cpus: int, memory: int) -> bool:
+    def check_capacity(self, cpus: int, memory: int) -> bool:
         """
         Check whether this vm has enough capacity to take on the resource allocation
         """
         # Check cpu, gpu and memory capacity of vm and return true if there is enough capacity
-        if self.free_cpu >= cpus and self.free_memory >= memory:
+        if self.free_cpu >= cpus and self.free_memory >= memory and self.free_slots() > 0:
             return True
 
         return False
 
-    async def submit(self, judge_request: JudgeRequest) -> JudgeResult:
-        # TODO: communicate the judge request to the VM and monitor status
-        logger.info(f"Submitting judge request {judge_request} to VM {self.vm.name} / {self.machine_name}")
-
-        protocol = get_protocol_from_machine_name(self.machine_name)
+    def free_slots(self) -> int | float:
+        """
+        Get the amount of containers this vm can still start, or infinity if its runner does not declare a maximum.
+        Containers the runner reports running beyond the tasks placed by this judge, e.g. from before a restart, take up slots as well.
+        """
+        if self.max_containers is None:
+            return math.inf
 
-        try:
-            self.tasks.append(judge_request)
+        load = self.protocol.load if self.protocol is not None else 0
+        return max(0, self.max_containers - len(self.tasks) - max(0, load - len(self.tasks)))
 
-            command = StartCommand()
-            protocol.send_command(command, True,
-                                  evaluation_settings=judge_request.evaluation_settings,
-                                  benchmark_instances=judge_request.benchmark_instances,
-                                  submission_url=judge_request.submission.source_url,
-                                  validator_url=judge_request.submission.validator_url)
+    def reserve(self, judge_request: JudgeRequest):
+        """
+        Reserve the resources of the judge request on this vm.
 
-            if command.success:
-                result = command.result
+        Should be called while holding the lock of the scheduler.
+        """
+        self.free_cpu -= judge_request.cpus
+        self.free_memory -= judge_request.memory
+        self.tasks.append(judge_request)
+        self.idle_since = None
 
-                return JudgeResult.success(result)
-            else:
-                cause = command.cause
+    def release(self, judge_request: JudgeRequest):
+        """
+        Free the resources reserved for the judge request on this vm.
 
-                return JudgeResult.error(cause)
-        finally:
-            self.tasks.remove(judge_request)
+        Should be called while holding the lock of the scheduler.
+        """
+        self.tasks.remove(judge_request)
+        self.free_cpu += judge_request.cpus
+        self.free_memory += judge_request.memory
 
-    def is_busy(self):
-        return len(self.tasks) > 0
+        if not self.is_busy():
+            self.idle_since = time.monotonic()
 
-    async def alive(self):
+    async def submit(self, judge_request: JudgeRequest) -> JudgeResult:
         """
-        Checks if the VM is still alive through a health check.
+        Submit the judge request to the runner on this vm, the resources should already be reserved.
         """
-        logger.info(f"Checking health of VM {self.vm.name}")
+        logger.info(f"Submitting judge request {judge_request} to VM {self.vm.name} / {self.machine_name}")
 
-        try:
-            protocol = get_protocol_from_machine_name(self.machine_name)
+        protocol = get_protocol_from_machine_name(self.machine_name)
 
-            protocol.send_command(CheckCommand(), True, timeout=3)
+        command = StartCommand()
+        await protocol.send_command(command,
+                                    progress_listener=judge_request.report_progress,
+                                    evaluation_settings=judge_request.evaluation_settings,
+                                    benchmark_instances=judge_request.benchmark_instances,
+                                    submission_url=judge_request.submission.source_url,
+                                    validator_url=judge_request.submission.validator_url)
 
-            logger.info(f"VM {self.vm.name} healthy")
-            return True
-        except Exception:
-            logger.error(f"JudgeVM {self.vm.name} is no longer alive", exc_info=1)
-            return False
+        if command.success:
+            result = command.result
+            judge_request.report_progress(result)
+
+            return JudgeResult.success(result)
+        else:
+            cause = command.cause
+
+            return JudgeResult.error(cause)
+
+    def is_busy(self):
+        return len(self.tasks) > 0
@@ -1,9 +1,89 @@
 import asyncio
+import contextlib
+import os
 import threading
+import time
+
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+
+import metrics
 
 from .base import Azure
 
 
+def parse_concurrency(value: str) -> dict[str, int]:
+    """
+    Parse the Azure concurrency setting, formatted as `read=32,scale=8`.
+    """
+    concurrency = {}
+    for entry in value.split(","):
+        if entry.strip() == "":
+            continue
+
+        operation_class, limit = entry.split("=", 1)
+        if operation_class.strip() not in ("read", "create", "scale", "delete"):
+            raise ValueError(f"Unknown class of Azure operations `{operation_class.strip()}`")
+
+        concurrency[operation_class.strip()] = int(limit)
+
+    return concurrency
+
+
+# The maximum amount of concurrent Azure calls per class of operations, `read`, `create`, `scale` or `delete`, e.g. `read=32,scale=8`
+AZURE_CONCURRENCY = {"read": 32, "create": 4, "scale": 8, "delete": 8, **parse_concurrency(os.getenv("AZURE_CONCURRENCY", ""))}
+
+# The maximum amount of connections to Azure, shared by all clients, 0 for no limit
+AZURE_CONNECTION_POOL_SIZE = int(os.getenv("AZURE_CONNECTION_POOL_SIZE", "100"))
+
+OPERATION_CLASSES = {
+    "list_skus": "read",
+    "list_vms": "read",
+    "get_vmss": "read",
+    "list_vmss": "read",
+    "get_vm": "read",
+    "get_vm_size": "read",
+    "get_sku_size": "read",
+    "create_vmss": "create",
+    "set_capacity": "scale",
+    "add_capacity": "scale",
+    "delete_vms": "delete",
+    "delete_vmss": "delete",
+}
+"""
+The class of every operation, the concurrency of each class is limited separately.
+"""
+
+AZURE_CALL_DURATION = metrics.histogram("judgequeuer_azure_call_seconds", "The duration of Azure calls", ("operation",))
+AZURE_CALL_ERRORS = metrics.counter("judgequeuer_azure_call_errors_total", "The amount of Azure calls that failed", ("operation",))
+AZURE_CALL_WAIT = metrics.histogram("judgequeuer_azure_call_wait_seconds",
+                                    "The time Azure calls wait for their VMSS and the concurrency limit of their class", ("operation",))
+AZURE_BATCHED_DELETIONS = metrics.counter("judgequeuer_azure_batched_deletions_total",
+                                          "The amount of VM deletions combined with an earlier deletion of the same VMSS")
+
+
+class DeleteBatch:
+    """
+    Deletions of VMs of a single VMSS that are performed as a single operation.
+    """
+
+    vm_names: list[str]
+    block: bool
+    future: asyncio.Future
+    """
+    Resolved once the VMs have been deleted, on the Azure thread.
+    """
+    task: asyncio.Task | None = None
+    """
+    The task performing the deletion.
+    """
+
+    def __init__(self, block: bool, future: asyncio.Future):
+        self.vm_names = []
+        self.block = block
+        self.future = future
+
+
 class AsyncAzure(Azure):
     """
     An asynchronous wrapper for the Azure class.
@@ -13,73 +93,192 @@ class AsyncAzure(Azure):
 
     Each function in this class, including initializers, has the exact same signature as its original.
 
+    Calls run concurrently on the Azure thread, up to the limit of their class of operations, and share a single connection pool.
+    Modifying calls of the same VMSS are performed one at a time, as Azure rejects operations on a VMSS that is being modified,
+    while those of different VMSS's run in parallel. Deletions of a VMSS that wait for its previous operation are combined.
+
     Note that some functions are excluded, as they do not call Azure functions directly,
     instead relying on other functions in the Azure wrapper.
     """
-    
+
     thread: threading.Thread
     """
     The Azure thread on which each Azure call is performed
     """
-    
+
     loop: asyncio.AbstractEventLoop
     """
     The event loop on which every Azure action is executed.
     """
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
 
+    session: aiohttp.ClientSession
+    """
+    The HTTP session holding the connection pool shared by all clients.
+    """
+
+    limits: dict[str, asyncio.Semaphore]
+    """
+    The concurrency limits by class of operations, only used on the Azure thread.
+    """
+
+    vmss_locks: dict[str, asyncio.Lock]
+    """
+    The locks by VMSS name, held during modifying calls of the VMSS. Only used on the Azure thread.
+    """
+
+    delete_batches: dict[str, DeleteBatch]
+    """
+    The deletions by VMSS name that wait for the previous operation of their VMSS, to which new deletions are added.
+    Only used on the Azure thread.
+    """
+
+    def __init__(self, *args, **kwargs):
         # Create an event loop for the Azure thread
         self.loop = asyncio.new_event_loop()
-        
+
         # Entrypoint for the thread
         def run_event_loop(loop):
             asyncio.set_event_loop(loop)
             loop.run_forever()
-        
+
         # Create & start the thread
         self.thread = threading.Thread(target=run_event_loop, args=(self.loop,), daemon=True)
         self.thread.start()
 
-    def __run(self, coro):
+        self.limits = {operation_class: asyncio.Semaphore(limit) for operation_class, limit in AZURE_CONCURRENCY.items()}
+        self.vmss_locks = {}
+        self.delete_batches = {}
+
+        # The session is bound to the event loop it is created on, so it is created on the Azure thread
+        self.session = asyncio.run_coroutine_threadsafe(self.__create_session(), self.loop).result()
+        super().__init__(*args, transport=AioHttpTransport(session=self.session, session_owner=False), **kwargs)
+
+    async def __create_session(self) -> aiohttp.ClientSession:
+        # Same settings as the sessions the Azure SDK creates itself, apart from the size of the connection pool
+        connector = aiohttp.TCPConnector(limit=AZURE_CONNECTION_POOL_SIZE)
+        return aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar(), auto_decompress=False, trust_env=True)
+
+    def __run(self, coro, operation: str = None, vmss_name: str = None, limited: bool = True):
+        """
+        Utility method to run the given coroutine on the Azure thread, recording its duration by the name of the operation.
+
+        If limited, the call waits for the concurrency limit of its operation, and for other modifying calls of the given VMSS, if any.
+        Calls made by other calls on the Azure thread are part of an operation that is already limited, so these do not wait.
+        """
+        operation = operation or coro.__name__
+        start = time.monotonic()
+
+        def record(future: asyncio.Future):
+            AZURE_CALL_DURATION.labels(operation).observe(time.monotonic() - start)
+            if future.cancelled() or future.exception() is not None:
+                AZURE_CALL_ERRORS.labels(operation).inc()
+
+        if limited and threading.current_thread() is not self.thread:
+            coro = self.__limited(coro, operation, vmss_name)
+
+        future = asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+        future.add_done_callback(record)
+        return future
+
+    @contextlib.asynccontextmanager
+    async def __limit(self, operation: str, vmss_name: str = None):
         """
-        Utility method to run the given coroutine on the Azure thread.
+        Wait for the given VMSS to be free, if any, and then for the concurrency limit of the operation.
         """
-        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
-    
+        start = time.monotonic()
+        async with contextlib.AsyncExitStack() as stack:
+            if vmss_name is not None:
+                await stack.enter_async_context(self.vmss_locks.setdefault(vmss_name, asyncio.Lock()))
+
+            operation_class = OPERATION_CLASSES.get(operation)
+            if operation_class is not None:
+                await stack.enter_async_context(self.limits[operation_class])
+
+            AZURE_CALL_WAIT.labels(operation).observe(time.monotonic() - start)
+            yield
+
+    async def __limited(self, coro, operation: str, vmss_name: str = None):
+        try:
+            async with self.__limit(operation, vmss_name):
+                return await coro
+        finally:
+            # Close the coroutine if the call was cancelled before it started
+            coro.close()
+
+    async def __delete_vms(self, vm_names: list[str], vmss_name, block: bool):
+        """
+        Add the VMs to the deletion of the VMSS that waits for its previous operation, or start a new deletion,
+        and wait until it has been performed.
+        """
+        batch = self.delete_batches.get(vmss_name)
+        if batch is None:
+            batch = DeleteBatch(block, self.loop.create_future())
+            self.delete_batches[vmss_name] = batch
+            batch.task = self.loop.create_task(self.__perform_deletion(vmss_name, batch))
+        else:
+            batch.block = batch.block or block
+            AZURE_BATCHED_DELETIONS.inc(len(vm_names))
+
+        batch.vm_names.extend(vm_names)
+        return await asyncio.shield(batch.future)
+
+    async def __perform_deletion(self, vmss_name, batch: DeleteBatch):
+        try:
+            async with self.__limit("delete_vms", vmss_name):
+                # Deletions of the VMSS from now on are performed in a next operation
+                self.delete_batches.pop(vmss_name, None)
+                batch.future.set_result(await super().delete_vms(batch.vm_names, vmss_name, batch.block))
+        except asyncio.CancelledError:
+            batch.future.cancel()
+            raise
+        except Exception as exception:
+            batch.future.set_exception(exception)
+            # The exception is passed on to the callers, retrieve it so it is not reported if they were all cancelled
+            batch.future.exception()
+
     def list_skus(self, *args, **kwargs):
         return self.__run(super().list_skus(*args, **kwargs))
 
     def list_vms(self, *args, **kwargs):
         return self.__run(super().list_vms(*args, **kwargs))
 
-    def delete_vmss(self, *args, **kwargs):
-        return self.__run(super().delete_vmss(*args, **kwargs))
+    def delete_vmss(self, vmss_name):
+        return self.__run(super().delete_vmss(vmss_name), vmss_name=vmss_name)
 
     def get_vmss(self, *args, **kwargs):
         return self.__run(super().get_vmss(*args, **kwargs))
 
     def list_vmss(self, *args, **kwargs):
         return self.__run(super().list_vmss(*args, **kwargs))
-    
+
     def get_vm(self, *args, **kwargs):
         return self.__run(super().get_vm(*args, **kwargs))
-    
+
     def get_vm_size(self, *args, **kwargs):
         return self.__run(super().get_vm_size(*args, **kwargs))
 
-    def create_vmss(self, *args, **kwargs):
-        return self.__run(super().create_vmss(*args, **kwargs))
+    def get_sku_size(self, *args, **kwargs):
+        return self.__run(super().get_sku_size(*args, **kwargs))
+
+    def create_vmss(self, vmss_name, *args, **kwargs):
+        return self.__run(super().create_vmss(vmss_name, *args, **kwargs), vmss_name=vmss_name)
 
-    def set_capacity(self, *args, **kwargs):
-        return self.__run(super().set_capacity(*args, **kwargs))
+    def set_capacity(self, capacity: int, vmss_name):
+        return self.__run(super().set_capacity(capacity, vmss_name), vmss_name=vmss_name)
+
+    def add_capacity(self, count: int, vmss_name):
+        # The capacity is read and updated while holding the VMSS, so a deletion in between is not undone
+        return self.__run(super().add_capacity(count, vmss_name), vmss_name=vmss_name)
+
+    def delete_vms(self, vm_names: list[str], vmss_name, block: bool = True):
+        if threading.current_thread() is self.thread:
+            return self.__run(super().delete_vms(vm_names, vmss_name, block))
+
+        # The deletion waits for its VMSS and the concurrency limit itself, so deletions arriving meanwhile can be combined with it
+        return self.__run(self.__delete_vms(list(vm_names), vmss_name, block), "delete_vms", limited=False)
 
-    def delete_vm(self, *args, **kwargs):
-        return self.__run(super().delete_vm(*args, **kwargs))
-    
     async def close(self, *args, **kwargs):
         await self.__run(super().close(*args, **kwargs))
+        await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self.session.close(), self.loop))
         self.loop.call_soon_threadsafe(self.loop.stop)
         self.thread.join()
-
@@ -1,8 +1,10 @@
+import asyncio
 import json
 import os
 from typing import List
 
 from azure.core.credentials_async import AsyncTokenCredential
+from azure.core.pipeline.transport import AsyncHttpTransport
 from azure.core.polling import AsyncLROPoller
 from azure.identity.aio import DefaultAzureCredential
 from azure.mgmt.compute.aio import ComputeManagementClient
@@ -15,6 +17,8 @@ from azure.mgmt.compute.models import (
 from azure.mgmt.network.aio import NetworkManagementClient
 from azure.mgmt.resource.resources.aio import ResourceManagementClient
 
+from .catalog import VMSizeCatalog
+
 DEFAULT_LOCATION = os.getenv("AZURE_LOCATION")
 
 
@@ -30,16 +34,24 @@ class Azure:
     resource_group_name: str
     subscription_id: str
 
-    def __init__(self, subscription_id: str, resource_group_name: str):
+    size_catalog: VMSizeCatalog
+    size_catalog_locks: dict[str, asyncio.Lock]
+
+    def __init__(self, subscription_id: str, resource_group_name: str, transport: AsyncHttpTransport | None = None):
         self.credentials = DefaultAzureCredential()
 
-        self.compute_client = ComputeManagementClient(self.credentials, subscription_id)
-        self.network_client = NetworkManagementClient(self.credentials, subscription_id)
-        self.resource_client = ResourceManagementClient(self.credentials, subscription_id)
+        # The clients share the given transport, and with it its connection pool
+        client_kwargs = {} if transport is None else {"transport": transport}
+        self.compute_client = ComputeManagementClient(self.credentials, subscription_id, **client_kwargs)
+        self.network_client = NetworkManagementClient(self.credentials, subscription_id, **client_kwargs)
+        self.resource_client = ResourceManagementClient(self.credentials, subscription_id, **client_kwargs)
 
         self.subscription_id = subscription_id
         self.resource_group_name = resource_group_name
 
+        self.size_catalog = VMSizeCatalog()
+        self.size_catalog_locks = {}
+
     async def list_skus(self, resource_type, location=DEFAULT_LOCATION):
         """
         List all SKUs of the given resource type (e.g. 'disks' or 'virtualMachines').
@@ -118,22 +130,39 @@ class Azure:
         """
         return await self.compute_client.virtual_machines.get(self.resource_group_name, name)
 
-    async def get_vm_size(self, vm_name: str):
+    async def get_vm_size(self, vm_name: str) -> tuple[int, int]:
+        """
+        Gets the amount of cores and memory (in MB) of the VM with the given name.
+        """
         # Get the VM details
         vm = await self.compute_client.virtual_machines.get(self.resource_group_name, vm_name)
 
         # Get the VM size (hardware profile)
         vm_size = vm.hardware_profile.vm_size
 
-        # Use the vm_size to get the VM size details
-        vm_sizes = self.compute_client.virtual_machine_sizes.list(location=vm.location)
-        async for size in vm_sizes:
-            if size.name == vm_size:
-                cpu_cores = size.number_of_cores
-                memory_in_mb = size.memory_in_mb
-                return cpu_cores, memory_in_mb
-        
-        raise ValueError("VM Size not found")
+        return await self.get_sku_size(vm_size, vm.location)
+
+    async def get_sku_size(self, sku_name: str, location=DEFAULT_LOCATION) -> tuple[int, int]:
+        """
+        Gets the amount of cores and memory (in MB) of a VM of the given SKU.
+
+        The sizes of a location are listed once and kept in the size catalog.
+        """
+        # Make sure only one listing is done per location at a time
+        lock = self.size_catalog_locks.setdefault(location, asyncio.Lock())
+        async with lock:
+            if not self.size_catalog.is_fresh(location):
+                sizes = {}
+                async for size in self.compute_client.virtual_machine_sizes.list(location=location):
+                    sizes[size.name] = (size.number_of_cores, size.memory_in_mb)
+
+                self.size_catalog.put(location, sizes)
+
+        size = self.size_catalog.get(location, sku_name)
+        if size is None:
+            raise ValueError("VM Size not found")
+
+        return size
 
     #
     # Modification functions
@@ -234,13 +263,33 @@ class Azure:
         )
         await poller.wait()
 
+    async def add_capacity(self, count: int, vmss_name):
+        """
+        Adds the given amount of instances to the Virtual Machine Scale Set, based on its current capacity.
+        """
+        vmss = await self.get_vmss(vmss_name)
+        vmss.sku.capacity += count
+
+        poller: AsyncLROPoller = await self.compute_client.virtual_machine_scale_sets.begin_update(
+            self.resource_group_name, vmss_name, vmss
+        )
+        await poller.wait()
+
     async def delete_vm(self, vm_name: str, vmss_name, block: bool = True):
         """
         Deletes a specific VM from the set.
 
         Also updates the capacity accordingly.
         """
-        ids = VirtualMachineScaleSetVMInstanceIDs(instance_ids=[vm_name])
+        await self.delete_vms([vm_name], vmss_name, block)
+
+    async def delete_vms(self, vm_names: list[str], vmss_name, block: bool = True):
+        """
+        Deletes the given VMs from the set, in a single operation.
+
+        Also updates the capacity accordingly.
+        """
+        ids = VirtualMachineScaleSetVMInstanceIDs(instance_ids=vm_names)
         poller = await self.compute_client.virtual_machine_scale_sets.begin_delete_instances(
             self.resource_group_name, vmss_name, ids
         )
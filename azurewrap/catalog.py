@@ -0,0 +1,85 @@
+import json
+import os
+import time
+
+from custom_logger import main_logger
+
+logger = main_logger.getChild("azurewrap.catalog")
+
+# The file in which the catalog is persisted, or empty to only keep it in memory
+SIZE_CATALOG_PATH = os.getenv("AZURE_SIZE_CATALOG_PATH", "")
+
+# The time in seconds after which the sizes of a location are loaded again
+SIZE_CATALOG_TTL = float(os.getenv("AZURE_SIZE_CATALOG_TTL", "86400"))
+
+
+class VMSizeCatalog:
+    """
+    A catalog of VM sizes per location, mapping each SKU name to its amount of cores and memory (in MB).
+
+    The sizes only depend on the SKU, so they are loaded once per location and shared by all VMSS's.
+    """
+
+    path: str
+    ttl: float
+    locations: dict[str, dict]
+    """
+    Per location, the time at which its sizes were loaded (`loaded_at`) and the sizes themselves (`sizes`).
+    """
+
+    def __init__(self, path: str = SIZE_CATALOG_PATH, ttl: float = SIZE_CATALOG_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.locations = {}
+
+        if self.path != "" and os.path.exists(self.path):
+            self.load()
+
+    def is_fresh(self, location: str) -> bool:
+        """
+        Check whether the sizes of the given location are loaded and not expired.
+        """
+        entry = self.locations.get(location)
+        return entry is not None and time.time() - entry["loaded_at"] < self.ttl
+
+    def get(self, location: str, sku_name: str) -> tuple[int, int] | None:
+        """
+        Get the amount of cores and memory of the given SKU, or None if it is unknown.
+        """
+        entry = self.locations.get(location)
+        if entry is None or sku_name not in entry["sizes"]:
+            return None
+
+        cores, memory = entry["sizes"][sku_name]
+        return cores, memory
+
+    def put(self, location: str, sizes: dict[str, tuple[int, int]]):
+        """
+        Store all sizes of the given location, persisting the catalog if a path is set.
+        """
+        self.locations[location] = {"loaded_at": time.time(), "sizes": sizes}
+
+        if self.path != "":
+            self.save()
+
+    def load(self):
+        """
+        Load the catalog from disk, ignoring a corrupt file.
+        """
+        try:
+            with open(self.path, "r") as catalog_file:
+                self.locations = json.load(catalog_file)
+        except (OSError, ValueError):
+            logger.error(f"Could not load the VM size catalog from {self.path}", exc_info=1)
+
+    def save(self):
+        """
+        Save the catalog to disk, replacing the file atomically.
+        """
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w") as catalog_file:
+                json.dump(self.locations, catalog_file)
+            os.replace(temp_path, self.path)
+        except OSError:
+            logger.error(f"Could not save the VM size catalog to {self.path}", exc_info=1)
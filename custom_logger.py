@@ -2,8 +2,11 @@
 The main logger to be used by the program.
 """
 
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 
 main_logger: logging.Logger = logging.getLogger("runner")
 
@@ -27,7 +30,19 @@ def setup():
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter_c)
-    main_logger.addHandler(console_handler)
+
+    # Records are put on a queue and written to the console by a separate thread,
+    # so a slow console does not block the event loop
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setLevel(logging.INFO)
+    main_logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, console_handler, respect_handler_level=True)
+    listener.start()
+
+    # Write the remaining records before exiting
+    atexit.register(listener.stop)
 
 
 setup()
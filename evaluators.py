@@ -1,6 +1,12 @@
-from abc import ABC
+from abc import ABC, abstractmethod
 
+from custom_logger import main_logger
 from models import JudgeRequest, JudgeResult
+from result_cache import ResultCache, is_cacheable
+from single_flight import SingleFlight
+
+# Initialize the logger
+logger = main_logger.getChild("evaluators")
 
 instance = None
 """
@@ -17,17 +23,60 @@ def get_instance() -> 'SubmissionEvaluator':
 
 
 class SubmissionEvaluator(ABC):
+    result_cache: ResultCache
+    single_flight: SingleFlight
+
     def __init__(self):
         # Update the global instance variable with this instance
         global instance
         instance = self
 
+        self.result_cache = ResultCache()
+        self.single_flight = SingleFlight(self.result_cache.granularity)
+
     """
     An object capable of performing judge requests by evaluating submissions.
     """
     async def submit(self, judge_request: JudgeRequest) -> JudgeResult:
         """
-        Submits a judge request to be evaluated.
+        Submits a judge request to be evaluated. Results that are already known are taken from the result cache,
+        and evaluations that are in flight are shared with identical requests.
+        """
+        # Requests that opted out do not share results with other requests
+        if not is_cacheable(judge_request):
+            return await self.evaluate(judge_request)
+
+        cached, missing = self.result_cache.lookup(judge_request)
+        judge_request.report_progress(cached)
+        if missing is None:
+            logger.info("Found the result of the judge request in the result cache")
+            judge_result = JudgeResult.success(cached)
+            judge_result.metadata = self.cached_metadata(judge_request)
+            return judge_result
+
+        judge_result = await self.single_flight.run(missing, self.evaluate_and_cache)
+
+        return JudgeResult.merge([JudgeResult.success(cached), judge_result])
+
+    async def evaluate_and_cache(self, judge_request: JudgeRequest) -> JudgeResult:
+        """
+        Evaluates a judge request, storing its result in the result cache.
+        """
+        judge_result = await self.evaluate(judge_request)
+        self.result_cache.store_result(judge_request, judge_result)
+
+        return judge_result
+
+    def cached_metadata(self, judge_request: JudgeRequest) -> dict:
+        """
+        Get the metadata of a result taken from the result cache, of which the judge request was evaluated as requested.
+        """
+        return {}
+
+    @abstractmethod
+    async def evaluate(self, judge_request: JudgeRequest) -> JudgeResult:
+        """
+        Evaluates a judge request.
         """
         raise NotImplementedError()
 
@@ -36,3 +85,9 @@ class SubmissionEvaluator(ABC):
         Initialize the evaluator.
         """
         pass
+
+    async def close(self):
+        """
+        Stop the background work of the evaluator and remove its listeners, e.g. before exiting.
+        """
+        pass
@@ -0,0 +1,190 @@
+"""
+This module contains the HealthMonitor class, which keeps a liveness table of the connected runners.
+"""
+
+import asyncio
+import os
+import time
+from enum import Enum
+from typing import Callable
+
+from custom_logger import main_logger
+from protocol import judge_protocol_handler
+from protocol.judge import JudgeProtocol
+from protocol.judge.commands import CheckCommand
+
+# Initialize the logger
+logger = main_logger.getChild("health_monitor")
+
+# The time in seconds between two health checks of every runner
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "10"))
+
+# The time in seconds a runner gets to answer a health check
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "3"))
+
+# The amount of failed health checks in a row after which a runner is suspect, and no longer gets new requests
+HEALTH_SUSPECT_THRESHOLD = int(os.getenv("HEALTH_SUSPECT_THRESHOLD", "1"))
+
+# The amount of failed health checks in a row after which a runner is dead, and its VM is deleted
+HEALTH_DEAD_THRESHOLD = int(os.getenv("HEALTH_DEAD_THRESHOLD", "3"))
+
+
+class RunnerState(Enum):
+    """
+    The liveness state of a runner.
+    """
+    ALIVE = 1
+    SUSPECT = 2
+    DEAD = 3
+
+
+class Liveness:
+    """
+    An entry of the liveness table.
+    """
+    machine_name: str
+    state: RunnerState
+    last_seen: float
+    """
+    The (monotonic) time of the last successful health check, or the time of connection.
+    """
+    rtt: float | None
+    """
+    The round-trip time in seconds of the last successful health check.
+    """
+    failures: int
+    """
+    The amount of failed health checks in a row.
+    """
+
+    def __init__(self, machine_name: str):
+        self.machine_name = machine_name
+        self.state = RunnerState.ALIVE
+        self.last_seen = time.monotonic()
+        self.rtt = None
+        self.failures = 0
+
+
+class HealthMonitor:
+    """
+    Health checks every connected runner on a schedule, with all checks running concurrently.
+
+    Other components read the liveness from the table, instead of probing runners on the request path.
+    """
+
+    table: dict[str, Liveness]
+    interval: float
+    timeout: float
+    loop: asyncio.AbstractEventLoop = None
+    task: asyncio.Task = None
+    state_listener: Callable[[str, RunnerState], None] = None
+
+    def __init__(self, interval: float = HEALTH_CHECK_INTERVAL, timeout: float = HEALTH_CHECK_TIMEOUT):
+        self.table = {}
+        self.interval = interval
+        self.timeout = timeout
+
+    def set_state_listener(self, state_listener: Callable[[str, RunnerState], None]):
+        """
+        Set the listener that is called on the event loop of the monitor when the state of a runner changes.
+        """
+        if self.state_listener is not None:
+            raise ValueError("State listener is already set!")
+
+        self.state_listener = state_listener
+
+    def start(self):
+        """
+        Start the health monitor on the running event loop.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.task = self.loop.create_task(self.run())
+
+        judge_protocol_handler.add_connection_listener(self.on_connection)
+
+    def stop(self):
+        """
+        Stop health checking the runners, and stop listening for their connections.
+        """
+        judge_protocol_handler.remove_connection_listener(self.on_connection)
+        if self.task is not None:
+            self.task.cancel()
+
+    def on_connection(self, machine_name: str, connected: bool):
+        """
+        Listener for runner connection events, called on the event loop of the judge protocol handler.
+        """
+        self.loop.call_soon_threadsafe(self.handle_connection, machine_name, connected)
+
+    def handle_connection(self, machine_name: str, connected: bool):
+        if connected:
+            self.table[machine_name] = Liveness(machine_name)
+        else:
+            self.table.pop(machine_name, None)
+
+    def get_state(self, machine_name: str) -> RunnerState:
+        """
+        Get the state of the runner with the given machine name. Runners that have not been checked yet are alive.
+        """
+        liveness = self.table.get(machine_name)
+        return RunnerState.ALIVE if liveness is None else liveness.state
+
+    def is_alive(self, machine_name: str) -> bool:
+        return self.get_state(machine_name) == RunnerState.ALIVE
+
+    async def run(self):
+        """
+        The main loop of the health monitor.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+
+            with judge_protocol_handler.protocol_dict_lock:
+                protocols = dict(judge_protocol_handler.protocol_dict)
+
+            await asyncio.gather(*(self.check(machine_name, protocol) for machine_name, protocol in protocols.items()))
+
+    async def check(self, machine_name: str, protocol: JudgeProtocol):
+        """
+        Health check a single runner and update its entry in the liveness table.
+        """
+        command = CheckCommand()
+        start = time.monotonic()
+        try:
+            await protocol.send_command(command, self.timeout)
+        except Exception:
+            logger.error(f"Health check of runner {machine_name} failed", exc_info=1)
+
+        # Runners that disconnected in the meantime are no longer part of the table
+        if protocol.closed:
+            return
+
+        if command.load is not None:
+            judge_protocol_handler.update_load(machine_name, protocol, command.load)
+
+        self.record(machine_name, command.healthy, time.monotonic() - start)
+
+    def record(self, machine_name: str, healthy: bool, rtt: float):
+        """
+        Record the outcome of a health check, updating the state of the runner.
+        """
+        liveness = self.table.setdefault(machine_name, Liveness(machine_name))
+        previous_state = liveness.state
+
+        if healthy:
+            liveness.last_seen = time.monotonic()
+            liveness.rtt = rtt
+            liveness.failures = 0
+            liveness.state = RunnerState.ALIVE
+        else:
+            liveness.failures += 1
+            if liveness.failures >= HEALTH_DEAD_THRESHOLD:
+                liveness.state = RunnerState.DEAD
+            elif liveness.failures >= HEALTH_SUSPECT_THRESHOLD:
+                liveness.state = RunnerState.SUSPECT
+
+        if liveness.state != previous_state:
+            logger.info(f"Runner {machine_name} is now {liveness.state.name.lower()} (last seen {time.monotonic() - liveness.last_seen:.1f}s ago)")
+
+            if self.state_listener is not None:
+                self.state_listener(machine_name, liveness.state)
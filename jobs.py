@@ -0,0 +1,267 @@
+"""
+This module contains the JobManager class, which runs judge requests as jobs in the background,
+so the website gets a job id right away and receives the results as they become known.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from enum import Enum
+from typing import Callable
+
+import evaluators
+from custom_logger import main_logger
+from journal import JOB_JOURNAL_PATH, JobJournal
+from models import JudgeRequest, JudgeResult
+
+# Initialize the logger
+logger = main_logger.getChild("jobs")
+
+# The time in seconds a finished job is kept, so a reconnected website can still collect its outcome
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+
+
+class JobStatus(Enum):
+    """
+    The status of a job.
+    """
+    RUNNING = 1
+    DONE = 2
+    FAILED = 3
+
+
+class Job:
+    """
+    A judge request that is being evaluated in the background.
+    """
+    job_id: str
+    judge_request: JudgeRequest
+    status: JobStatus
+    results: dict
+    """
+    The results per benchmark instance that are known so far.
+    """
+    cause: str | None
+    placements: dict[str, str]
+    """
+    The machine name of the runner each benchmark instance was last placed on.
+    """
+    events: list[dict]
+    """
+    All events of the job in order, numbered by their sequence, so they can be collected again.
+    """
+    finished_at: float | None
+    task: asyncio.Task
+
+    def __init__(self, judge_request: JudgeRequest, job_id: str = None):
+        self.job_id = uuid.uuid4().hex if job_id is None else job_id
+        self.judge_request = judge_request
+        self.status = JobStatus.RUNNING
+        self.results = {}
+        self.cause = None
+        self.placements = {}
+        self.events = []
+        self.finished_at = None
+
+    def events_since(self, sequence: int) -> list[dict]:
+        """
+        Get the events after the one with the given sequence number.
+        """
+        return self.events[sequence:]
+
+
+class JobManager:
+    """
+    Keeps track of the jobs, and passes their events to the listeners as they happen.
+
+    A `JOB_PROGRESS` event carries the results of benchmark instances that have just finished,
+    and a final `JOB_DONE` event the status of the job.
+    """
+
+    jobs: dict[str, Job]
+    event_listeners: list[Callable[[dict], None]]
+    journal: JobJournal | None = None
+
+    def __init__(self):
+        self.jobs = {}
+        self.event_listeners = []
+
+    def add_event_listener(self, event_listener: Callable[[dict], None]):
+        """
+        Add a listener that is called with every event of every job.
+        """
+        self.event_listeners.append(event_listener)
+
+    def submit(self, judge_request: JudgeRequest) -> Job:
+        """
+        Start evaluating the judge request as a job on the running event loop.
+        """
+        self.prune()
+
+        job = Job(judge_request)
+        self.jobs[job.job_id] = job
+        self.append(job, "submitted", {"request": judge_request.to_dict()})
+
+        self.start(job, judge_request)
+
+        logger.info(f"Started job {job.job_id} with {len(judge_request.benchmark_instances)} benchmark instances")
+        return job
+
+    def start(self, job: Job, judge_request: JudgeRequest):
+        """
+        Start evaluating the given judge request, which is the request of the job or a part of it.
+        """
+        job.judge_request.set_progress_listener(lambda results: self.progress(job, results))
+        job.judge_request.set_placement_listener(lambda machine_name, benchmark_instances: self.append(
+            job, "placed", {"machine_name": machine_name, "instances": list(benchmark_instances)}))
+
+        job.task = asyncio.get_running_loop().create_task(self.run(job, judge_request))
+
+    def restore(self, path: str = JOB_JOURNAL_PATH):
+        """
+        Open the job journal, restoring the jobs from before a restart and resuming the ones that had not finished.
+        Should be called on the event loop, once the evaluator is initialized.
+        """
+        if path == "":
+            return
+
+        self.journal = JobJournal(path)
+        self.journal.compact(JOB_RETENTION)
+
+        resumed = 0
+        for job_id, records in self.journal.replay().items():
+            job = self.restore_job(job_id, records)
+            if job is None:
+                continue
+
+            self.jobs[job_id] = job
+            if job.finished_at is not None:
+                continue
+
+            # Only evaluate the benchmark instances of which the result is not known yet
+            remaining = {instance_id: url for instance_id, url in job.judge_request.benchmark_instances.items() if instance_id not in job.results}
+            if len(remaining) == 0:
+                self.finish(job, JudgeResult.success({}))
+                continue
+
+            judge_request = job.judge_request.subset(remaining)
+
+            # The runners cannot hand over work started before the restart, so the remaining instances are evaluated again.
+            # The runner most of them were placed on is preferred, as it already fetched the submission. It is only used
+            # if it has room, which counts the load it reports, including the containers still running from before the restart.
+            machine_names = [job.placements[instance_id] for instance_id in remaining if instance_id in job.placements]
+            if len(machine_names) > 0:
+                judge_request.preferred_machine_name = max(set(machine_names), key=machine_names.count)
+
+            self.start(job, judge_request)
+            resumed += 1
+
+        logger.info(f"Restored {len(self.jobs)} job(s) from the job journal, of which {resumed} are resumed")
+
+    def restore_job(self, job_id: str, records: list[tuple[str, dict]]) -> Job | None:
+        """
+        Rebuild a job from its records in the journal.
+        """
+        kind, data = records[0]
+        if kind != "submitted":
+            logger.error(f"The records of job {job_id} in the job journal do not start with its submission")
+            return None
+
+        job = Job(JudgeRequest.from_dict(data["request"]), job_id)
+
+        for kind, data in records[1:]:
+            if kind == "event":
+                job.events.append(data)
+                if data["event"] == "JOB_PROGRESS":
+                    job.results.update(data["args"]["results"])
+            elif kind == "placed":
+                for instance_id in data["instances"]:
+                    job.placements[instance_id] = data["machine_name"]
+            elif kind == "finished":
+                job.status = JobStatus[data["status"]]
+                job.cause = data["cause"]
+                job.finished_at = time.monotonic()
+
+        return job
+
+    def append(self, job: Job, kind: str, data: dict):
+        """
+        Append a record of the job to the journal, if jobs are journaled.
+        """
+        if self.journal is not None:
+            self.journal.append(job.job_id, kind, data)
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    async def run(self, job: Job, judge_request: JudgeRequest):
+        try:
+            judge_result = await evaluators.get_instance().submit(judge_request)
+        except Exception:
+            logger.error(f"An unexpected error has occured while evaluating job {job.job_id}", exc_info=1)
+            judge_result = JudgeResult.error("judge_internal_error")
+
+        self.finish(job, judge_result)
+
+    def finish(self, job: Job, judge_result: JudgeResult):
+        """
+        Record the outcome of a job.
+        """
+        if judge_result.result is not None:
+            # Report the results that were not reported as progress yet
+            self.progress(job, judge_result.result)
+            job.status = JobStatus.DONE
+            self.emit(job, "JOB_DONE", {"status": "ok", **({"metadata": judge_result.metadata} if len(judge_result.metadata) > 0 else {})})
+        else:
+            job.status = JobStatus.FAILED
+            job.cause = judge_result.cause
+            self.emit(job, "JOB_DONE", {"status": "error", "cause": judge_result.cause})
+
+        job.finished_at = time.monotonic()
+        self.append(job, "finished", {"status": job.status.name, "cause": job.cause})
+        logger.info(f"Finished job {job.job_id} with status {job.status.name.lower()}")
+
+    def progress(self, job: Job, results: dict):
+        """
+        Record the results of benchmark instances of a job, emitting the ones that are new.
+        """
+        new_results = {instance_id: result for instance_id, result in results.items() if instance_id not in job.results}
+        if len(new_results) == 0 or job.finished_at is not None:
+            return
+
+        job.results.update(new_results)
+        self.emit(job, "JOB_PROGRESS", {"results": new_results})
+
+    def emit(self, job: Job, event_name: str, args: dict):
+        event = {"event": event_name, "args": {"job_id": job.job_id, "sequence": len(job.events) + 1, **args}}
+        job.events.append(event)
+        self.append(job, "event", event)
+
+        for event_listener in self.event_listeners:
+            try:
+                event_listener(event)
+            except Exception:
+                logger.error(f"Event listener failed for job {job.job_id}", exc_info=1)
+
+    def close(self):
+        """
+        Write the records that are still pending to the journal, and close it.
+        """
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def prune(self):
+        """
+        Remove the jobs that have finished longer than the retention time ago.
+        """
+        threshold = time.monotonic() - JOB_RETENTION
+        for job_id in [job.job_id for job in self.jobs.values() if job.finished_at is not None and job.finished_at < threshold]:
+            del self.jobs[job_id]
+
+
+job_manager = JobManager()
+"""
+The job manager shared by the website commands.
+"""
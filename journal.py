@@ -0,0 +1,127 @@
+"""
+This module contains the JobJournal class, an append-only log of the jobs in SQLite, so jobs survive a restart.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from custom_logger import main_logger
+
+# Initialize the logger
+logger = main_logger.getChild("journal")
+
+# The SQLite database in which the jobs are journaled, or empty to not journal jobs
+JOB_JOURNAL_PATH = os.getenv("JOB_JOURNAL_PATH", "")
+
+# The time in seconds records are collected before they are written to disk in a single transaction
+JOB_JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOB_JOURNAL_FLUSH_INTERVAL", "0.1"))
+
+
+class JobJournal:
+    """
+    Appends records of jobs to a SQLite database in WAL mode.
+
+    Records are collected for a short interval and written in a single transaction from a separate thread,
+    so there is a single sync to disk per batch, which does not block the event loop.
+    Batches are written by a single thread, in the order in which they were collected.
+    """
+
+    path: str
+    flush_interval: float
+    database: sqlite3.Connection
+    lock: threading.Lock
+    """
+    Guards the database connection, which is shared by the writer thread and the event loop.
+    """
+    executor: concurrent.futures.ThreadPoolExecutor
+    """
+    The single thread writing the batches, so these are never reordered.
+    """
+    pending: list[tuple[str, str, str, float]]
+    flush_handle: asyncio.TimerHandle = None
+
+    def __init__(self, path: str = JOB_JOURNAL_PATH, flush_interval: float = JOB_JOURNAL_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+        self.pending = []
+
+        self.database = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.database.execute("PRAGMA journal_mode=WAL")
+        self.database.execute("PRAGMA synchronous=FULL")
+        self.database.execute("CREATE TABLE IF NOT EXISTS records (sequence INTEGER PRIMARY KEY AUTOINCREMENT, "
+                              "job_id TEXT, kind TEXT, data TEXT, created_at REAL)")
+
+    def append(self, job_id: str, kind: str, data: dict):
+        """
+        Append a record of the given kind to the journal. Should be called on the event loop.
+        """
+        self.pending.append((job_id, kind, json.dumps(data), time.time()))
+
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self._flush_later)
+
+    def _flush_later(self):
+        self.flush_handle = None
+        batch, self.pending = self.pending, []
+
+        self.executor.submit(self.write, batch)
+
+    def flush(self):
+        """
+        Write the pending records right away after the batches that are being written, e.g. before exiting.
+        """
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        batch, self.pending = self.pending, []
+        self.executor.submit(self.write, batch).result()
+
+    def close(self):
+        """
+        Write the pending records, and stop the writer thread. Do not use the journal after closing.
+        """
+        self.flush()
+        self.executor.shutdown()
+        self.database.close()
+
+    def write(self, batch: list[tuple[str, str, str, float]]):
+        if len(batch) == 0:
+            return
+
+        with self.lock:
+            try:
+                self.database.execute("BEGIN")
+                self.database.executemany("INSERT INTO records (job_id, kind, data, created_at) VALUES (?, ?, ?, ?)", batch)
+                self.database.execute("COMMIT")
+            except sqlite3.Error:
+                logger.error(f"Could not write {len(batch)} record(s) to the job journal", exc_info=1)
+                if self.database.in_transaction:
+                    self.database.execute("ROLLBACK")
+
+    def replay(self) -> dict[str, list[tuple[str, dict]]]:
+        """
+        Read the records of every job in the journal, in the order in which they were appended.
+        """
+        jobs = {}
+        with self.lock:
+            for job_id, kind, data in self.database.execute("SELECT job_id, kind, data FROM records ORDER BY sequence"):
+                jobs.setdefault(job_id, []).append((kind, json.loads(data)))
+
+        return jobs
+
+    def compact(self, retention: float):
+        """
+        Remove the records of the jobs that finished longer than the retention time ago.
+        """
+        threshold = time.time() - retention
+        with self.lock:
+            self.database.execute("DELETE FROM records WHERE job_id IN (SELECT job_id FROM records WHERE kind = 'finished' AND created_at < ?)",
+                                  (threshold,))
@@ -8,9 +8,12 @@ load_dotenv(override=True)
 import asyncio
 import os
 
+import metrics
 from azureevaluator import AzureEvaluator
 from azurewrap import Azure
 from custom_logger import main_logger
+from evaluators import SubmissionEvaluator
+from jobs import job_manager
 from localevaluator import LocalEvaluator
 from models import JudgeRequest, MachineType, Submission
 from protocol import judge_protocol_handler, website_protocol_handler
@@ -25,6 +28,9 @@ RESOURCE_GROUP_NAME = os.getenv("AZURE_RESOURCE_GROUP_NAME")
 # Initialize Azure object
 azure: Azure = None
 
+# The evaluator judge requests are submitted to, created by main
+evaluator: SubmissionEvaluator = None
+
 # Initiate protocol constants
 JUDGE_PROTOCOL_HOST = "0.0.0.0"
 JUDGE_PROTOCOL_PORT = 12345
@@ -33,7 +39,7 @@ WEBSITE_PROTOCOL_PORT = 30000
 
 
 async def main():
-    global azure
+    global azure, evaluator
     if os.getenv("EVALUATOR", "azure") == "azure":
         # Initiate Azure objects
         azure = Azure(SUBSCRIPTION_ID, RESOURCE_GROUP_NAME)
@@ -44,20 +50,29 @@ async def main():
         evaluator = LocalEvaluator()
         logger.info("Initializer LocalEvaluator...")
 
+    # Accept runners first, so the runners of existing VMs can reconnect while the evaluator loads them
+    judge_server = await judge_protocol_handler.start_handler(JUDGE_PROTOCOL_HOST, JUDGE_PROTOCOL_PORT)
+
     # Initialize evaluator
     await evaluator.initialize()
 
+    # Resume the jobs that had not finished before a restart
+    job_manager.restore()
+
     logger.info("Starting protocols...")
 
-    judge_thread = judge_protocol_handler.start_handler(JUDGE_PROTOCOL_HOST, JUDGE_PROTOCOL_PORT)
-    website_thread = website_protocol_handler.start_handler(WEBSITE_PROTOCOL_HOST, WEBSITE_PROTOCOL_PORT)
+    website_server = await website_protocol_handler.start_handler(WEBSITE_PROTOCOL_HOST, WEBSITE_PROTOCOL_PORT)
+    servers = [judge_server, website_server]
+
+    if metrics.METRICS_PORT != 0:
+        servers.append(await metrics.start_handler(metrics.METRICS_HOST, metrics.METRICS_PORT))
 
     logger.info("JudgeQueuer ready")
 
     # await send_test_submission(evaluator)
 
-    judge_thread.join()
-    website_thread.join()
+    # Serve the runners, the website and the metrics on the event loop
+    await asyncio.gather(*(server.serve_forever() for server in servers))
 
 async def send_test_submission(evaluator):
     submission = Submission(1, "https://storagebenchlab.blob.core.windows.net/submissions/submission.zip", "https://storagebenchlab.blob.core.windows.net/validators/validator.zip")
@@ -85,6 +100,9 @@ if __name__ == "__main__":
         try:
             await main()
         finally:
+            job_manager.close()
+            if evaluator is not None:
+                await evaluator.close()
             if azure is not None:
                 await azure.close()
 
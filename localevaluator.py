@@ -1,38 +1,217 @@
+import asyncio
+import collections
+import os
+
 from custom_logger import main_logger
 from evaluators import SubmissionEvaluator
+from health_monitor import HealthMonitor
 from models import JudgeRequest, JudgeResult
+from protocol import judge_protocol_handler
+from protocol.judge import JudgeProtocol
 from protocol.judge.commands import StartCommand
 from protocol.judge_protocol_handler import protocol_dict, protocol_dict_lock
 
 # Initialize the logger
 logger = main_logger.getChild("localevaluator")
 
+# How judge requests are spread over the local runners, either `least_loaded` (the default) or `round_robin`
+LOCAL_DISPATCH_POLICY = os.getenv("LOCAL_DISPATCH_POLICY", "least_loaded")
+
+# The amount of requests a runner that does not declare its maximum amount of containers runs at the same time, 0 for no limit
+LOCAL_RUNNER_MAX_CONTAINERS = int(os.getenv("LOCAL_RUNNER_MAX_CONTAINERS", "0"))
+
+
 class LocalEvaluator(SubmissionEvaluator):
-    def __init__(self):
+    """
+    An evaluator using the runners that connect to the judge, without managing any machines.
+
+    Requests are spread over the connected runners, and wait in a queue while every runner runs as many requests as it can.
+    """
+    policy: str
+    default_max_containers: int
+    in_flight: dict[str, int]
+    """
+    The amount of requests running on each runner by machine name.
+    """
+    waiters: collections.deque[tuple[JudgeRequest, asyncio.Future]]
+    """
+    The requests waiting for a runner in order of arrival, with the future resolved with the runner they are placed on.
+    """
+    last_runner: str | None
+    """
+    The runner the last request was placed on, used to take turns with the round robin policy.
+    """
+    loop: asyncio.AbstractEventLoop = None
+    health_monitor: HealthMonitor
+    """
+    Health checks the runners, which keeps the load they report up to date.
+    """
+
+    def __init__(self, policy: str = LOCAL_DISPATCH_POLICY, default_max_containers: int = LOCAL_RUNNER_MAX_CONTAINERS):
         super().__init__()
 
-    async def submit(self, judge_request: JudgeRequest) -> JudgeResult:
+        if policy not in ("least_loaded", "round_robin"):
+            raise ValueError(f"Unknown local dispatch policy `{policy}`")
+
+        self.policy = policy
+        self.default_max_containers = default_max_containers
+        self.in_flight = {}
+        self.waiters = collections.deque()
+        self.last_runner = None
+        self.health_monitor = HealthMonitor()
+
+    async def initialize(self):
         """
-        Submits a judge request to the local judge runner.
+        Start placing waiting requests on runners as they connect or report a lower load.
         """
-        logger.info(f"Submitting judge request {judge_request}")
+        self.loop = asyncio.get_running_loop()
+        judge_protocol_handler.add_connection_listener(self.on_connection)
+        judge_protocol_handler.add_load_listener(self.on_load_decrease)
+        self.health_monitor.start()
 
-        # Get the first available judge runner protocol
-        with protocol_dict_lock:
-            protocol = list(protocol_dict.values())[0]
+    async def close(self):
+        judge_protocol_handler.remove_connection_listener(self.on_connection)
+        judge_protocol_handler.remove_load_listener(self.on_load_decrease)
+        self.health_monitor.stop()
+
+    def on_connection(self, machine_name: str, connected: bool):
+        """
+        Listener for runner connection events, which can be called from any thread.
+        """
+        if connected and self.loop is not None:
+            self.loop.call_soon_threadsafe(self.dispatch)
+
+    def on_load_decrease(self, machine_name: str):
+        """
+        Listener for runners reporting a lower load, which can be called from any thread.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.dispatch)
 
-        command = StartCommand()
-        protocol.send_command(command, True,
-                              evaluation_settings=judge_request.evaluation_settings,
-                              benchmark_instances=judge_request.benchmark_instances,
-                              submission_url=judge_request.submission.source_url,
-                              validator_url=judge_request.submission.validator_url)
+    async def evaluate(self, judge_request: JudgeRequest) -> JudgeResult:
+        """
+        Evaluates a judge request on a local judge runner, once one has room for it.
+        """
+        machine_name, protocol = await self.acquire_runner(judge_request)
+        judge_request.report_placement(machine_name)
+
+        logger.info(f"Submitting judge request {judge_request} to runner {machine_name}")
+
+        try:
+            command = StartCommand()
+            await protocol.send_command(command,
+                                        progress_listener=judge_request.report_progress,
+                                        evaluation_settings=judge_request.evaluation_settings,
+                                        benchmark_instances=judge_request.benchmark_instances,
+                                        submission_url=judge_request.submission.source_url,
+                                        validator_url=judge_request.submission.validator_url)
+        finally:
+            self.release_runner(machine_name)
 
         if command.success:
             result = command.result
+            judge_request.report_progress(result)
 
             return JudgeResult.success(result)
         else:
             cause = command.cause
 
             return JudgeResult.error(cause)
+
+    async def acquire_runner(self, judge_request: JudgeRequest) -> tuple[str, JudgeProtocol]:
+        """
+        Queue the judge request, and wait until it is placed on a runner. Returns the machine name and protocol of the runner.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((judge_request, future))
+        self.dispatch()
+
+        if not future.done():
+            logger.info(f"Every runner is busy, waiting for a runner ({len(self.waiters)} waiting)")
+
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # Give the runner back if the request was placed just before it was cancelled
+            if future.done() and not future.cancelled():
+                self.release_runner(future.result()[0])
+            raise
+
+    def release_runner(self, machine_name: str):
+        """
+        Free the place of a finished request on its runner, and place waiting requests.
+        """
+        self.in_flight[machine_name] -= 1
+        if self.in_flight[machine_name] == 0:
+            del self.in_flight[machine_name]
+
+        self.dispatch()
+
+    def dispatch(self):
+        """
+        Place the waiting requests on runners with room for them, in order of arrival.
+        """
+        while len(self.waiters) > 0:
+            judge_request, future = self.waiters[0]
+            if future.done():
+                # The request was cancelled while waiting
+                self.waiters.popleft()
+                continue
+
+            runner = self.select_runner(judge_request)
+            if runner is None:
+                return
+
+            self.waiters.popleft()
+            self.in_flight[runner[0]] = self.in_flight.get(runner[0], 0) + 1
+            self.last_runner = runner[0]
+            future.set_result(runner)
+
+    def select_runner(self, judge_request: JudgeRequest) -> tuple[str, JudgeProtocol] | None:
+        """
+        Select a connected runner with room for the judge request according to the policy, or None if every runner is full.
+        """
+        with protocol_dict_lock:
+            protocols = dict(protocol_dict)
+
+        candidates = sorted(machine_name for machine_name, protocol in protocols.items()
+                            if not protocol.closed and self.has_room(machine_name, protocol))
+        if len(candidates) == 0:
+            return None
+
+        # Prefer the runner the request ran on before, which already fetched the submission
+        if judge_request.preferred_machine_name in candidates:
+            machine_name = judge_request.preferred_machine_name
+        elif self.policy == "round_robin":
+            # Take the next runner after the last one in order of machine name, starting over after the last runner
+            machine_name = next((candidate for candidate in candidates if self.last_runner is None or candidate > self.last_runner), candidates[0])
+        else:
+            machine_name = min(candidates, key=lambda candidate: self.load(candidate, protocols[candidate]))
+
+        return machine_name, protocols[machine_name]
+
+    def max_containers(self, protocol: JudgeProtocol) -> int:
+        """
+        Get the amount of requests the runner of the protocol can run at the same time, 0 if there is no limit.
+        """
+        if protocol.info is not None and protocol.info.max_containers is not None:
+            return protocol.info.max_containers
+
+        return self.default_max_containers
+
+    def has_room(self, machine_name: str, protocol: JudgeProtocol) -> bool:
+        """
+        Check whether the runner can start another container, counting the containers it reports running besides the requests placed on it.
+        """
+        max_containers = self.max_containers(protocol)
+        in_flight = self.in_flight.get(machine_name, 0)
+        return max_containers <= 0 or in_flight + max(0, protocol.load - in_flight) < max_containers
+
+    def load(self, machine_name: str, protocol: JudgeProtocol) -> tuple[float, int]:
+        """
+        Get the load of a runner, as the fraction of its containers in use and the amount of requests running on it.
+        """
+        in_flight = self.in_flight.get(machine_name, 0)
+        max_containers = self.max_containers(protocol)
+
+        return (in_flight / max_containers if max_containers > 0 else 0, in_flight)
@@ -0,0 +1,400 @@
+"""
+This module contains the metrics of the judge queuer: counters, gauges and histograms, optionally with labels.
+
+The metrics are served in the Prometheus text format over HTTP, and can be read in code with `snapshot()`.
+Recording a value only updates a number in memory, values that take more work are computed by collectors when the metrics are read.
+"""
+
+import asyncio
+import bisect
+import math
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable
+
+from custom_logger import main_logger
+
+# Initialize the logger
+logger = main_logger.getChild("metrics")
+
+# The host on which the metrics are served over HTTP
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# The port on which the metrics are served over HTTP, 0 to not serve them
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+"""
+The upper bounds in seconds of the buckets of histograms, ranging from round trips to runners to provisioning VMs.
+"""
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class CounterValue:
+    """
+    The value of a counter for a single combination of label values, which only goes up.
+    """
+
+    lock: threading.Lock
+    value: float
+
+    def __init__(self, lock: threading.Lock):
+        self.lock = lock
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+    def get(self) -> float:
+        return self.value
+
+
+class GaugeValue:
+    """
+    The value of a gauge for a single combination of label values, which can go up and down.
+    """
+
+    lock: threading.Lock
+    value: float
+    function: Callable[[], float] | None = None
+    """
+    Computes the value when it is read, if set.
+    """
+
+    def __init__(self, lock: threading.Lock):
+        self.lock = lock
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """
+        Compute the value with the given function whenever it is read.
+        """
+        self.function = function
+
+    def get(self) -> float:
+        return self.value if self.function is None else self.function()
+
+
+class HistogramValue:
+    """
+    The observations of a histogram for a single combination of label values, counted per bucket.
+    """
+
+    lock: threading.Lock
+    buckets: tuple[float, ...]
+    counts: list[int]
+    """
+    The amount of observations per bucket, not cumulative, with a last bucket for the observations above the largest bound.
+    """
+    sum: float
+    count: int
+
+    def __init__(self, lock: threading.Lock, buckets: tuple[float, ...]):
+        self.lock = lock
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def get(self) -> dict:
+        """
+        Get the count, the sum and the cumulative count of every bucket by its upper bound.
+        """
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+
+        cumulative = 0
+        buckets = []
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            buckets.append((bound, cumulative))
+
+        return {"count": count, "sum": total, "buckets": buckets}
+
+
+class Metric(ABC):
+    """
+    A metric, of which a value is kept for every combination of label values.
+    Metrics without labels have a single value, which can be recorded on the metric itself.
+    """
+
+    type: str
+    name: str
+    help: str
+    label_names: tuple[str, ...]
+    lock: threading.Lock
+    values: dict[tuple[str, ...], CounterValue | GaugeValue | HistogramValue]
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def labels(self, *label_values) -> CounterValue | GaugeValue | HistogramValue:
+        """
+        Get the value of the given combination of label values, in the order of the label names.
+        """
+        key = tuple(str(label_value) for label_value in label_values)
+
+        value = self.values.get(key)
+        if value is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f"Metric {self.name} has labels {self.label_names}, but got values {key}")
+
+            with self.lock:
+                value = self.values.setdefault(key, self.create_value())
+
+        return value
+
+    @abstractmethod
+    def create_value(self) -> CounterValue | GaugeValue | HistogramValue:
+        """
+        Create the value of a new combination of label values.
+        """
+        pass
+
+    def render(self) -> list[str]:
+        """
+        Get the lines of this metric in the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {escape(self.help, False)}", f"# TYPE {self.name} {self.type}"]
+        for key, value in list(self.values.items()):
+            labels = dict(zip(self.label_names, key))
+            lines.append(f"{self.name}{format_labels(labels)} {format_value(value.get())}")
+
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def create_value(self) -> CounterValue:
+        return CounterValue(self.lock)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def create_value(self) -> GaugeValue:
+        return GaugeValue(self.lock)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self.labels().set_function(function)
+
+
+class Histogram(Metric):
+    type = "histogram"
+    buckets: tuple[float, ...]
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def create_value(self) -> HistogramValue:
+        return HistogramValue(self.lock, self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {escape(self.help, False)}", f"# TYPE {self.name} {self.type}"]
+        for key, value in list(self.values.items()):
+            labels = dict(zip(self.label_names, key))
+            histogram = value.get()
+
+            for bound, count in histogram["buckets"]:
+                lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': format_value(bound)})} {count}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(histogram['sum'])}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {histogram['count']}")
+
+        return lines
+
+
+def escape(text: str, quotes: bool = True) -> str:
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quotes else text
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    if len(labels) == 0:
+        return ""
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+
+    return str(value)
+
+
+class Registry:
+    """
+    Keeps track of all metrics, and of the collectors that update gauges before the metrics are read.
+    """
+
+    metrics: dict[str, Metric]
+    collectors: list[Callable[[], None]]
+    lock: threading.Lock
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Add a metric, or get the existing metric with the same name and type.
+        """
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is None:
+                self.metrics[metric.name] = metric
+                return metric
+
+        if type(existing) is not type(metric) or existing.label_names != metric.label_names:
+            raise ValueError(f"Metric {metric.name} is already registered as a different metric")
+
+        return existing
+
+    def counter(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, label_names))
+
+    def gauge(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help, label_names))
+
+    def histogram(self, name: str, help: str, label_names: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, label_names, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        """
+        Add a collector, which is called before the metrics are read.
+        """
+        self.collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[[], None]):
+        """
+        Remove a collector added with `add_collector`, e.g. because its owner is shutting down.
+        """
+        if collector in self.collectors:
+            self.collectors.remove(collector)
+
+    def collect(self):
+        for collector in list(self.collectors):
+            try:
+                collector()
+            except Exception:
+                logger.error("A metrics collector failed", exc_info=1)
+
+    def render(self) -> str:
+        """
+        Get all metrics in the Prometheus text format.
+        """
+        self.collect()
+
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict[str, dict[tuple[str, ...], float | dict]]:
+        """
+        Get the values of all metrics by name, and by their label values in the order of the label names.
+        The value of a histogram holds its count, sum and cumulative bucket counts.
+        """
+        self.collect()
+
+        return {name: {key: value.get() for key, value in list(metric.values.items())} for name, metric in list(self.metrics.items())}
+
+
+registry = Registry()
+"""
+The registry of all metrics of the judge queuer.
+"""
+
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
+add_collector = registry.add_collector
+remove_collector = registry.remove_collector
+snapshot = registry.snapshot
+render = registry.render
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Answers a single HTTP request, serving the metrics on `/metrics`.
+    """
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+
+        # Skip the headers of the request
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+        if len(request_line) >= 2 and request_line[0] == "GET" and request_line[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode())
+        writer.write(body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    except Exception:
+        logger.error("An unexpected error has occured while serving the metrics", exc_info=1)
+    finally:
+        writer.close()
+
+
+async def start_handler(host: str, port: int) -> asyncio.Server:
+    """
+    Starts serving the metrics over HTTP on the running event loop.
+    """
+    server = await asyncio.start_server(handle_connection, host, port, reuse_address=True)
+
+    logger.info(f"Started serving metrics on http://{host}:{port}/metrics...")
+
+    return server
@@ -1,4 +1,5 @@
 from enum import Enum
+from typing import Callable
 
 
 class MachineType:
@@ -60,14 +61,127 @@ class JudgeRequest:
     memory: int # MB
     evaluation_settings: dict
     benchmark_instances: dict[str, str]
-
-    def __init__(self, submission: 'Submission', machine_type: MachineType, cpus: int, memory: int, evaluation_settings: dict, benchmark_instances: dict[str, str]):
+    priority: int # Higher priority requests are placed first
+    competition_id: str | None # Requests of different competitions are placed fairly
+    parent: 'JudgeRequest | None' # The request this request is a part of, if it has been split
+    preferred_machine_name: str | None # The runner the request is placed on if it has room, e.g. the one that already fetched its submission
+    progress_listener: Callable[[dict], None] | None = None
+    placement_listener: Callable[[str, dict[str, str]], None] | None = None
+
+    def __init__(self, submission: 'Submission', machine_type: MachineType, cpus: int, memory: int, evaluation_settings: dict, benchmark_instances: dict[str, str],
+                 priority: int = 0, competition_id: str | None = None):
         self.submission = submission
         self.machine_type = machine_type
         self.cpus = cpus
         self.memory = memory
         self.evaluation_settings = evaluation_settings
         self.benchmark_instances = benchmark_instances
+        self.priority = priority
+        self.competition_id = competition_id
+        self.parent = None
+        self.preferred_machine_name = None
+
+    def set_progress_listener(self, progress_listener: Callable[[dict], None]):
+        """
+        Set the listener that is called with the results per benchmark instance as they become known.
+        """
+        if self.progress_listener is not None:
+            raise ValueError("Progress listener is already set!")
+
+        self.progress_listener = progress_listener
+
+    def report_progress(self, results: dict):
+        """
+        Report the results of some of the benchmark instances, to this request and the requests it is a part of.
+        """
+        if len(results) == 0:
+            return
+
+        if self.progress_listener is not None:
+            self.progress_listener(results)
+        if self.parent is not None:
+            self.parent.report_progress(results)
+
+    def set_placement_listener(self, placement_listener: Callable[[str, dict[str, str]], None]):
+        """
+        Set the listener that is called with the machine name of the runner and the benchmark instances placed on it.
+        """
+        if self.placement_listener is not None:
+            raise ValueError("Placement listener is already set!")
+
+        self.placement_listener = placement_listener
+
+    def report_placement(self, machine_name: str, benchmark_instances: dict[str, str] = None):
+        """
+        Report that (part of) this request has been placed on a runner, to this request and the requests it is a part of.
+        """
+        if benchmark_instances is None:
+            benchmark_instances = self.benchmark_instances
+
+        if self.placement_listener is not None:
+            self.placement_listener(machine_name, benchmark_instances)
+        if self.parent is not None:
+            self.parent.report_placement(machine_name, benchmark_instances)
+
+    def subset(self, benchmark_instances: dict[str, str]) -> 'JudgeRequest':
+        """
+        Create a request for part of the benchmark instances of this request, which is otherwise the same.
+        """
+        judge_request = JudgeRequest(self.submission, self.machine_type, self.cpus, self.memory, self.evaluation_settings, benchmark_instances,
+                                     priority=self.priority, competition_id=self.competition_id)
+        judge_request.parent = self
+        judge_request.preferred_machine_name = self.preferred_machine_name
+        return judge_request
+
+    def substitute(self, machine_type: MachineType) -> 'JudgeRequest':
+        """
+        Create a request that is the same as this request, but is evaluated on the given machine type instead.
+        """
+        judge_request = self.subset(self.benchmark_instances)
+        judge_request.machine_type = machine_type
+        return judge_request
+
+    def split(self, count: int) -> list['JudgeRequest']:
+        """
+        Split the benchmark instances of this request over (at most) the given amount of requests of about equal size.
+        """
+        instances = list(self.benchmark_instances.items())
+        count = max(1, min(count, len(instances)))
+        size, remainder = divmod(len(instances), count)
+
+        shards = []
+        start = 0
+        for index in range(count):
+            end = start + size + (1 if index < remainder else 0)
+            shards.append(self.subset(dict(instances[start:end])))
+            start = end
+
+        return shards
+
+    def to_dict(self) -> dict:
+        """
+        Serialize the contents of this request, e.g. to store it in the job journal.
+        """
+        return {
+            "submission_type": self.submission.type.name,
+            "submission_url": self.submission.source_url,
+            "validator_url": self.submission.validator_url,
+            "machine_type": self.machine_type.name,
+            "machine_tier": self.machine_type.tier,
+            "cpus": self.cpus,
+            "memory": self.memory,
+            "evaluation_settings": self.evaluation_settings,
+            "benchmark_instances": self.benchmark_instances,
+            "priority": self.priority,
+            "competition_id": self.competition_id,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> 'JudgeRequest':
+        submission = Submission(SubmissionType[data["submission_type"]], data["submission_url"], data["validator_url"])
+        machine_type = MachineType(data["machine_type"], data["machine_tier"])
+        return JudgeRequest(submission, machine_type, data["cpus"], data["memory"], data["evaluation_settings"], data["benchmark_instances"],
+                            priority=data["priority"], competition_id=data["competition_id"])
 
 class JudgeResult:
     """
@@ -75,20 +189,40 @@ class JudgeResult:
 
     Formatted in JSON.
     """
-    result: str | None
+    result: dict | None # The results per benchmark instance
     cause: str | None
+    metadata: dict # How the request was evaluated, e.g. the machine type it was evaluated on
     
     def __init__(self, result: str | None, cause: str | None):
         self.result = result
         self.cause = cause
+        self.metadata = {}
 
     @staticmethod
-    def success(result: str):
+    def success(result: dict):
         return JudgeResult(result=result, cause=None)
 
     @staticmethod
     def error(cause: str):
         return JudgeResult(result=None, cause=cause)
 
+    @staticmethod
+    def merge(judge_results: list['JudgeResult']) -> 'JudgeResult':
+        """
+        Merge the results of the parts of a split request into a single result, which fails if any of the parts failed.
+        """
+        result = {}
+        metadata = {}
+        for judge_result in judge_results:
+            if judge_result.result is None:
+                return judge_result
+
+            result.update(judge_result.result)
+            metadata.update(judge_result.metadata)
+
+        merged = JudgeResult.success(result)
+        merged.metadata = metadata
+        return merged
+
     def __str__(self) -> str:
         return f"JudgeResult(result={self.result}, cause={self.cause})"
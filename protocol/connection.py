@@ -2,10 +2,10 @@
 This module contains the Connection class.
 """
 
-import socket
-import threading
+import asyncio
 
 from .counter import Counter
+from .encoding import Encoding
 
 
 class Connection:
@@ -23,14 +23,14 @@ class Connection:
     The port used for the connection.
     """
 
-    sock: socket.socket
+    reader: asyncio.StreamReader
     """
-    The socket used for the connection.
+    The stream from which messages of the peer are read.
     """
 
-    sock_lock: threading.Lock
+    writer: asyncio.StreamWriter
     """
-    A lock used to synchronize access to the socket.
+    The stream to which messages for the peer are written.
     """
 
     message_counter: Counter
@@ -38,17 +38,21 @@ class Connection:
     A counter used to generate unique message IDs.
     """
 
+    encoding: Encoding
+    """
+    The encoding of the messages sent to the peer, mirroring the encoding used by the peer.
+    """
+
     def __init__(
         self,
         ip: str,
         port: int,
-        sock: socket.socket,
-        sock_lock: threading.Lock,
-        timeout: int | None = None,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
     ):
         self.ip = ip
         self.port = port
-        sock.settimeout(timeout)
-        self.sock = sock
-        self.sock_lock = sock_lock
+        self.reader = reader
+        self.writer = writer
         self.message_counter = Counter()
+        self.encoding = Encoding()
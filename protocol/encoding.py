@@ -0,0 +1,162 @@
+"""
+This module contains the Encoding class, which describes how messages are encoded in frames.
+
+Every frame starts with the size of its body as a 4 byte big endian integer. Frames of the
+original protocol contain a JSON body. Extended frames set the highest bit of the size, and
+are followed by a header of 4 bytes: the extension version, the codec, the compression and
+the flags of the frame, after which the body follows.
+"""
+
+import json
+import os
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bodies larger than this amount of bytes are compressed, if the peer uses compression
+PROTOCOL_COMPRESSION_THRESHOLD = int(os.getenv("PROTOCOL_COMPRESSION_THRESHOLD", "16384"))
+
+EXTENSION_VERSION = 1
+EXTENDED_FLAG = 0x80000000
+HEADER_SIZE = 4
+FLAG_COMPRESSED = 0x01
+
+CODECS = ["json", "msgpack"]
+"""
+The codecs by their identifier in the frame header.
+"""
+COMPRESSIONS = ["none", "zlib", "zstd"]
+"""
+The compressions by their identifier in the frame header.
+"""
+
+
+def supported_codecs() -> list[str]:
+    """
+    Get the codecs available on this machine, in order of preference.
+    """
+    return (["msgpack"] if msgpack is not None else []) + ["json"]
+
+
+def supported_compressions() -> list[str]:
+    """
+    Get the compressions available on this machine, in order of preference.
+    """
+    return (["zstd"] if zstandard is not None else []) + ["zlib", "none"]
+
+
+def supported_encodings() -> dict:
+    """
+    Get the encodings available on this machine, as advertised to peers.
+    """
+    return {"version": EXTENSION_VERSION, "codecs": supported_codecs(), "compressions": supported_compressions()}
+
+
+class Encoding:
+    """
+    The codec and compression used to encode messages to a peer.
+
+    A connection starts out with JSON without compression, which is sent in frames of the original
+    protocol. When the peer sends an extended frame, its encoding is mirrored for every further message.
+    """
+
+    codec: str
+    compression: str
+
+    def __init__(self, codec: str = "json", compression: str = "none"):
+        if codec not in supported_codecs():
+            raise ValueError(f"Unsupported codec `{codec}`")
+        if compression not in supported_compressions():
+            raise ValueError(f"Unsupported compression `{compression}`")
+
+        self.codec = codec
+        self.compression = compression
+
+    def is_extended(self) -> bool:
+        """
+        Whether the encoding needs extended frames, JSON without compression is sent in original frames.
+        """
+        return self.codec != "json" or self.compression != "none"
+
+    def encode(self, message: dict) -> bytes:
+        """
+        Encode a message into a complete frame, including the size and header.
+        """
+        if self.codec == "msgpack":
+            body = msgpack.packb(message)
+        else:
+            body = json.dumps(message).encode()
+
+        if not self.is_extended():
+            return len(body).to_bytes(4, byteorder="big") + body
+
+        flags = 0
+        if self.compression != "none" and len(body) > PROTOCOL_COMPRESSION_THRESHOLD:
+            body = self.compress(body)
+            flags |= FLAG_COMPRESSED
+
+        if len(body) >= EXTENDED_FLAG:
+            raise ValueError(f"The message of size {len(body)} bytes is too large to be sent!")
+
+        header = bytes([EXTENSION_VERSION, CODECS.index(self.codec), COMPRESSIONS.index(self.compression), flags])
+        return (len(body) | EXTENDED_FLAG).to_bytes(4, byteorder="big") + header + body
+
+    def decode(self, body: bytes, compressed: bool = False) -> dict:
+        """
+        Decode the body of a frame into a message.
+        """
+        if compressed:
+            body = self.decompress(body)
+
+        if self.codec == "msgpack":
+            return msgpack.unpackb(body)
+
+        return json.loads(body)
+
+    def compress(self, body: bytes) -> bytes:
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor().compress(body)
+
+        return zlib.compress(body)
+
+    def decompress(self, body: bytes) -> bytes:
+        if self.compression == "zstd":
+            return zstandard.ZstdDecompressor().decompress(body)
+
+        return zlib.decompress(body)
+
+    @staticmethod
+    def parse_size(data: bytes) -> tuple[int, bool]:
+        """
+        Parse the size at the start of a frame, returning the size of the body and whether the frame is extended.
+        """
+        size = int.from_bytes(data, byteorder="big")
+        return size & ~EXTENDED_FLAG, size & EXTENDED_FLAG != 0
+
+    @staticmethod
+    def parse_header(header: bytes) -> tuple['Encoding', bool]:
+        """
+        Parse the header of an extended frame, returning the encoding of the frame and whether its body is compressed.
+        """
+        version, codec, compression, flags = header
+
+        if version != EXTENSION_VERSION:
+            raise ValueError(f"Received frame with extension version {version} but expected {EXTENSION_VERSION}!")
+        if codec >= len(CODECS) or compression >= len(COMPRESSIONS):
+            raise ValueError(f"Received frame with unknown codec {codec} or compression {compression}!")
+
+        return Encoding(CODECS[codec], COMPRESSIONS[compression]), flags & FLAG_COMPRESSED != 0
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Encoding) and (self.codec, self.compression) == (other.codec, other.compression)
+
+    def __repr__(self) -> str:
+        return f"Encoding({self.codec}, {self.compression})"
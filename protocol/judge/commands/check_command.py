@@ -9,10 +9,15 @@ class CheckCommand(Command):
     """
     The CheckCommand class is used to check the status of the runner.
     """
+    healthy: bool = False
+    load: int | None = None
+    """
+    The amount of containers the runner is running, or None if the runner does not report it.
+    """
 
     def __init__(self):
         super().__init__(name="CHECK")
 
     def response(self, response: dict):
-        if response["status"] != "ok":
-            raise Exception("Runner is healthy")
+        self.healthy = response["status"] == "ok"
+        self.load = response.get("load")
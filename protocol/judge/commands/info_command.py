@@ -8,6 +8,25 @@ from .command import Command
 class InfoCommand(Command):
     """
     The InfoCommand class is used to request machine and VM information from a runner.
+
+    Besides its machine name, a runner may report the resources it can use for containers, which take precedence over the size of its VM.
+    """
+    machine_name: str
+    cores: int | None = None
+    """
+    The amount of cores the runner can use for containers, or None if the runner does not report it.
+    """
+    memory: int | None = None
+    """
+    The amount of memory (in MB) the runner can use for containers, or None if the runner does not report it.
+    """
+    max_containers: int | None = None
+    """
+    The amount of containers the runner can run at the same time, or None if the runner does not declare it.
+    """
+    load: int = 0
+    """
+    The amount of containers the runner is running.
     """
 
     def __init__(self):
@@ -15,3 +34,7 @@ class InfoCommand(Command):
 
     def response(self, response: dict):
         self.machine_name = response["machine_name"]
+        self.cores = response.get("cores")
+        self.memory = response.get("memory")
+        self.max_containers = response.get("max_containers")
+        self.load = response.get("load", 0)
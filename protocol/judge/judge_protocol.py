@@ -2,117 +2,185 @@
 This module contains the JudgeProtocol class.
 """
 
-import threading
-from queue import Queue
+import asyncio
+import time
 from typing import Callable
 
+import metrics
 from custom_logger import main_logger
 from protocol import Connection, Protocol
+from protocol.trace import trace_command
 
-from .commands import Command
+from .commands import Command, InfoCommand
 
 logger = main_logger.getChild("protocol.judge")
 
+RUNNER_COMMAND_DURATION = metrics.histogram("judgequeuer_runner_command_seconds",
+                                            "The time from sending a command to a runner until its response, e.g. the round trip of CHECK",
+                                            ("command",))
+RUNNER_COMMAND_ERRORS = metrics.counter("judgequeuer_runner_command_errors_total",
+                                        "The amount of commands to runners without a response", ("command",))
+
 
 class JudgeProtocol(Protocol):
     """
     The protocol class used by the judge server.
+
+    All communication happens on the event loop on which the protocol was created,
+    responses are matched to their commands by message id.
     """
 
     connection: Connection
-    queue_dict_lock: threading.Lock
-    queue_dict: dict[str, Queue[dict]]
-    receiver_thread: threading.Thread
+    loop: asyncio.AbstractEventLoop
+    futures: dict[int, asyncio.Future]
+    progress_listeners: dict[int, Callable[[dict], None]]
+    """
+    Listeners for the progress runners may report before the response of a command, by message id.
+    """
+    receiver_task: asyncio.Task
+    info: InfoCommand | None = None
+    """
+    The information the runner reported when it connected.
+    """
+    load: int = 0
+    """
+    The amount of containers the runner reported running, when it connected and at every health check.
+    """
+    closed: bool = False
     close_listener: Callable = None
     close_listener_args: tuple = ()
 
     def __init__(self, connection: Connection):
         self.connection = connection
-        self.queue_dict_lock = threading.Lock()
-        self.queue_dict: dict[str, Queue[dict]] = {}
+        self.loop = asyncio.get_running_loop()
+        self.futures = {}
+        self.progress_listeners = {}
 
-        self.receiver_thread = threading.Thread(target=self._receiver, daemon=True)
-        self.receiver_thread.start()
+        self.receiver_task = self.loop.create_task(self._receiver())
 
     def set_close_listener(self, close_listener: Callable, close_listener_args: tuple = ()):
+        """
+        Sets the listener called when the connection closes. If it has already closed, the listener is called straight away.
+        """
         if self.close_listener is not None:
             raise ValueError("Close listener is already set!")
 
         self.close_listener = close_listener
         self.close_listener_args = close_listener_args
 
-    def _receiver(self):
+        if self.closed:
+            self.close_listener(*self.close_listener_args)
+
+    async def _receiver(self):
         """
         Receives and handles responses from the runner.
         """
 
         try:
             while True:
-                message_id, response = self._receive_response()
-
-                with self.queue_dict_lock:
-                    if message_id not in self.queue_dict:
-                        logger.error(
-                            f"Received response from {self.connection.ip}:{self.connection.port} with unknown message id: {message_id}"
-                        )
-                        continue
-                    self.queue_dict[message_id].put(response)
+                message = await Protocol.receive(self.connection)
+
+                if message.get("progress") is not None:
+                    self._handle_progress(message)
+                    continue
+
+                message_id, response = self._parse_response(message)
+
+                future = self.futures.get(message_id)
+                if future is None:
+                    logger.error(
+                        f"Received response from {self.connection.ip}:{self.connection.port} with unknown message id: {message_id}"
+                    )
+                    continue
+
+                if not future.done():
+                    future.set_result(response)
+        except ConnectionResetError as e:
+            logger.info(f"Connection with the runner at {self.connection.ip}:{self.connection.port} closed ({e})")
+        except Exception:
+            logger.error(
+                f"Error occured while receiving from the runner located at {self.connection.ip}:{self.connection.port}.",
+                exc_info=1,
+            )
         finally:
+            self.closed = True
+            self.connection.writer.close()
+
+            # Fail the commands that are still waiting for a response
+            for future in self.futures.values():
+                if not future.done():
+                    future.set_exception(ConnectionResetError(
+                        f"The connection with the runner at {self.connection.ip}:{self.connection.port} was closed!"
+                    ))
+
             # Call close listener
             if self.close_listener is not None:
                 self.close_listener(*self.close_listener_args)
 
-    def send_command(self, command: Command, block: bool = False, timeout: float = None, **kwargs):
+    def _handle_progress(self, message: dict):
         """
-        Sends a given command with the given arguments to the runner specifed in the connection.
+        Passes the progress reported by the runner for a command to its listener.
         """
 
-        if block:
-            self._send_command(command, timeout, **kwargs)
+        progress_listener = self.progress_listeners.get(message.get("id"))
+        if progress_listener is None:
             return
 
-        threading.Thread(
-            target=self._send_command, args=(command, timeout), kwargs=kwargs, daemon=True
-        ).start()
+        try:
+            progress_listener(message["progress"])
+        except Exception:
+            logger.error(f"Progress listener failed for message id {message.get('id')}", exc_info=1)
 
-    def _send_command(self, command: Command, timeout: float = None, **kwargs):
-        """
-        Send command to the runner and wait for the response.
+    async def send_command(self, command: Command, timeout: float = None, progress_listener: Callable[[dict], None] = None, **kwargs):
         """
+        Sends a given command with the given arguments to the runner specifed in the connection,
+        and waits for the response, which is passed to the command.
+        Progress reported by the runner before the response is passed to the progress listener.
 
-        try:
-            counter = self.connection.message_counter
-            message = {"id": counter.generate(), "command": command.name, "args": kwargs}
+        May be awaited from any event loop, raises an exception if no response is received.
+        """
 
-            queue = Queue()
-            with self.queue_dict_lock:
-                self.queue_dict[message["id"]] = queue
+        # Commands are always sent from the event loop of the connection
+        if asyncio.get_running_loop() is not self.loop:
+            future = asyncio.run_coroutine_threadsafe(self.send_command(command, timeout, progress_listener, **kwargs), self.loop)
+            return await asyncio.wrap_future(future)
 
-            Protocol.send(self.connection, message)
-            logger.info(
-                f"Sent command {command.name} with args {kwargs} to the runner located at {self.connection.ip}:{self.connection.port}."
+        if self.closed:
+            raise ConnectionResetError(
+                f"The connection with the runner at {self.connection.ip}:{self.connection.port} is closed!"
             )
-            response = queue.get(timeout=timeout)
 
-            command.response(response)
+        counter = self.connection.message_counter
+        message = {"id": counter.generate(), "command": command.name, "args": kwargs}
 
-        except Exception:
-            logger.error(
-                f"Error occured while trying to execute a command for the runner located at {self.connection.ip}:{self.connection.port}.",
-                exc_info=1,
-            )
+        future = self.loop.create_future()
+        self.futures[message["id"]] = future
+        if progress_listener is not None:
+            self.progress_listeners[message["id"]] = progress_listener
 
+        start = time.monotonic()
+        try:
+            await Protocol.send(self.connection, message)
+            response = await asyncio.wait_for(future, timeout)
+        except BaseException as e:
+            trace_command(self.connection, message["id"], command.name, time.monotonic() - start, e)
+            RUNNER_COMMAND_ERRORS.labels(command.name).inc()
+            raise
         finally:
-            with self.queue_dict_lock:
-                del self.queue_dict[message["id"]]
+            del self.futures[message["id"]]
+            self.progress_listeners.pop(message["id"], None)
+
+        duration = time.monotonic() - start
+        trace_command(self.connection, message["id"], command.name, duration)
+        RUNNER_COMMAND_DURATION.labels(command.name).observe(duration)
 
-    def _receive_response(self) -> tuple[str, dict]:
+        command.response(response)
+
+    def _parse_response(self, message: dict) -> tuple[int, dict]:
         """
-        Receives a response from the runner.
+        Parses a response received from the runner.
         """
 
-        message = Protocol.receive(self.connection)
-
         if message["response"] is None:
             raise ValueError("Received message with missing response!")
 
@@ -1,9 +1,13 @@
-import socket
+import asyncio
+import concurrent.futures
 import threading
+from typing import Callable
 
+import metrics
 from custom_logger import main_logger
 
 from . import Connection
+from .encoding import supported_encodings
 from .judge import JudgeProtocol
 from .judge.commands.info_command import InfoCommand
 
@@ -17,6 +21,20 @@ protocol_dict: dict[str, JudgeProtocol] = {}
 """
 Stores all protocols by the runner's hostname.
 """
+connection_futures: dict[str, list[concurrent.futures.Future]] = {}
+"""
+Futures waiting for a runner with the given machine name to connect, guarded by protocol_dict_lock.
+"""
+connection_listeners: list[Callable[[str, bool], None]] = []
+"""
+Listeners called with the machine name and whether the runner connected (True) or disconnected (False).
+"""
+load_listeners: list[Callable[[str], None]] = []
+"""
+Listeners called with the machine name of a runner of which the reported load decreased.
+"""
+
+metrics.gauge("judgequeuer_runners_connected", "The amount of runners connected to the judge").set_function(lambda: len(protocol_dict))
 
 
 def is_machine_name_connected(machine_name: str) -> bool:
@@ -29,22 +47,112 @@ def get_protocol_from_machine_name(machine_name: str) -> JudgeProtocol:
         return protocol_dict[machine_name]
 
 
-def handle_connection(connection: Connection):
+def add_connection_listener(listener: Callable[[str, bool], None]):
+    """
+    Add a listener that is called when a runner connects or disconnects.
+    The listener is called on the event loop handling the connection, so it should not block.
+    """
+    connection_listeners.append(listener)
+
+
+def remove_connection_listener(listener: Callable[[str, bool], None]):
+    """
+    Remove a listener added with `add_connection_listener`, e.g. because its owner is shutting down.
+    """
+    if listener in connection_listeners:
+        connection_listeners.remove(listener)
+
+
+def add_load_listener(listener: Callable[[str], None]):
+    """
+    Add a listener that is called when a runner reports a lower load than before, so it may have room for waiting requests.
+    The listener is called on the event loop that received the report, so it should not block.
+    """
+    load_listeners.append(listener)
+
+
+def remove_load_listener(listener: Callable[[str], None]):
+    """
+    Remove a listener added with `add_load_listener`, e.g. because its owner is shutting down.
+    """
+    if listener in load_listeners:
+        load_listeners.remove(listener)
+
+
+def update_load(machine_name: str, protocol: JudgeProtocol, load: int):
+    """
+    Store the load the runner reported, notifying the load listeners if it decreased.
+    """
+    previous_load = protocol.load
+    protocol.load = load
+    if load >= previous_load:
+        return
+
+    for listener in load_listeners:
+        try:
+            listener(machine_name)
+        except Exception:
+            logger.error(f"Load listener failed for runner with machine name {machine_name}", exc_info=1)
+
+
+async def wait_for_connection(machine_name: str, timeout: float | None = None) -> JudgeProtocol:
+    """
+    Wait until the runner with the given machine name is connected, returning its protocol.
+    Raises a TimeoutError if it has not connected within the timeout.
+    """
+    with protocol_dict_lock:
+        if machine_name in protocol_dict:
+            return protocol_dict[machine_name]
+
+        future = concurrent.futures.Future()
+        connection_futures.setdefault(machine_name, []).append(future)
+
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    finally:
+        with protocol_dict_lock:
+            futures = connection_futures.get(machine_name, [])
+            if future in futures:
+                futures.remove(future)
+            if len(futures) == 0:
+                connection_futures.pop(machine_name, None)
+
+
+def _notify_listeners(machine_name: str, connected: bool):
+    for listener in connection_listeners:
+        try:
+            listener(machine_name, connected)
+        except Exception:
+            logger.error(f"Connection listener failed for runner with machine name {machine_name}", exc_info=1)
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    ip, port = writer.get_extra_info("peername")[:2]
+    logger.info(f"Received connection attempt from {ip}:{port}.")
+
     # Instantiate the protocol
+    connection = Connection(ip, port, reader, writer)
     protocol = JudgeProtocol(connection)
 
     machine_name = None
     try:
-        # Request the machine name of the runner
+        # Request the machine name of the runner, advertising the encodings it may switch to and that it may report progress
         command = InfoCommand()
-        protocol.send_command(command, True)
+        await protocol.send_command(command, encodings=supported_encodings(), progress=True)
         machine_name = command.machine_name
+        protocol.info = command
+        protocol.load = command.load
 
         # Store the protocol in the protocol_dict with its machine name
         with protocol_dict_lock:
             if machine_name in protocol_dict:
                 raise Exception("Runner with the same machine name is already connected")
             protocol_dict[machine_name] = protocol
+
+            # Wake up everyone waiting for this runner
+            for future in connection_futures.pop(machine_name, []):
+                if not future.done():
+                    future.set_result(protocol)
         logger.info(f"Accepted connection from runner with machine name {machine_name}")
 
         # Add close listener to remove the protocol from the protocol_dict when the runner disconnects
@@ -52,38 +160,24 @@ def handle_connection(connection: Connection):
             with protocol_dict_lock:
                 protocol_dict.pop(machine_name)
                 logger.info(f"Runner with machine name {machine_name} has disconnected")
+            _notify_listeners(machine_name, False)
 
+        _notify_listeners(machine_name, True)
         protocol.set_close_listener(on_close, (machine_name,))
     except Exception:
         logger.error(
             f"An unexpected error has occured while trying to send a command to the runner at {connection.ip}:{connection.port}.",
             exc_info=1,
         )
+        writer.close()
 
 
-def establish_connection(host, port):
-    # Define the socket and bind it to the given host and port
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-    # Allow the socket to be reused after the program exits without waiting for the default timeout
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
-    sock.bind((host, port))
-
-    sock.listen(1000)
+async def start_handler(host, port) -> asyncio.Server:
+    """
+    Starts listening for runner connections on the running event loop.
+    """
+    server = await asyncio.start_server(handle_connection, host, port, reuse_address=True, backlog=1000)
 
     logger.info(f"Started listening for Runner connections on {host}:{port}...")
 
-    while True:
-        client_sock, addr = sock.accept()
-        logger.info(f"Received connection attempt from {addr[0]}:{addr[1]}.")
-
-        connection = Connection(addr[0], addr[1], client_sock, threading.Lock())
-        handle_connection(connection)
-
-
-def start_handler(host, port) -> threading.Thread:
-    thread = threading.Thread(target=establish_connection, args=(host, port), daemon=True)
-    thread.start()
-
-    return thread
+    return server
@@ -2,11 +2,13 @@
 This module containes the protocol used for communication between the judge server and the runner.
 """
 
-import json
+import asyncio
 
 from custom_logger import main_logger
 
 from .connection import Connection
+from .encoding import HEADER_SIZE, Encoding
+from .trace import trace_message
 
 logger = main_logger.getChild("protocol")
 
@@ -15,59 +17,70 @@ class Protocol:
     VERSION = "0.0.2"
 
     @staticmethod
-    def send(connection: Connection, message: dict):
+    async def send(connection: Connection, message: dict):
         """
-        Sends a JSON message. This function is thread-safe and locks the socket mutex.
+        Sends a message in the encoding of the connection. The frame is written in a single step, so concurrent sends do not interleave.
         """
 
-        ip = connection.ip
-        port = connection.port
-        sock = connection.sock
-        sock_lock = connection.sock_lock
+        writer = connection.writer
 
         message.update({"version": Protocol.VERSION})
-        json_message = json.dumps(message)
-        data = json_message.encode()
-        data_size = len(data)
+        frame = connection.encoding.encode(message)
 
-        with sock_lock:
-            logger.info(
-                f"Sending message {data} of size {data_size} bytes from {ip} on port {port}."
-            )
-            sock.sendall(data_size.to_bytes(4, byteorder="big"))
-            sock.sendall(data)
+        trace_message(True, connection, message, len(frame))
+        writer.write(frame)
+        await writer.drain()
 
     @staticmethod
-    def receive(connection: Connection) -> dict:
+    async def receive(connection: Connection) -> dict:
         """
-        Receives a JSON message.
+        Receives a message. If the peer sends an extended frame, its encoding is used for the messages sent back.
         """
 
-        sock = connection.sock
         ip = connection.ip
         port = connection.port
 
-        data = sock.recv(4)
-
-        if len(data) == 0:
-            raise ConnectionResetError(
-                f"The connection was closed by the peer with ip {ip} on port {port}!"
-            )
-
-        data_size = int.from_bytes(data, byteorder="big")
+        data = await Protocol._read(connection, 4)
+        data_size, extended = Encoding.parse_size(data)
 
         if data_size == 0:
             raise ValueError(f"The upcoming message from {ip} on {port} is of size 0!")
 
-        data = bytearray()
-        while len(data) < data_size:
-            read = sock.recv(data_size - len(data))
-            data.extend(read)
+        encoding = Encoding()
+        compressed = False
+        if extended:
+            encoding, compressed = Encoding.parse_header(await Protocol._read(connection, HEADER_SIZE))
+
+        data = await Protocol._read(connection, data_size)
+        message = encoding.decode(data, compressed)
+
+        if extended and encoding != connection.encoding:
+            logger.info(f"Switching to {encoding} for the connection with {ip} on port {port}.")
+            connection.encoding = encoding
+
+        trace_message(False, connection, message, data_size)
+        return Protocol._check_version(message)
 
-        logger.info(f"Received message {data} of size {data_size} bytes from {ip} on port {port}.")
-        message = json.loads(data)
+    @staticmethod
+    async def _read(connection: Connection, size: int) -> bytes:
+        """
+        Reads exactly the given amount of bytes from the connection.
+        """
+
+        try:
+            return await connection.reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            raise ConnectionResetError(
+                f"The connection was closed by the peer with ip {connection.ip} on port {connection.port}!"
+            )
+
+    @staticmethod
+    def _check_version(message: dict) -> dict:
+        """
+        Checks the protocol version of a received message.
+        """
 
-        if message["version"] is None:
+        if message.get("version") is None:
             raise ValueError("The sent message is missing the version of the protocol!")
 
         version = message["version"]
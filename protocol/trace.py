@@ -0,0 +1,57 @@
+"""
+This module contains the protocol trace, which logs a compact line per message and command.
+
+By default only the message id, command, size and timing are logged. Full payloads are only logged
+in debug mode, or for a sample of the messages.
+"""
+
+import logging
+import os
+import random
+
+from custom_logger import main_logger
+
+from .connection import Connection
+
+logger = main_logger.getChild("protocol.trace")
+
+# The level of the protocol trace, e.g. `WARNING` to turn it off
+logger.setLevel(os.getenv("PROTOCOL_TRACE_LEVEL", "INFO"))
+
+# Whether the full payload of every message is logged
+PROTOCOL_TRACE_PAYLOADS = os.getenv("PROTOCOL_TRACE_PAYLOADS", "False") == "True"
+
+# The fraction of messages of which the full payload is logged
+PROTOCOL_TRACE_SAMPLE_RATE = float(os.getenv("PROTOCOL_TRACE_SAMPLE_RATE", "0"))
+
+
+def capture_payload() -> bool:
+    """
+    Whether the payload of the next message should be logged.
+    """
+    return PROTOCOL_TRACE_PAYLOADS or (PROTOCOL_TRACE_SAMPLE_RATE > 0 and random.random() < PROTOCOL_TRACE_SAMPLE_RATE)
+
+
+def trace_message(sent: bool, connection: Connection, message: dict, size: int):
+    """
+    Trace a message sent to or received from the peer of the given connection.
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+
+    direction = "->" if sent else "<-"
+    command = message.get("command", "response")
+    logger.info("%s %s:%s id=%s command=%s size=%d", direction, connection.ip, connection.port, message.get("id"), command, size)
+
+    if capture_payload():
+        logger.info("%s %s:%s id=%s payload=%s", direction, connection.ip, connection.port, message.get("id"), message)
+
+
+def trace_command(connection: Connection, command_id: int | str, command_name: str, duration: float, error: BaseException = None):
+    """
+    Trace the completion of a command, with the time in seconds it took from sending or receiving it until its response.
+    """
+    if error is None:
+        logger.info("%s:%s id=%s command=%s took %.3fs", connection.ip, connection.port, command_id, command_name, duration)
+    else:
+        logger.info("%s:%s id=%s command=%s failed after %.3fs (%r)", connection.ip, connection.port, command_id, command_name, duration, error)
@@ -2,6 +2,8 @@
 This module contains the CheckCommand class.
 """
 
+from protocol.encoding import supported_encodings
+
 from .command import Command
 
 
@@ -12,4 +14,5 @@ class CheckCommand(Command):
 
     @staticmethod
     async def execute(args: dict):
-        return {"status": "ok"}
+        # Advertise the encodings the website may switch to
+        return {"status": "ok", "encodings": supported_encodings()}
@@ -14,6 +14,6 @@ class Command(ABC):
     @abstractmethod
     async def execute(args: dict) -> dict:
         """
-        Executes the command. It is recommended to call this in a separate thread.
+        Executes the command. It is run as a task on the event loop of the website protocol handler.
         """
         pass
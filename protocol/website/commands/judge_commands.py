@@ -5,7 +5,9 @@ This module contains the Commands class.
 from enum import Enum
 
 from .check_command import CheckCommand
+from .poll_command import PollCommand
 from .start_command import StartCommand
+from .submit_command import SubmitCommand
 
 
 class Commands(Enum):
@@ -22,3 +24,13 @@ class Commands(Enum):
     """
     Checks the status of the runner.
     """
+
+    SUBMIT = SubmitCommand()
+    """
+    Start evaluating a judge request as a job, replying with its job id right away.
+    """
+
+    POLL = PollCommand()
+    """
+    Collect the events of a job.
+    """
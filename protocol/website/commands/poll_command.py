@@ -0,0 +1,22 @@
+"""
+This module contains the PollCommand class.
+"""
+
+from jobs import job_manager
+
+from .command import Command
+
+
+class PollCommand(Command):
+    """
+    The PollCommand class is used to collect the events of a job after the given sequence number,
+    e.g. the ones missed while the website was disconnected.
+    """
+
+    @staticmethod
+    async def execute(args: dict):
+        job = job_manager.get(args["job_id"])
+        if job is None:
+            return {"status": "error", "cause": "unknown_job"}
+
+        return {"status": "ok", "job_status": job.status.name.lower(), "events": job.events_since(args.get("since", 0))}
@@ -13,6 +13,30 @@ from .command import Command
 logger = main_logger.getChild("start_command")
 
 
+def parse_judge_request(args: dict) -> JudgeRequest:
+    """
+    Create the judge request described by the arguments of a START or SUBMIT command.
+    """
+    # Deserialization of the arguments
+    evaluation_settings: dict = args["evaluation_settings"]
+    benchmark_instances: dict[str, str] = args["benchmark_instances"] # dict of ID to URL
+    submission_url: str = args["submission_url"]
+    validator_url: str = args["validator_url"]
+
+    # Extract relevant part of the evaluation settings
+    machine_type = MachineType.from_name(evaluation_settings["machine_type"])
+    cpus = evaluation_settings["cpu"]
+    memory = evaluation_settings["memory"]
+    priority = evaluation_settings.get("priority", 0)
+    competition_id = args.get("competition_id")
+
+    # Form models for the judge request
+    submission_type = SubmissionType.CODE
+    submission = Submission(submission_type, submission_url, validator_url)
+    return JudgeRequest(submission, machine_type, cpus, memory, evaluation_settings, benchmark_instances,
+                        priority=priority, competition_id=competition_id)
+
+
 class StartCommand(Command):
     """
     The StartCommand class is used to start a container on the runner.
@@ -20,28 +44,17 @@ class StartCommand(Command):
 
     @staticmethod
     async def execute(args: dict):
-        # Deserialization of the arguments
-        evaluation_settings: dict = args["evaluation_settings"]
-        benchmark_instances: dict[str, str] = args["benchmark_instances"] # dict of ID to URL
-        submission_url: str = args["submission_url"]
-        validator_url: str = args["validator_url"]
-
-        # Extract relevant part of the evaluation settings
-        machine_type = MachineType.from_name(evaluation_settings["machine_type"])
-        cpus = evaluation_settings["cpu"]
-        memory = evaluation_settings["memory"]
-
-        # Form models for the judge request
-        submission_type = SubmissionType.CODE
-        submission = Submission(submission_type, submission_url, validator_url)
-        judge_request = JudgeRequest(submission, machine_type, cpus, memory, evaluation_settings, benchmark_instances)
+        judge_request = parse_judge_request(args)
 
         # Submit the request to the evaluator
         try:
             judge_result = await evaluators.get_instance().submit(judge_request)
 
             if judge_result.result is not None:
-                return {"status": "ok", "result": judge_result.result}
+                response = {"status": "ok", "result": judge_result.result}
+                if len(judge_result.metadata) > 0:
+                    response["metadata"] = judge_result.metadata
+                return response
             else:
                 return {"status": "error", "cause": judge_result.cause}
         except Exception:
@@ -0,0 +1,21 @@
+"""
+This module contains the SubmitCommand class.
+"""
+
+from jobs import job_manager
+
+from .command import Command
+from .start_command import parse_judge_request
+
+
+class SubmitCommand(Command):
+    """
+    The SubmitCommand class is used to start evaluating a judge request as a job, replying with the job id right away.
+    The progress and outcome of the job are pushed as events, and can be collected with the POLL command.
+    """
+
+    @staticmethod
+    async def execute(args: dict):
+        job = job_manager.submit(parse_judge_request(args))
+
+        return {"status": "ok", "job_id": job.job_id}
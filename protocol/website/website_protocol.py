@@ -2,11 +2,13 @@
 This module containes the WebsiteProtocol class.
 """
 
+import time
+
 from custom_logger import main_logger
 from protocol import Connection, Protocol
+from protocol.trace import trace_command
 
 from .commands import Commands
-from .commands.command import Command
 
 logger = main_logger.getChild("website")
 
@@ -21,19 +23,17 @@ class WebsiteProtocol(Protocol):
     def __init__(self, connection: Connection):
         self.connection = connection
 
-    def receive_command(self) -> tuple[Command, dict]:
+    async def receive_command(self) -> tuple[str, str, dict]:
         """
         Handles the incoming commands from the website.
         """
 
-        message = Protocol.receive(self.connection)
+        message = await Protocol.receive(self.connection)
 
         command_id = message["id"]
         command_name = message["command"]
         command_args = message["args"]
 
-        logger.info(f"Received command: {command_name} with args: {command_args}")
-
         return command_id, command_name, command_args
 
     async def handle_command(self, command_id: str, command_name: str, args: dict):
@@ -41,6 +41,7 @@ class WebsiteProtocol(Protocol):
         Handles the incoming commands from the website.
         """
 
+        start = time.monotonic()
         try:
             if command_name not in Commands.__members__:
                 logger.error(f"Received unknown command: {command_name}")
@@ -49,15 +50,23 @@ class WebsiteProtocol(Protocol):
             command = Commands[command_name].value
             response = await command.execute(args)
             message = {"id": command_id, "response": response}
-            Protocol.send(self.connection, message)
+            await Protocol.send(self.connection, message)
 
-            logger.info(f"Sent response: {response}")
+            trace_command(self.connection, command_id, command_name, time.monotonic() - start)
 
         except Exception as e:
-            if e is ConnectionResetError or e is ConnectionAbortedError:
+            if isinstance(e, (ConnectionResetError, ConnectionAbortedError)):
                 raise e
 
             logger.error(
                 f"An unexpected error has occured while trying to execute command {command_name}!",
                 exc_info=1,
             )
+
+    async def send_event(self, event: dict):
+        """
+        Pushes an event, e.g. the progress of a job, to the website.
+        """
+
+        # Send a copy, as the event is also kept for polling
+        await Protocol.send(self.connection, dict(event))
@@ -3,116 +3,148 @@ The main class of the website protocol server. It handles the connection to the
 """
 
 import asyncio
-import socket
-import threading
+import os
 
 from custom_logger import main_logger
+from jobs import job_manager
 
 from .protocol import Connection
 from .website.website_protocol import WebsiteProtocol
 
 logger = main_logger.getChild("website_protocol_handler")
 
+# The maximum amount of website commands executed at the same time, further commands are not read until one finishes
+WEBSITE_MAX_CONCURRENT_COMMANDS = int(os.getenv("WEBSITE_MAX_CONCURRENT_COMMANDS", "100"))
+
 
 class ProtocolHandler:
+    """
+    Serves the website connection on the event loop it was started on, executing every command as a task.
+    """
+
     host: str
     port: int
-    connect_retry_timeout: float
-    debug: bool
-    threads: list[threading.Thread]
-    connection: Connection
-    protocol: WebsiteProtocol
-
-    def __init__(self, host: str, port: int, connect_retry_timeout: float = 5, debug: bool = False):
+    loop: asyncio.AbstractEventLoop
+    server: asyncio.Server
+    semaphore: asyncio.Semaphore
+    """
+    Bounds the amount of commands executed at the same time.
+    """
+    tasks: set[asyncio.Task]
+    connection: Connection = None
+    protocol: WebsiteProtocol = None
+
+    def __init__(self, host: str, port: int, max_concurrent_commands: int = WEBSITE_MAX_CONCURRENT_COMMANDS):
         self.host = host
         self.port = port
-        self.connect_retry_timeout = connect_retry_timeout
-        self.debug = debug
-        self.threads = []
+        self.semaphore = asyncio.Semaphore(max_concurrent_commands)
+        self.tasks = set()
 
-    def start(self):
+    async def start(self) -> asyncio.Server:
         """
-        Starts the connection to the website server. In case of a unexpected disconnection, it retries to connect.
+        Starts listening for the connection of the website server. After a disconnection, the website can connect again.
         """
 
-        while True:
-            try:
-                # Define the socket and bind it to the given host and port
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port, reuse_address=True)
 
-                # Allow the socket to be reused after the program exits without waiting for the default timeout
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Push the events of jobs to the connected website
+        job_manager.add_event_listener(self.on_job_event)
 
-                sock.bind((self.host, self.port))
-                sock.listen(1)
+        logger.info(f"Started listening for the Website connection on {self.host}:{self.port}...")
+        return self.server
 
-                logger.info(f"Started listening for the Website connection on {self.host}:{self.port}...")
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Handles a single connection of the website server.
+        """
 
-                client_sock, addr = sock.accept()
-                logger.info(f"Received website connection from {addr[0]}:{addr[1]}.")
+        ip, port = writer.get_extra_info("peername")[:2]
+        logger.info(f"Received website connection from {ip}:{port}.")
+
+        # Only a single website is served, a new connection replaces a stale one
+        if self.connection is not None:
+            logger.info(f"Closing the previous website connection from {self.connection.ip}:{self.connection.port}.")
+            self.connection.writer.close()
 
-                self.connection = Connection(addr[0], addr[1], client_sock, threading.Lock())
-                self.protocol = WebsiteProtocol(self.connection)
-                self._handle_commands()
+        connection = Connection(ip, port, reader, writer)
+        protocol = WebsiteProtocol(connection)
+        self.connection = connection
+        self.protocol = protocol
 
-            except (ConnectionRefusedError, ConnectionResetError) as e:
-                self.connection = None
-                logger.info(f"Website disconnected! ({e})")
+        try:
+            await self._handle_commands(protocol)
 
-            finally:
-                self.stop()
+        except (ConnectionRefusedError, ConnectionResetError) as e:
+            logger.info(f"Website disconnected! ({e})")
 
-    def _handle_commands(self):
+        except Exception:
+            logger.error("An unexpected error has occured while handling the website connection!", exc_info=1)
+
+        finally:
+            self.stop(connection)
+
+    async def _handle_commands(self, protocol: WebsiteProtocol):
         """
         Handles the incoming commands from the website server.
         """
 
         while True:
-            command_id, command_name, command_args = self.protocol.receive_command()
-
-            thread = self._run_future_off_thread(
-                self.protocol.handle_command(command_id, command_name, command_args)
-            )
-
-            self.threads.append(thread)
+            # Stop reading commands while the maximum amount is being executed, applying backpressure to the website
+            await self.semaphore.acquire()
 
-    def _run_future_off_thread(self, future) -> threading.Thread:
+            try:
+                command_id, command_name, command_args = await protocol.receive_command()
+            except BaseException:
+                self.semaphore.release()
+                raise
+
+            task = asyncio.create_task(self._execute_command(protocol, command_id, command_name, command_args))
+
+            # Keep a reference to the task until it is done, so it is not garbage collected
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _execute_command(self, protocol: WebsiteProtocol, command_id: str, command_name: str, command_args: dict):
+        try:
+            await protocol.handle_command(command_id, command_name, command_args)
+        except (ConnectionResetError, ConnectionAbortedError) as e:
+            logger.info(f"Could not send the response of command {command_name}, the website disconnected! ({e})")
+        finally:
+            self.semaphore.release()
+
+    def on_job_event(self, event: dict):
         """
-        Runs the given future in a separate thread, returning the thread object.
+        Listener for job events, which can be called from any thread.
         """
+        self.loop.call_soon_threadsafe(self._push_event, event)
 
-        # Entrypoint for command execution thread, sets event loop and runs with the future until completion
-        def run_event_loop(loop: asyncio.AbstractEventLoop, future):
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(future)
-
-        # Create a new event loop
-        new_loop = asyncio.new_event_loop()
+    def _push_event(self, event: dict):
+        # Without a website connection, the website collects the events with the POLL command after reconnecting
+        if self.protocol is None:
+            return
 
-        # Start the event loop in a new thread, starting the command handling future
-        thread = threading.Thread(target=run_event_loop, args=(new_loop, future), daemon=True)
-        thread.start()
+        task = asyncio.create_task(self._send_event(self.protocol, event))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
 
-        return thread
+    async def _send_event(self, protocol: WebsiteProtocol, event: dict):
+        try:
+            await protocol.send_event(event)
+        except (ConnectionResetError, ConnectionAbortedError) as e:
+            logger.info(f"Could not push {event['event']} event, the website disconnected! ({e})")
 
-    def stop(self):
+    def stop(self, connection: Connection):
         """
-        Closes the connection to the website server.
+        Closes the given connection to the website server. Commands that are still running finish in the background.
         """
 
-        for thread in self.threads:
-            thread.join()
-        self.threads.clear()
-        if self.connection is not None:
-            sock = self.connection.sock
-            sock.shutdown(socket.SHUT_RDWR)
-            sock.close()
-        self.connection = None
+        connection.writer.close()
+        if self.connection is connection:
+            self.connection = None
+            self.protocol = None
 
 
-def start_handler(host, port) -> threading.Thread:
+async def start_handler(host: str, port: int) -> asyncio.Server:
     protocol_handler = ProtocolHandler(host, port)
-    thread = threading.Thread(target=protocol_handler.start, daemon=True)
-    thread.start()
-
-    return thread
+    return await protocol_handler.start()
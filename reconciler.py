@@ -0,0 +1,138 @@
+"""
+This module contains the Reconciler class, which loads the VMs of the VMSS's at startup and keeps them up to date in the background.
+"""
+
+import asyncio
+import os
+import time
+from typing import TYPE_CHECKING
+
+from custom_logger import main_logger
+from protocol import judge_protocol_handler
+
+if TYPE_CHECKING:
+    from azureevaluator import AzureEvaluator, JudgeVMSS
+
+# Initialize the logger
+logger = main_logger.getChild("reconciler")
+
+# The time in seconds between two listings of the VMs in Azure
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "30"))
+
+# The time in seconds startup waits for the runners of existing VMs to connect, runners connecting later are registered in the background
+STARTUP_CONNECT_TIMEOUT = float(os.getenv("STARTUP_CONNECT_TIMEOUT", "30"))
+
+
+class Reconciler:
+    """
+    Keeps the judgevm_dict of every VMSS current, from Azure listings on an interval and from runner connection events,
+    after loading the existing VMs at startup.
+
+    This keeps Azure calls and health checks off the request path, so placement is a pure in-memory lookup.
+    """
+
+    evaluator: 'AzureEvaluator'
+    interval: float
+    loop: asyncio.AbstractEventLoop = None
+    wakeup: asyncio.Event
+    task: asyncio.Task = None
+
+    def __init__(self, evaluator: 'AzureEvaluator', interval: float = RECONCILE_INTERVAL):
+        self.evaluator = evaluator
+        self.interval = interval
+
+    def start(self, reconcile_now: bool = True):
+        """
+        Start the reconciler on the running event loop, the first reconciliation is done straight away unless `reconcile_now` is false,
+        e.g. because the vms have just been loaded.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        if reconcile_now:
+            self.wakeup.set()
+        self.task = self.loop.create_task(self.run())
+
+        judge_protocol_handler.add_connection_listener(self.on_connection)
+
+    def stop(self):
+        """
+        Stop reconciling, and stop listening for runner connections.
+        """
+        judge_protocol_handler.remove_connection_listener(self.on_connection)
+        if self.task is not None:
+            self.task.cancel()
+
+    async def preload(self, timeout: float):
+        """
+        Load the vms and vm sizes of all vmss's concurrently at startup, waiting up to `timeout` seconds for the runners of the vms to connect.
+        """
+        start = time.monotonic()
+        judgevmsss = list(self.evaluator.judgevmss_dict.values())
+        results = await asyncio.gather(*(self.preload_vmss(judgevmss, timeout) for judgevmss in judgevmsss), return_exceptions=True)
+
+        for judgevmss, result in zip(judgevmsss, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to load the VMs of VMSS {judgevmss.judgevmss_name}", exc_info=result)
+
+        ready = sum(len(judgevmss.judgevm_dict) for judgevmss in judgevmsss)
+        connecting = sum(len(judgevmss.registrations) for judgevmss in judgevmsss)
+        logger.info(f"Loaded {ready} VMs of {len(judgevmsss)} VMSS's in {time.monotonic() - start:.2f}s, "
+                    f"{connecting} VMs are still waiting for their runner to connect")
+
+    async def preload_vmss(self, judgevmss: 'JudgeVMSS', timeout: float):
+        """
+        Load the vms and the vm size of a single vmss, waiting up to `timeout` seconds for the runners of the vms to connect.
+        Vms of which the runner connects later are registered in the background as usual.
+        """
+        await asyncio.gather(judgevmss.get_sku_size(), judgevmss.reconcile())
+
+        registrations = list(judgevmss.registrations.values())
+        if len(registrations) > 0:
+            await asyncio.wait(registrations, timeout=timeout)
+
+    def trigger(self):
+        """
+        Reconcile as soon as possible. Can be called from any thread.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def on_connection(self, machine_name: str, connected: bool):
+        """
+        Listener for runner connection events, called on the event loop of the judge protocol handler.
+        """
+        self.loop.call_soon_threadsafe(self.handle_connection, machine_name, connected)
+
+    def handle_connection(self, machine_name: str, connected: bool):
+        judgevmsss = list(self.evaluator.judgevmss_dict.values())
+
+        if not connected:
+            # The runner is gone, so requests should no longer be placed on its VM
+            for judgevmss in judgevmsss:
+                judgevmss.remove_machine(machine_name)
+            return
+
+        # Runners of VMs that are already being registered are picked up by their registration,
+        # other runners belong to VMs that are not known yet
+        known = any(judgevm.machine_name == machine_name
+                    for judgevmss in judgevmsss for judgevm in list(judgevmss.judgevm_dict.values()))
+        if not known:
+            self.wakeup.set()
+
+    async def run(self):
+        """
+        The main loop of the reconciler.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+            except TimeoutError:
+                pass
+            self.wakeup.clear()
+
+            judgevmsss = list(self.evaluator.judgevmss_dict.values())
+            results = await asyncio.gather(*(judgevmss.reconcile() for judgevmss in judgevmsss), return_exceptions=True)
+
+            for judgevmss, result in zip(judgevmsss, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to reconcile VMSS {judgevmss.judgevmss_name}", exc_info=result)
@@ -0,0 +1,218 @@
+"""
+This module contains the ResultCache class, which stores the results of judge requests by a hash of their contents,
+so identical requests do not have to be evaluated again.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from custom_logger import main_logger
+from models import JudgeRequest, JudgeResult
+
+# Initialize the logger
+logger = main_logger.getChild("result_cache")
+
+# The maximum amount of results kept in the cache, 0 to disable the cache
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+
+# The time in seconds after which a cached result expires
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "86400"))
+
+# The SQLite database in which the results are persisted, or empty to only keep them in memory
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "")
+
+# Whether results are cached per `request`, or per benchmark `instance` so requests with overlapping instances share results
+RESULT_CACHE_GRANULARITY = os.getenv("RESULT_CACHE_GRANULARITY", "request")
+
+IGNORED_SETTINGS = ("priority", "cache")
+"""
+The evaluation settings that do not influence the result of a request.
+"""
+
+
+def is_cacheable(judge_request: JudgeRequest) -> bool:
+    """
+    Check whether the result of the given judge request may be shared with other requests,
+    requests opt out by setting `cache` to false in their evaluation settings.
+    """
+    return judge_request.evaluation_settings.get("cache", True) is not False
+
+
+def request_key(judge_request: JudgeRequest, benchmark_instances: dict[str, str] = None) -> str:
+    """
+    Get the canonical hash of the contents of a judge request, which is the same for identical requests.
+    Optionally, the hash is taken over the given benchmark instances instead of those of the request.
+    """
+    if benchmark_instances is None:
+        benchmark_instances = judge_request.benchmark_instances
+
+    content = {
+        "submission_url": judge_request.submission.source_url,
+        "validator_url": judge_request.submission.validator_url,
+        "machine_type": judge_request.machine_type.name,
+        "cpus": judge_request.cpus,
+        "memory": judge_request.memory,
+        "evaluation_settings": {key: value for key, value in judge_request.evaluation_settings.items() if key not in IGNORED_SETTINGS},
+        "benchmark_instances": benchmark_instances,
+    }
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def instance_key(judge_request: JudgeRequest, instance_id: str) -> str:
+    """
+    Get the canonical hash of a single benchmark instance of a judge request.
+    """
+    return request_key(judge_request, {instance_id: judge_request.benchmark_instances[instance_id]})
+
+
+class MemoryStore:
+    """
+    Keeps the cached results in memory, evicting the least recently used results.
+    """
+
+    size: int
+    entries: collections.OrderedDict[str, tuple[float, dict]]
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries = collections.OrderedDict()
+
+    def get(self, key: str) -> tuple[float, dict] | None:
+        """
+        Get the time at which the result was stored and the result, or None if it is not cached.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+
+        return entry
+
+    def put(self, key: str, value: dict):
+        self.entries[key] = (time.time(), value)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def remove(self, key: str):
+        self.entries.pop(key, None)
+
+
+class SQLiteStore:
+    """
+    Persists the cached results in a SQLite database, evicting the least recently used results.
+    """
+
+    size: int
+    database: sqlite3.Connection
+
+    def __init__(self, path: str, size: int):
+        self.size = size
+        self.database = sqlite3.connect(path, isolation_level=None)
+        self.database.execute("PRAGMA journal_mode=WAL")
+        self.database.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, stored_at REAL, used_at REAL)")
+
+    def get(self, key: str) -> tuple[float, dict] | None:
+        row = self.database.execute("SELECT stored_at, value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        self.database.execute("UPDATE results SET used_at = ? WHERE key = ?", (time.time(), key))
+        return row[0], json.loads(row[1])
+
+    def put(self, key: str, value: dict):
+        now = time.time()
+        self.database.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, json.dumps(value), now, now))
+        self.database.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used_at DESC LIMIT -1 OFFSET ?)", (self.size,))
+
+    def remove(self, key: str):
+        self.database.execute("DELETE FROM results WHERE key = ?", (key,))
+
+
+class ResultCache:
+    """
+    Caches the successful results of judge requests, per request or per benchmark instance.
+    """
+
+    size: int
+    ttl: float
+    granularity: str
+    store: MemoryStore | SQLiteStore
+
+    def __init__(self, size: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL, path: str = RESULT_CACHE_PATH,
+                 granularity: str = RESULT_CACHE_GRANULARITY):
+        if granularity not in ("request", "instance"):
+            raise ValueError(f"Unknown result cache granularity `{granularity}`")
+
+        self.size = size
+        self.ttl = ttl
+        self.granularity = granularity
+        self.store = SQLiteStore(path, size) if path != "" else MemoryStore(size)
+
+    def get(self, key: str) -> dict | None:
+        """
+        Get the cached result with the given key, or None if it is not cached or has expired.
+        """
+        entry = self.store.get(key)
+        if entry is None:
+            return None
+
+        stored_at, value = entry
+        if time.time() - stored_at >= self.ttl:
+            self.store.remove(key)
+            return None
+
+        return value
+
+    def lookup(self, judge_request: JudgeRequest) -> tuple[dict, JudgeRequest | None]:
+        """
+        Look up the results of the given judge request. Returns the cached results per benchmark instance,
+        and the request that still has to be evaluated, or None if everything is cached.
+        """
+        if self.size == 0:
+            return {}, judge_request
+
+        if self.granularity == "request":
+            result = self.get(request_key(judge_request))
+            return ({}, judge_request) if result is None else (result, None)
+
+        cached = {}
+        missing = {}
+        for instance_id, url in judge_request.benchmark_instances.items():
+            result = self.get(instance_key(judge_request, instance_id))
+            if result is None:
+                missing[instance_id] = url
+            else:
+                cached[instance_id] = result
+
+        if len(missing) == 0:
+            return cached, None
+        if len(cached) == 0:
+            return cached, judge_request
+
+        logger.info(f"Found {len(cached)} of {len(judge_request.benchmark_instances)} benchmark instances in the result cache")
+        return cached, judge_request.subset(missing)
+
+    def store_result(self, judge_request: JudgeRequest, judge_result: JudgeResult):
+        """
+        Store the result of an evaluated judge request, if it was successful.
+        """
+        if self.size == 0 or judge_result.result is None:
+            return
+
+        # Only results of the requested machine type are shared, so a cached result never hides a substitution
+        if "substituted_for" in judge_result.metadata:
+            return
+
+        if self.granularity == "request":
+            self.store.put(request_key(judge_request), judge_result.result)
+            return
+
+        for instance_id, result in judge_result.result.items():
+            if instance_id in judge_request.benchmark_instances:
+                self.store.put(instance_key(judge_request, instance_id), result)
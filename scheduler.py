@@ -0,0 +1,347 @@
+"""
+This module contains the Scheduler class, which queues pending judge requests and packs them onto VMs.
+"""
+
+import collections
+import concurrent.futures
+import os
+import threading
+import time
+from typing import Callable, Iterable
+
+import metrics
+from custom_logger import main_logger
+from models import JudgeRequest, MachineType
+
+# Initialize the logger
+logger = main_logger.getChild("scheduler")
+
+# The placement policy, either `best_fit` (pack VMs as full as possible) or `worst_fit` (spread over VMs)
+SCHEDULER_POLICY = os.getenv("SCHEDULER_POLICY", "best_fit")
+
+# The time in seconds after which a job that does not fit anywhere stops smaller jobs from overtaking it
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", "300"))
+
+# The time in seconds a job waits for placement before it fails, e.g. because no VMs can be added, 0 to wait indefinitely
+SCHEDULER_PLACEMENT_TIMEOUT = float(os.getenv("SCHEDULER_PLACEMENT_TIMEOUT", "3600"))
+
+PLACEMENT_LATENCY = metrics.histogram("judgequeuer_placement_latency_seconds",
+                                      "The time judge requests wait in the queue before being placed on a VM", ("machine_type",))
+
+
+class UnplaceableError(Exception):
+    """
+    Raised for a job that can never be placed, as it needs more resources than a single VM of its machine type has.
+    """
+
+
+class PendingJob:
+    """
+    A judge request that is waiting to be placed on a VM.
+    """
+
+    judge_request: JudgeRequest
+    round: int
+    """
+    The fairness round of the job, jobs of different competitions take turns per round.
+    """
+    sequence: int
+    enqueued_at: float
+    future: concurrent.futures.Future
+    """
+    Resolved with the VM the job has been placed on, can be awaited from any thread or event loop.
+    """
+
+    def __init__(self, judge_request: JudgeRequest, round: int, sequence: int):
+        self.judge_request = judge_request
+        self.round = round
+        self.sequence = sequence
+        self.enqueued_at = time.monotonic()
+        self.future = concurrent.futures.Future()
+
+    def sort_key(self) -> tuple:
+        """
+        The key on which jobs are ordered: highest priority first, then by fairness round, then FIFO.
+        """
+        return (-self.judge_request.priority, self.round, self.sequence)
+
+    def is_placed(self) -> bool:
+        return self.future.done() and not self.future.cancelled()
+
+
+class JobQueue:
+    """
+    The queue of pending jobs for a single machine type.
+    """
+
+    jobs: list[PendingJob]
+    competition_rounds: dict[str | None, int]
+    """
+    The next fairness round for each competition.
+    """
+    current_round: int
+    """
+    The round of the last placed job, newly arriving competitions start from this round.
+    """
+    arrivals: collections.deque[tuple[float, JudgeRequest]]
+    """
+    The arrival times of recent requests, used to predict demand.
+    """
+    placed_count: int
+    total_wait: float
+    max_wait: float
+
+    def __init__(self):
+        self.jobs = []
+        self.competition_rounds = {}
+        self.current_round = 0
+        self.arrivals = collections.deque()
+        self.placed_count = 0
+        self.total_wait = 0
+        self.max_wait = 0
+
+    def push(self, judge_request: JudgeRequest, sequence: int) -> PendingJob:
+        """
+        Add a judge request to the queue.
+        """
+        competition_id = judge_request.competition_id
+        round = max(self.competition_rounds.get(competition_id, 0), self.current_round)
+        self.competition_rounds[competition_id] = round + 1
+
+        job = PendingJob(judge_request, round, sequence)
+        self.jobs.append(job)
+        self.arrivals.append((job.enqueued_at, judge_request))
+        return job
+
+    def recent_arrivals(self, window: float) -> list[JudgeRequest]:
+        """
+        Get the requests that arrived in the last `window` seconds.
+        """
+        threshold = time.monotonic() - window
+        while len(self.arrivals) > 0 and self.arrivals[0][0] < threshold:
+            self.arrivals.popleft()
+
+        return [judge_request for _, judge_request in self.arrivals]
+
+    def remove(self, job: PendingJob):
+        self.jobs.remove(job)
+
+    def ordered(self) -> list[PendingJob]:
+        """
+        Get the pending jobs in the order in which they should be placed.
+        """
+        return sorted(self.jobs, key=PendingJob.sort_key)
+
+    def record_placement(self, job: PendingJob) -> float:
+        """
+        Remove a job from the queue as it has been placed, returning the time it has waited.
+        """
+        self.remove(job)
+        self.current_round = max(self.current_round, job.round)
+
+        wait = time.monotonic() - job.enqueued_at
+        self.placed_count += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        return wait
+
+    def __len__(self) -> int:
+        return len(self.jobs)
+
+
+class Scheduler:
+    """
+    Keeps a queue of pending judge requests per machine type and packs them onto VMs by free CPU and memory.
+
+    All methods should be called while holding the lock, which also guards the reservations on the VMs.
+    """
+
+    policy: str
+    max_wait: float
+    placement_timeout: float | None
+    """
+    The time in seconds a job waits for placement before it fails, or None to wait indefinitely.
+    """
+    queues: dict[MachineType, JobQueue]
+    lock: threading.Lock
+    sequence: int
+    pending_listener: Callable[[MachineType], None] = None
+
+    def __init__(self, policy: str = SCHEDULER_POLICY, max_wait: float = SCHEDULER_MAX_WAIT, placement_timeout: float = SCHEDULER_PLACEMENT_TIMEOUT):
+        if policy not in ("best_fit", "worst_fit"):
+            raise ValueError(f"Unknown scheduler policy `{policy}`")
+
+        self.policy = policy
+        self.max_wait = max_wait
+        self.placement_timeout = placement_timeout if placement_timeout > 0 else None
+        self.queues = {}
+        self.lock = threading.Lock()
+        self.sequence = 0
+
+    def set_pending_listener(self, pending_listener: Callable[[MachineType], None]):
+        """
+        Set the listener that is called when a request could not be placed right away.
+        """
+        if self.pending_listener is not None:
+            raise ValueError("Pending listener is already set!")
+
+        self.pending_listener = pending_listener
+
+    def notify_pending(self, machine_type: MachineType):
+        """
+        Notify the pending listener that a request of the given machine type is waiting for capacity.
+        Can be called without holding the lock.
+        """
+        if self.pending_listener is not None:
+            self.pending_listener(machine_type)
+
+    def enqueue(self, judge_request: JudgeRequest) -> PendingJob:
+        """
+        Add a judge request to the queue of its machine type.
+        """
+        queue = self.queues.setdefault(judge_request.machine_type, JobQueue())
+
+        self.sequence += 1
+        return queue.push(judge_request, self.sequence)
+
+    def dispatch(self, machine_type: MachineType, judgevms: Iterable) -> list[PendingJob]:
+        """
+        Place as many pending jobs of the given machine type as possible on the given VMs.
+        Returns the jobs that have been placed.
+        """
+        queue = self.queues.get(machine_type)
+        if queue is None or len(queue) == 0:
+            return []
+
+        judgevms = list(judgevms)
+        placed = []
+        for job in queue.ordered():
+            # Jobs of which the waiter is gone are removed by `cancel`, they should not take up resources meanwhile
+            if job.future.done():
+                continue
+
+            judgevm = self.select_vm(job.judge_request, judgevms)
+
+            if judgevm is None:
+                # Let smaller jobs fill up the gaps, unless this job has been waiting for too long
+                if time.monotonic() - job.enqueued_at > self.max_wait:
+                    break
+                continue
+
+            judgevm.reserve(job.judge_request)
+            wait = queue.record_placement(job)
+            job.future.set_result(judgevm)
+            PLACEMENT_LATENCY.labels(machine_type.name).observe(wait)
+            placed.append(job)
+
+            logger.info(f"Placed judge request on VM {judgevm.machine_name} after waiting {wait:.2f}s ({len(queue)} pending)")
+
+        return placed
+
+    def select_vm(self, judge_request: JudgeRequest, judgevms: list):
+        """
+        Select the VM to place the judge request on according to the policy, or None if it does not fit anywhere.
+        """
+        candidates = [judgevm for judgevm in judgevms if self.fits(judge_request, judgevm)]
+
+        # Go back to the preferred VM if it has room, e.g. the one that already fetched the submission
+        for judgevm in candidates:
+            if judgevm.machine_name == judge_request.preferred_machine_name:
+                return judgevm
+
+        best_vm = None
+        best_score = None
+        for judgevm in candidates:
+            # The fraction of the VM that would be left over after placing the request
+            score = ((judgevm.free_cpu - judge_request.cpus) / judgevm.cpus
+                     + (judgevm.free_memory - judge_request.memory) / judgevm.memory) / 2
+
+            if self.policy == "worst_fit":
+                score = -score
+
+            if best_score is None or score < best_score:
+                best_vm = judgevm
+                best_score = score
+
+        return best_vm
+
+    def fits(self, judge_request: JudgeRequest, judgevm) -> bool:
+        """
+        Check whether the judge request can be placed on the given VM.
+        """
+        if not judgevm.check_capacity(judge_request.cpus, judge_request.memory):
+            return False
+
+        # The parts of a split request are spread over different VMs
+        if judge_request.parent is not None and any(task.parent is judge_request.parent for task in judgevm.tasks):
+            return False
+
+        return True
+
+    def reject_unplaceable(self, machine_type: MachineType, cpus: int, memory: int) -> list[PendingJob]:
+        """
+        Fail the pending jobs of the given machine type that need more than the given cpus or memory of a single VM.
+        Returns the jobs that have been rejected.
+        """
+        queue = self.queues.get(machine_type)
+        if queue is None:
+            return []
+
+        rejected = [job for job in queue.jobs if job.judge_request.cpus > cpus or job.judge_request.memory > memory]
+        for job in rejected:
+            queue.remove(job)
+            if not job.future.done():
+                job.future.set_exception(UnplaceableError(f"The judge request needs {job.judge_request.cpus} cpus and {job.judge_request.memory}MB "
+                                                          f"of memory, but a VM of {machine_type.name} has {cpus} cpus and {memory}MB"))
+
+        return rejected
+
+    def cancel(self, job: PendingJob):
+        """
+        Remove a job that is no longer waiting for placement from its queue.
+        If it was already placed, the reservation is returned to the VM.
+        """
+        queue = self.queues[job.judge_request.machine_type]
+        if job in queue.jobs:
+            queue.remove(job)
+
+        if job.is_placed():
+            job.future.result().release(job.judge_request)
+        else:
+            job.future.cancel()
+
+    def pending_requests(self, machine_type: MachineType) -> list[JudgeRequest]:
+        """
+        Get the judge requests that are waiting for placement on the given machine type.
+        """
+        queue = self.queues.get(machine_type)
+        return [] if queue is None else [job.judge_request for job in queue.jobs]
+
+    def recent_arrivals(self, machine_type: MachineType, window: float) -> list[JudgeRequest]:
+        """
+        Get the judge requests of the given machine type that arrived in the last `window` seconds.
+        """
+        queue = self.queues.get(machine_type)
+        return [] if queue is None else queue.recent_arrivals(window)
+
+    def queue_depth(self, machine_type: MachineType) -> int:
+        """
+        Get the amount of pending jobs for the given machine type.
+        """
+        queue = self.queues.get(machine_type)
+        return 0 if queue is None else len(queue)
+
+    def stats(self, machine_type: MachineType) -> dict:
+        """
+        Get the queue depth and wait time statistics of the given machine type.
+        """
+        queue = self.queues.get(machine_type, JobQueue())
+        now = time.monotonic()
+
+        return {
+            "depth": len(queue),
+            "oldest_wait": max((now - job.enqueued_at for job in queue.jobs), default=0),
+            "placed": queue.placed_count,
+            "average_wait": queue.total_wait / queue.placed_count if queue.placed_count > 0 else 0,
+            "max_wait": queue.max_wait,
+        }
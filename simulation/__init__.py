@@ -0,0 +1,9 @@
+"""
+This package contains an offline simulation of the judge queuer, with a fake Azure backend of which the VMs run simulated runners,
+to benchmark the scheduler and autoscaler without Azure.
+"""
+
+from .fake_azure import FakeAzure
+from .runner import SimulatedRunner
+
+__all__ = ["FakeAzure", "SimulatedRunner"]
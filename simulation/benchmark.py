@@ -0,0 +1,228 @@
+"""
+This module replays a workload trace against the AzureEvaluator, with a FakeAzure backend and simulated runners,
+and reports the throughput, the queue latency and the VM-seconds consumed.
+
+Run it with `python -m simulation.benchmark [trace.json]`, see `--help` for the options.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+
+from azureevaluator import AzureEvaluator
+from custom_logger import main_logger
+from models import JudgeRequest, MachineType, Submission, SubmissionType
+from protocol import judge_protocol_handler
+
+from .fake_azure import FakeAzure
+from .runner import SimulatedRunner
+
+# Initialize the logger
+logger = main_logger.getChild("simulation.benchmark")
+
+
+def load_trace(path: str) -> list[dict]:
+    """
+    Load a workload trace from a JSON file, holding a list of requests such as
+    `{"at": 12.0, "machine_type": "Standard_B2s", "cpus": 1, "memory": 512, "durations": [30, 45]}`,
+    with the time in seconds at which the request arrives and the duration of each of its benchmark instances.
+    Optionally, requests have a `tier`, `priority` and `competition_id`.
+    """
+    with open(path, "r") as trace_file:
+        trace = json.load(trace_file)
+
+    return sorted(trace, key=lambda entry: entry["at"])
+
+
+def generate_trace(count: int = 100, rate: float = 0.5, instances: int = 4, duration: float = 30,
+                   machine_type: str = "Standard_B2s", cpus: int = 1, memory: int = 512, seed: int = None) -> list[dict]:
+    """
+    Generate a workload trace of requests arriving at random with the given average rate per second,
+    of which the benchmark instances take between half and one and a half times the given duration.
+    """
+    generator = random.Random(seed)
+
+    trace = []
+    at = 0
+    for _ in range(count):
+        trace.append({
+            "at": at,
+            "machine_type": machine_type,
+            "cpus": cpus,
+            "memory": memory,
+            "durations": [duration * generator.uniform(0.5, 1.5) for _ in range(instances)],
+        })
+        at += generator.expovariate(rate)
+
+    return trace
+
+
+def make_request(index: int, entry: dict) -> JudgeRequest:
+    """
+    Create the judge request of a trace entry, of which the benchmark instance urls carry their simulated duration.
+    """
+    machine_type = MachineType(entry["machine_type"], entry.get("tier", "Standard"))
+    submission = Submission(SubmissionType.CODE, f"sim://{index}/submission", f"sim://{index}/validator")
+    benchmark_instances = {f"{index}-{number}": f"sim://{index}/{number}?duration={duration}"
+                           for number, duration in enumerate(entry["durations"])}
+
+    return JudgeRequest(submission, machine_type, entry["cpus"], entry["memory"], {}, benchmark_instances,
+                        priority=entry.get("priority", 0), competition_id=entry.get("competition_id"))
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """
+    Get the nearest-rank percentile of the given values, e.g. 0.99 for the 99th percentile.
+    """
+    if len(values) == 0:
+        return 0
+
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def scale_intervals(evaluator: AzureEvaluator, time_scale: float):
+    """
+    Scale the intervals and time windows of the evaluator, so its policies act in simulated seconds.
+    """
+    autoscaler = evaluator.autoscaler
+    autoscaler.interval, autoscaler.debounce = autoscaler.interval * time_scale, autoscaler.debounce * time_scale
+    autoscaler.rate_window, autoscaler.lead_time = autoscaler.rate_window * time_scale, autoscaler.lead_time * time_scale
+
+    scale_in_controller = evaluator.scale_in_controller
+    scale_in_controller.interval, scale_in_controller.grace_period = scale_in_controller.interval * time_scale, scale_in_controller.grace_period * time_scale
+
+    evaluator.reconciler.interval *= time_scale
+    evaluator.health_monitor.interval *= time_scale
+
+    scheduler = evaluator.scheduler
+    scheduler.max_wait *= time_scale
+    if scheduler.placement_timeout is not None:
+        scheduler.placement_timeout *= time_scale
+
+
+async def run_benchmark(trace: list[dict], time_scale: float = 1, host: str = "127.0.0.1", max_containers: int | None = None,
+                        **azure_settings) -> dict:
+    """
+    Replay the trace against an AzureEvaluator on the running event loop, and report the results.
+
+    All times, including the delays of the FakeAzure given as keyword arguments and the intervals of the evaluator, are in simulated seconds,
+    which last `time_scale` real seconds. The simulated runners declare `max_containers` if given.
+    """
+    judge_server = await judge_protocol_handler.start_handler(host, 0)
+    port = judge_server.sockets[0].getsockname()[1]
+
+    azure_settings = {key: value * time_scale if key.endswith("_delay") else value for key, value in azure_settings.items()}
+    azure = FakeAzure(lambda machine_name: SimulatedRunner(machine_name, host, port, time_scale=time_scale, max_containers=max_containers),
+                      **azure_settings)
+
+    evaluator = AzureEvaluator(azure)
+    scale_intervals(evaluator, time_scale)
+    await evaluator.initialize()
+
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    queue_latencies = []
+    turnaround_times = []
+    failed = 0
+
+    async def replay(index: int, entry: dict):
+        nonlocal failed
+
+        judge_request = make_request(index, entry)
+        submitted_at = loop.time()
+        placed_at = None
+
+        def on_placement(machine_name: str, benchmark_instances: dict[str, str]):
+            nonlocal placed_at
+            if placed_at is None:
+                placed_at = loop.time()
+
+        judge_request.set_placement_listener(on_placement)
+        judge_result = await evaluator.submit(judge_request)
+
+        if judge_result.result is None:
+            failed += 1
+            logger.error(f"Request {index} of the trace failed: {judge_result.cause}")
+        if placed_at is not None:
+            queue_latencies.append((placed_at - submitted_at) / time_scale)
+        turnaround_times.append((loop.time() - submitted_at) / time_scale)
+
+    tasks = []
+    for index, entry in enumerate(trace):
+        await asyncio.sleep(max(0, started_at + entry["at"] * time_scale - loop.time()))
+        tasks.append(loop.create_task(replay(index, entry)))
+
+    await asyncio.gather(*tasks)
+    makespan = (loop.time() - started_at) / time_scale
+    instances = sum(len(entry["durations"]) for entry in trace)
+
+    report = {
+        "requests": len(trace),
+        "instances": instances,
+        "failed": failed,
+        "makespan": makespan,
+        "requests_per_second": len(trace) / makespan if makespan > 0 else 0,
+        "instances_per_second": instances / makespan if makespan > 0 else 0,
+        "queue_latency_p50": percentile(queue_latencies, 0.5),
+        "queue_latency_p99": percentile(queue_latencies, 0.99),
+        "turnaround_p50": percentile(turnaround_times, 0.5),
+        "turnaround_p99": percentile(turnaround_times, 0.99),
+        "vms": len(azure.registry.vms),
+        "vm_seconds": azure.vm_seconds() / time_scale,
+    }
+
+    await evaluator.close()
+    await azure.close()
+    judge_server.close()
+
+    return report
+
+
+def format_report(report: dict) -> str:
+    return "\n".join([
+        f"Requests:       {report['requests']} ({report['instances']} benchmark instances, {report['failed']} failed)",
+        f"Makespan:       {report['makespan']:.1f}s",
+        f"Throughput:     {report['requests_per_second']:.3f} requests/s, {report['instances_per_second']:.3f} instances/s",
+        f"Queue latency:  p50 {report['queue_latency_p50']:.1f}s, p99 {report['queue_latency_p99']:.1f}s",
+        f"Turnaround:     p50 {report['turnaround_p50']:.1f}s, p99 {report['turnaround_p99']:.1f}s",
+        f"VMs:            {report['vms']} created, {report['vm_seconds']:.0f} VM-seconds",
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a workload trace against the judge queuer with simulated VMs and runners.")
+    parser.add_argument("trace", nargs="?", help="a JSON trace file, a random trace is generated if omitted")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="the real seconds a simulated second lasts (default 0.01)")
+    parser.add_argument("--requests", type=int, default=100, help="the amount of requests of a generated trace (default 100)")
+    parser.add_argument("--rate", type=float, default=0.5, help="the average amount of requests per second of a generated trace (default 0.5)")
+    parser.add_argument("--instances", type=int, default=4, help="the amount of benchmark instances per request of a generated trace (default 4)")
+    parser.add_argument("--duration", type=float, default=30, help="the average duration of a benchmark instance of a generated trace (default 30)")
+    parser.add_argument("--operation-delay", type=float, default=5, help="the time it takes to create a VMSS (default 5)")
+    parser.add_argument("--provisioning-delay", type=float, default=60, help="the time it takes to provision VMs (default 60)")
+    parser.add_argument("--boot-delay", type=float, default=30, help="the time it takes a provisioned VM to connect its runner (default 30)")
+    parser.add_argument("--deletion-delay", type=float, default=10, help="the time it takes to delete VMs (default 10)")
+    parser.add_argument("--jitter", type=float, default=0, help="the fraction by which the delays randomly vary (default 0)")
+    parser.add_argument("--max-containers", type=int, default=None, help="the amount of containers the simulated runners declare they can run (default none)")
+    parser.add_argument("--seed", type=int, default=None, help="the seed of the random trace and delays")
+    parser.add_argument("--log-level", default="WARNING", help="the log level of the judge queuer (default WARNING)")
+    args = parser.parse_args()
+
+    # Keep the console readable, as every message of every simulated runner is traced
+    for handler in main_logger.handlers:
+        handler.setLevel(args.log_level)
+
+    if args.trace is not None:
+        trace = load_trace(args.trace)
+    else:
+        trace = generate_trace(args.requests, args.rate, args.instances, args.duration, seed=args.seed)
+
+    report = asyncio.run(run_benchmark(trace, args.time_scale, max_containers=args.max_containers, operation_delay=args.operation_delay, provisioning_delay=args.provisioning_delay,
+                                       boot_delay=args.boot_delay, deletion_delay=args.deletion_delay, jitter=args.jitter, seed=args.seed))
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
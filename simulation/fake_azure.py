@@ -0,0 +1,292 @@
+"""
+This module contains the FakeAzure class, an in-process stand-in for the Azure class of which the VMs run simulated runners.
+"""
+
+import asyncio
+import random
+from typing import Callable
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.mgmt.compute.models import (
+    HardwareProfile,
+    OSProfile,
+    Sku,
+    VirtualMachine,
+    VirtualMachineScaleSet,
+    VirtualMachineScaleSetVM,
+)
+
+from custom_logger import main_logger
+
+from .runner import SimulatedRunner
+
+# Initialize the logger
+logger = main_logger.getChild("simulation.fake_azure")
+
+DEFAULT_SIZES = {
+    "Standard_B1s": (1, 1024),
+    "Standard_B1ms": (1, 2048),
+    "Standard_B2s": (2, 4096),
+    "Standard_B2ms": (2, 8192),
+    "Standard_B4ms": (4, 16384),
+    "Standard_D2s_v3": (2, 8192),
+    "Standard_D4s_v3": (4, 16384),
+    "Standard_D8s_v3": (8, 32768),
+}
+"""
+The amount of cores and memory (in MB) of the VM sizes known to the fake, by their name.
+"""
+
+
+class FakeVM:
+    """
+    A simulated VM in a scale set, which starts its runner once it has booted.
+    """
+    vm: VirtualMachineScaleSetVM
+    computer_name: str
+    vmss_name: str
+    created_at: float
+    deleting: bool
+    deleted_at: float | None
+    runner: SimulatedRunner | None
+    boot: asyncio.Task | None
+
+    def __init__(self, vm: VirtualMachineScaleSetVM, computer_name: str, vmss_name: str, created_at: float):
+        self.vm = vm
+        self.computer_name = computer_name
+        self.vmss_name = vmss_name
+        self.created_at = created_at
+        self.deleting = False
+        self.deleted_at = None
+        self.runner = None
+        self.boot = None
+
+    async def stop(self):
+        """
+        Stop the runner of the VM, or its boot if the runner has not started yet.
+        """
+        if self.boot is not None:
+            self.boot.cancel()
+        if self.runner is not None:
+            await self.runner.stop()
+
+
+class FakeVMRegistry:
+    """
+    Keeps track of every VM the fake ever created, so the VMs of a set and the VM-seconds consumed can be looked up.
+    """
+    vms: dict[str, FakeVM]
+    """
+    All VMs that were ever created by their name, including the deleted ones.
+    """
+    vm_counter: int
+
+    def __init__(self):
+        self.vms = {}
+        self.vm_counter = 0
+
+    def create_vm(self, vmss: VirtualMachineScaleSet, now: float) -> FakeVM:
+        self.vm_counter += 1
+
+        computer_name = f"simulated-runner-{self.vm_counter:06d}"
+        vm = VirtualMachineScaleSetVM(location=vmss.location, os_profile=OSProfile(computer_name=computer_name))
+        vm.name = f"{vmss.name}_{self.vm_counter}"
+        fake_vm = FakeVM(vm, computer_name, vmss.name, now)
+        self.vms[vm.name] = fake_vm
+
+        return fake_vm
+
+    def live_vms(self, vmss_name: str) -> list[FakeVM]:
+        """
+        Get the VMs in the set that are not being deleted.
+        """
+        return [fake_vm for fake_vm in self.vms.values() if fake_vm.vmss_name == vmss_name and not fake_vm.deleting]
+
+    def vm_seconds(self, now: float) -> float:
+        """
+        Get the total time in seconds the VMs have existed, from their creation until their deletion or the given time.
+        """
+        return sum((now if fake_vm.deleted_at is None else fake_vm.deleted_at) - fake_vm.created_at for fake_vm in self.vms.values())
+
+
+class FakeAzure:
+    """
+    Implements the methods of the Azure class used by the AzureEvaluator in memory, with configurable delays.
+
+    New VMs are listed right away, the capacity change completes after the provisioning delay,
+    and the runner of a VM connects to the judge after the provisioning and boot delay.
+    The time between the creation and deletion of every VM is kept, so the VM-seconds consumed can be reported.
+    """
+
+    runner_factory: Callable[[str], SimulatedRunner]
+    """
+    Creates the runner of a new VM from its machine name, which is started once the VM has booted.
+    """
+    sizes: dict[str, tuple[int, int]]
+    location: str
+    operation_delay: float
+    """
+    The time in seconds of operations that do not create or delete VMs, such as creating an empty VMSS.
+    """
+    provisioning_delay: float
+    boot_delay: float
+    deletion_delay: float
+    jitter: float
+    """
+    The fraction by which each delay randomly varies, e.g. 0.2 for delays between 80% and 120% of their value.
+    """
+    random: random.Random
+    vmsss: dict[str, VirtualMachineScaleSet]
+    registry: FakeVMRegistry
+
+    def __init__(self, runner_factory: Callable[[str], SimulatedRunner], sizes: dict[str, tuple[int, int]] = None,
+                 location: str = "uksouth", operation_delay: float = 5, provisioning_delay: float = 60, boot_delay: float = 30,
+                 deletion_delay: float = 10, jitter: float = 0, seed: int = None):
+        self.runner_factory = runner_factory
+        self.sizes = DEFAULT_SIZES if sizes is None else sizes
+        self.location = location
+        self.operation_delay = operation_delay
+        self.provisioning_delay = provisioning_delay
+        self.boot_delay = boot_delay
+        self.deletion_delay = deletion_delay
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.vmsss = {}
+        self.registry = FakeVMRegistry()
+
+    def delay(self, delay: float) -> float:
+        """
+        Get the given delay, varied by the jitter.
+        """
+        return delay * self.random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def vm_seconds(self) -> float:
+        """
+        Get the total time in seconds the VMs have existed, from their creation until their deletion or now.
+        """
+        return self.registry.vm_seconds(self.now())
+
+    async def list_vms(self, vmss_name) -> list[VirtualMachineScaleSetVM]:
+        return [fake_vm.vm for fake_vm in self.registry.live_vms(vmss_name)]
+
+    async def delete_vmss(self, vmss_name):
+        await self.delete_vms([fake_vm.vm.name for fake_vm in self.registry.live_vms(vmss_name)], vmss_name)
+        self.vmsss.pop(vmss_name, None)
+
+    async def get_vmss(self, name) -> VirtualMachineScaleSet:
+        vmss = self.vmsss.get(name)
+        if vmss is None:
+            raise ResourceNotFoundError(f"The VMSS {name} does not exist")
+
+        return vmss
+
+    async def list_vmss(self) -> list[VirtualMachineScaleSet]:
+        return list(self.vmsss.values())
+
+    async def get_vm(self, name: str) -> VirtualMachine:
+        fake_vm = self.registry.vms.get(name)
+        if fake_vm is None or fake_vm.deleting:
+            raise ResourceNotFoundError(f"The VM {name} does not exist")
+
+        vmss = self.vmsss[fake_vm.vmss_name]
+        return VirtualMachine(location=vmss.location, hardware_profile=HardwareProfile(vm_size=vmss.sku.name),
+                              os_profile=OSProfile(computer_name=fake_vm.computer_name))
+
+    async def get_vm_size(self, vm_name: str) -> tuple[int, int]:
+        vm = await self.get_vm(vm_name)
+        return await self.get_sku_size(vm.hardware_profile.vm_size, vm.location)
+
+    async def get_sku_size(self, sku_name: str, location=None) -> tuple[int, int]:
+        size = self.sizes.get(sku_name)
+        if size is None:
+            raise ValueError("VM Size not found")
+
+        return size
+
+    async def create_vmss(self, vmss_name, location=None, machine_type_name="Standard_B1s", machine_type_tier="Standard", **kwargs):
+        """
+        Creates an empty VMSS. The settings of the VMs other than their size are ignored.
+        """
+        await asyncio.sleep(self.delay(self.operation_delay))
+
+        vmss = VirtualMachineScaleSet(location=location or self.location,
+                                      sku=Sku(name=machine_type_name, tier=machine_type_tier, capacity=0))
+        vmss.name = vmss_name
+        self.vmsss[vmss_name] = vmss
+
+    async def set_capacity(self, capacity: int, vmss_name):
+        """
+        Sets the capacity of the VMSS, booting new VMs or deleting the newest ones.
+        """
+        vmss = await self.get_vmss(vmss_name)
+        live_vms = self.registry.live_vms(vmss_name)
+
+        if capacity < len(live_vms):
+            await self.delete_vms([fake_vm.vm.name for fake_vm in live_vms[capacity:]], vmss_name)
+            return
+
+        new_vms = [self.registry.create_vm(vmss, self.now()) for _ in range(capacity - len(live_vms))]
+        vmss.sku.capacity = capacity
+        logger.info(f"Provisioning {len(new_vms)} VM(s) in {vmss_name}")
+
+        await asyncio.sleep(self.delay(self.provisioning_delay))
+
+        for fake_vm in new_vms:
+            if not fake_vm.deleting:
+                fake_vm.boot = asyncio.get_running_loop().create_task(self.boot(fake_vm))
+
+    async def add_capacity(self, count: int, vmss_name):
+        """
+        Adds the given amount of VMs to the VMSS.
+        """
+        vmss = await self.get_vmss(vmss_name)
+        await self.set_capacity(vmss.sku.capacity + count, vmss_name)
+
+    async def boot(self, fake_vm: FakeVM):
+        """
+        Start the runner of the VM after the boot delay.
+        """
+        await asyncio.sleep(self.delay(self.boot_delay))
+
+        fake_vm.runner = self.runner_factory(fake_vm.computer_name)
+        try:
+            await fake_vm.runner.start()
+        except OSError:
+            logger.error(f"The runner of VM {fake_vm.vm.name} could not connect to the judge", exc_info=1)
+
+    async def delete_vm(self, vm_name: str, vmss_name, block: bool = True):
+        await self.delete_vms([vm_name], vmss_name, block)
+
+    async def delete_vms(self, vm_names: list[str], vmss_name, block: bool = True):
+        """
+        Deletes the given VMs, of which the runners stop right away. The VMs are billed until the deletion completes.
+        """
+        fake_vms = [self.registry.vms[vm_name] for vm_name in vm_names if vm_name in self.registry.vms and not self.registry.vms[vm_name].deleting]
+        for fake_vm in fake_vms:
+            fake_vm.deleting = True
+            await fake_vm.stop()
+
+        vmss = self.vmsss.get(vmss_name)
+        if vmss is not None:
+            vmss.sku.capacity = max(0, vmss.sku.capacity - len(fake_vms))
+
+        deletion = asyncio.get_running_loop().create_task(self.finish_deletion(fake_vms))
+        if block:
+            await deletion
+
+    async def finish_deletion(self, fake_vms: list[FakeVM]):
+        await asyncio.sleep(self.delay(self.deletion_delay))
+
+        now = self.now()
+        for fake_vm in fake_vms:
+            fake_vm.deleted_at = now
+
+    async def close(self):
+        """
+        Stops the runners of all VMs.
+        """
+        for fake_vm in self.registry.vms.values():
+            await fake_vm.stop()
@@ -0,0 +1,138 @@
+"""
+This module contains the SimulatedRunner class, which speaks the judge protocol like a runner, without evaluating anything.
+"""
+
+import asyncio
+from typing import Callable
+from urllib.parse import parse_qs, urlparse
+
+from custom_logger import main_logger
+from protocol import Connection, Protocol
+
+# Initialize the logger
+logger = main_logger.getChild("simulation.runner")
+
+
+def instance_duration(url: str, default: float = 1) -> float:
+    """
+    Get the simulated duration in seconds of the benchmark instance with the given url,
+    which is taken from its `duration` query parameter, e.g. `sim://request/instance?duration=12.5`.
+    """
+    durations = parse_qs(urlparse(url).query).get("duration")
+    return default if durations is None else float(durations[0])
+
+
+class SimulatedRunner:
+    """
+    Connects to the judge like a runner and answers its commands. A `START` command sleeps for the duration of each
+    benchmark instance in turn, reporting the result of each instance as progress, while several commands run concurrently.
+    """
+
+    machine_name: str
+    host: str
+    port: int
+    duration: Callable[[str], float]
+    """
+    Gets the simulated duration in seconds of a benchmark instance from its url.
+    """
+    time_scale: float
+    """
+    The factor by which the durations are multiplied, e.g. 0.01 to run a hundred times faster than simulated.
+    """
+    max_containers: int | None
+    """
+    The amount of containers the runner declares it can run at the same time, or None to not declare it.
+    """
+    running: int
+    """
+    The amount of `START` commands running, reported as the load of the runner.
+    """
+    connection: Connection | None
+    receiver_task: asyncio.Task | None
+    tasks: set[asyncio.Task]
+    busy_time: float
+    """
+    The total time in seconds spent evaluating benchmark instances, before scaling.
+    """
+
+    def __init__(self, machine_name: str, host: str, port: int, duration: Callable[[str], float] = instance_duration,
+                 time_scale: float = 1, max_containers: int | None = None):
+        self.machine_name = machine_name
+        self.host = host
+        self.port = port
+        self.duration = duration
+        self.time_scale = time_scale
+        self.max_containers = max_containers
+        self.running = 0
+        self.connection = None
+        self.receiver_task = None
+        self.tasks = set()
+        self.busy_time = 0
+
+    async def start(self):
+        """
+        Connect to the judge, and start answering its commands in the background.
+        """
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self.connection = Connection(self.host, self.port, reader, writer)
+        self.receiver_task = asyncio.get_running_loop().create_task(self._receiver())
+
+    async def stop(self):
+        """
+        Disconnect from the judge, abandoning the commands that are still running.
+        """
+        if self.receiver_task is not None:
+            self.receiver_task.cancel()
+        for task in list(self.tasks):
+            task.cancel()
+
+        if self.connection is not None:
+            self.connection.writer.close()
+            try:
+                await self.connection.writer.wait_closed()
+            except OSError:
+                pass
+
+    async def _receiver(self):
+        try:
+            while True:
+                message = await Protocol.receive(self.connection)
+
+                task = asyncio.get_running_loop().create_task(self._handle(message))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+        except ConnectionResetError:
+            logger.info(f"Simulated runner {self.machine_name} was disconnected by the judge")
+
+    async def _handle(self, message: dict):
+        command = message["command"]
+
+        if command == "INFO":
+            response = {"machine_name": self.machine_name, "load": self.running}
+            if self.max_containers is not None:
+                response["max_containers"] = self.max_containers
+        elif command == "CHECK":
+            response = {"status": "ok", "load": self.running}
+        elif command == "START":
+            response = await self._start(message["id"], message["args"])
+        else:
+            logger.error(f"Simulated runner {self.machine_name} received unknown command {command}")
+            return
+
+        await Protocol.send(self.connection, {"id": message["id"], "response": response})
+
+    async def _start(self, message_id: int, args: dict) -> dict:
+        results = {}
+        self.running += 1
+        try:
+            for instance_id, url in args["benchmark_instances"].items():
+                duration = self.duration(url)
+                await asyncio.sleep(duration * self.time_scale)
+                self.busy_time += duration
+
+                results[instance_id] = {"machine_name": self.machine_name, "duration": duration}
+                await Protocol.send(self.connection, {"id": message_id, "progress": {instance_id: results[instance_id]}})
+        finally:
+            self.running -= 1
+
+        return {"status": "ok", "results": results}
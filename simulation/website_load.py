@@ -0,0 +1,346 @@
+"""
+This module contains a load generator for the website protocol server, which sends a configurable mix of commands
+over a single website connection and reports the round-trip time of each kind of command.
+
+Run it with `python -m simulation.website_load`, see `--help` for the options.
+"""
+
+import argparse
+import asyncio
+import bisect
+import itertools
+import random
+import time
+
+from custom_logger import main_logger
+from evaluators import SubmissionEvaluator
+from localevaluator import LocalEvaluator
+from models import JudgeRequest, JudgeResult
+from protocol import Connection, Protocol, judge_protocol_handler
+from protocol.website_protocol_handler import ProtocolHandler
+
+from .benchmark import percentile
+from .runner import SimulatedRunner
+
+# Initialize the logger
+logger = main_logger.getChild("simulation.website_load")
+
+COMMANDS = ("CHECK", "START", "SUBMIT", "POLL")
+"""
+The commands the load generator can send.
+"""
+
+BUCKETS = [0.0001 * 2 ** exponent for exponent in range(20)]
+"""
+The upper bounds in seconds of the buckets of the round-trip time histograms, from 0.1ms up to about a minute.
+"""
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """
+    Parse a command mix such as `CHECK=9,START=1`, giving the relative amount of each command.
+    """
+    mix = {}
+    for part in value.split(","):
+        if part.strip() == "":
+            continue
+
+        command_name, weight = part.split("=")
+        command_name = command_name.strip().upper()
+        if command_name not in COMMANDS:
+            raise ValueError(f"Unknown command `{command_name}` in command mix `{value}`")
+
+        mix[command_name] = float(weight)
+
+    return mix
+
+
+def histogram(values: list[float]) -> list[tuple[float, int]]:
+    """
+    Count the values per bucket, as the upper bound of each bucket and its count, from the first to the last bucket that is not empty.
+    Values larger than the last bound are counted in an extra bucket with an infinite bound.
+    """
+    counts = [0] * (len(BUCKETS) + 1)
+    for value in values:
+        counts[bisect.bisect_left(BUCKETS, value)] += 1
+
+    used = [index for index, count in enumerate(counts) if count > 0]
+    if len(used) == 0:
+        return []
+
+    return list(zip(BUCKETS + [float("inf")], counts))[used[0]:used[-1] + 1]
+
+
+class StubEvaluator(SubmissionEvaluator):
+    """
+    An evaluator that waits for the given duration per benchmark instance instead of evaluating it,
+    so the website side is measured without runners.
+    """
+
+    duration: float
+
+    def __init__(self, duration: float = 0):
+        super().__init__()
+        self.duration = duration
+
+    async def evaluate(self, judge_request: JudgeRequest) -> JudgeResult:
+        await asyncio.sleep(self.duration * len(judge_request.benchmark_instances))
+
+        return JudgeResult.success({instance_id: {"status": "ok"} for instance_id in judge_request.benchmark_instances})
+
+
+class LoadGenerator:
+    """
+    Sends commands to the website protocol server from a number of concurrent workers,
+    each sending its next command once the response to its previous one has arrived.
+    """
+
+    host: str
+    port: int
+    mix: dict[str, float]
+    concurrency: int
+    instances: int
+    """
+    The amount of benchmark instances of every START and SUBMIT command.
+    """
+    instance_duration: float
+    """
+    The simulated duration of every benchmark instance, used by simulated runners.
+    """
+    timeout: float
+    random: random.Random
+    connection: Connection
+    message_ids: itertools.count
+    futures: dict[int, asyncio.Future]
+    round_trip_times: dict[str, list[float]]
+    errors: dict[str, int]
+    job_ids: list[str]
+    """
+    The jobs started by SUBMIT commands, which are polled by POLL commands.
+    """
+    events: int
+    """
+    The amount of events pushed by the server, e.g. the progress of jobs.
+    """
+
+    def __init__(self, host: str, port: int, mix: dict[str, float], concurrency: int = 10, instances: int = 1,
+                 instance_duration: float = 0, timeout: float = 60, seed: int = None):
+        self.host = host
+        self.port = port
+        self.mix = mix
+        self.concurrency = concurrency
+        self.instances = instances
+        self.instance_duration = instance_duration
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.message_ids = itertools.count(1)
+        self.futures = {}
+        self.round_trip_times = {command_name: [] for command_name in mix}
+        self.errors = {command_name: 0 for command_name in mix}
+        self.job_ids = []
+        self.events = 0
+
+    async def run(self, commands: int) -> dict:
+        """
+        Send the given amount of commands, and report the round-trip times.
+        """
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self.connection = Connection(self.host, self.port, reader, writer)
+        receiver_task = asyncio.get_running_loop().create_task(self._receiver())
+
+        remaining = iter(range(commands))
+
+        async def worker():
+            for _ in remaining:
+                await self.send(self.random.choices(list(self.mix), list(self.mix.values()))[0])
+
+        started_at = time.monotonic()
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            duration = time.monotonic() - started_at
+            receiver_task.cancel()
+            writer.close()
+
+        return self.report(duration)
+
+    async def send(self, command_name: str):
+        """
+        Send a single command, and record its round-trip time.
+        """
+        message_id = next(self.message_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.futures[message_id] = future
+
+        start = time.monotonic()
+        try:
+            await Protocol.send(self.connection, {"id": message_id, "command": command_name, "args": self.arguments(command_name, message_id)})
+            response = await asyncio.wait_for(future, self.timeout)
+        except TimeoutError:
+            self.errors[command_name] += 1
+            return
+        finally:
+            self.futures.pop(message_id, None)
+
+        self.round_trip_times[command_name].append(time.monotonic() - start)
+
+        if response.get("status") != "ok":
+            self.errors[command_name] += 1
+        elif command_name == "SUBMIT":
+            self.job_ids.append(response["job_id"])
+
+    def arguments(self, command_name: str, message_id: int) -> dict:
+        """
+        Get the arguments of a command. Every request has its own benchmark instances, so none are answered from the result cache.
+        """
+        if command_name == "POLL":
+            job_id = self.random.choice(self.job_ids) if len(self.job_ids) > 0 else "unknown"
+            return {"job_id": job_id, "since": 0}
+
+        if command_name in ("START", "SUBMIT"):
+            return {
+                "evaluation_settings": {"machine_type": "Standard_B1s", "cpu": 1, "memory": 256},
+                "benchmark_instances": {f"{message_id}-{number}": f"sim://load/{message_id}/{number}?duration={self.instance_duration}"
+                                        for number in range(self.instances)},
+                "submission_url": f"sim://load/{message_id}/submission",
+                "validator_url": f"sim://load/{message_id}/validator",
+            }
+
+        return {}
+
+    async def _receiver(self):
+        try:
+            while True:
+                message = await Protocol.receive(self.connection)
+
+                if "event" in message:
+                    self.events += 1
+                    continue
+
+                future = self.futures.get(message.get("id"))
+                if future is not None and not future.done():
+                    future.set_result(message["response"])
+        except ConnectionResetError:
+            logger.error("The website protocol server closed the connection")
+            for future in self.futures.values():
+                if not future.done():
+                    future.set_exception(TimeoutError("The connection was closed"))
+
+    def report(self, duration: float) -> dict:
+        commands = {}
+        for command_name, round_trip_times in self.round_trip_times.items():
+            commands[command_name] = {
+                "count": len(round_trip_times),
+                "errors": self.errors[command_name],
+                "mean": sum(round_trip_times) / len(round_trip_times) if len(round_trip_times) > 0 else 0,
+                "p50": percentile(round_trip_times, 0.5),
+                "p90": percentile(round_trip_times, 0.9),
+                "p99": percentile(round_trip_times, 0.99),
+                "max": max(round_trip_times, default=0),
+                "histogram": histogram(round_trip_times),
+            }
+
+        total = sum(command["count"] for command in commands.values())
+        return {
+            "commands": total,
+            "duration": duration,
+            "commands_per_second": total / duration if duration > 0 else 0,
+            "events": self.events,
+            "per_command": commands,
+        }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"Commands:  {report['commands']} in {report['duration']:.2f}s ({report['commands_per_second']:.0f} commands/s), "
+        f"{report['events']} events pushed",
+        "",
+        f"{'command':<8} {'count':>7} {'errors':>7} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}",
+    ]
+    for command_name, command in report["per_command"].items():
+        times = " ".join(f"{command[key] * 1000:7.2f}ms" for key in ("mean", "p50", "p90", "p99", "max"))
+        lines.append(f"{command_name:<8} {command['count']:>7} {command['errors']:>7} {times}")
+
+    for command_name, command in report["per_command"].items():
+        lines.extend(["", f"{command_name} round-trip times:"])
+        largest = max((count for _, count in command["histogram"]), default=0)
+        for bound, count in command["histogram"]:
+            bar = "#" * round(40 * count / largest) if largest > 0 else ""
+            lines.append(f"  <= {bound * 1000:10.1f}ms {count:>7} {bar}")
+
+    return "\n".join(lines)
+
+
+async def start_server(evaluator: str, instance_duration: float, host: str = "127.0.0.1") -> tuple[int, list]:
+    """
+    Start a website protocol server on the running event loop with the given evaluator, `stub` or `local`,
+    the latter evaluating on a simulated runner. Returns the port of the server and what should be closed afterwards.
+    """
+    closeables = []
+
+    if evaluator == "local":
+        judge_server = await judge_protocol_handler.start_handler(host, 0)
+        runner = SimulatedRunner("simulated-local-runner", host, judge_server.sockets[0].getsockname()[1])
+        await runner.start()
+        await judge_protocol_handler.wait_for_connection(runner.machine_name, 10)
+        closeables.extend([runner, judge_server])
+
+        local_evaluator = LocalEvaluator()
+        await local_evaluator.initialize()
+        closeables.append(local_evaluator)
+    else:
+        await StubEvaluator(instance_duration).initialize()
+
+    website_server = await ProtocolHandler(host, 0).start()
+    closeables.append(website_server)
+
+    return website_server.sockets[0].getsockname()[1], closeables
+
+
+async def run_load(args: argparse.Namespace) -> dict:
+    host, port = args.host, args.port
+    closeables = []
+    if args.evaluator != "none":
+        port, closeables = await start_server(args.evaluator, args.instance_duration)
+        host = "127.0.0.1"
+
+    load_generator = LoadGenerator(host, port, parse_mix(args.mix), args.concurrency, args.instances, args.instance_duration,
+                                   args.timeout, args.seed)
+    try:
+        return await load_generator.run(args.commands)
+    finally:
+        for closeable in closeables:
+            if isinstance(closeable, SimulatedRunner):
+                await closeable.stop()
+            elif isinstance(closeable, LocalEvaluator):
+                await closeable.close()
+            else:
+                closeable.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a mix of commands to the website protocol server, and report their round-trip times.")
+    parser.add_argument("--evaluator", choices=["stub", "local", "none"], default="stub",
+                        help="serve the commands in-process with a `stub` evaluator or a `local` evaluator with a simulated runner, "
+                             "or `none` to load a judge queuer that is already running (default stub)")
+    parser.add_argument("--host", default="127.0.0.1", help="the host of the running judge queuer (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=30000, help="the website port of the running judge queuer (default 30000)")
+    parser.add_argument("--mix", default="CHECK=1", help="the relative amount of each command, e.g. CHECK=8,START=1,SUBMIT=1,POLL=1 (default CHECK=1)")
+    parser.add_argument("--commands", type=int, default=10000, help="the amount of commands to send (default 10000)")
+    parser.add_argument("--concurrency", type=int, default=10, help="the amount of commands in flight at the same time (default 10)")
+    parser.add_argument("--instances", type=int, default=1, help="the amount of benchmark instances per START and SUBMIT (default 1)")
+    parser.add_argument("--instance-duration", type=float, default=0, help="the seconds each benchmark instance takes to evaluate (default 0)")
+    parser.add_argument("--timeout", type=float, default=60, help="the seconds after which a command without response counts as an error (default 60)")
+    parser.add_argument("--seed", type=int, default=None, help="the seed of the random command mix")
+    parser.add_argument("--log-level", default="WARNING", help="the log level of the judge queuer (default WARNING)")
+    args = parser.parse_args()
+
+    # Keep the console readable, as every command is traced
+    for handler in main_logger.handlers:
+        handler.setLevel(args.log_level)
+
+    print(format_report(asyncio.run(run_load(args))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+This module contains the SingleFlight class, which lets identical judge requests that are evaluated at the same time share one evaluation.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+from typing import Awaitable, Callable
+
+from custom_logger import main_logger
+from models import JudgeRequest, JudgeResult
+from result_cache import RESULT_CACHE_GRANULARITY, instance_key, request_key
+
+# Initialize the logger
+logger = main_logger.getChild("single_flight")
+
+
+class SingleFlight:
+    """
+    Keeps track of the evaluations in flight, per request or per benchmark instance.
+
+    A request that is identical to one in flight waits for its result instead of being evaluated again.
+    With the instance granularity, only the instances that are not in flight yet are evaluated.
+    """
+
+    granularity: str
+    lock: threading.Lock
+    flights: dict[str, concurrent.futures.Future]
+    """
+    The evaluations in flight by key, resolved with the JudgeResult of the request or instance.
+    These can be awaited from any thread or event loop.
+    """
+    tasks: set[asyncio.Task]
+    """
+    The evaluations of the flights, which keep running when the request that started them is cancelled.
+    """
+
+    def __init__(self, granularity: str = RESULT_CACHE_GRANULARITY):
+        if granularity not in ("request", "instance"):
+            raise ValueError(f"Unknown single flight granularity `{granularity}`")
+
+        self.granularity = granularity
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.tasks = set()
+
+    async def run(self, judge_request: JudgeRequest, evaluate: Callable[[JudgeRequest], Awaitable[JudgeResult]]) -> JudgeResult:
+        """
+        Evaluate the judge request with the given function, sharing the evaluation with identical requests in flight.
+        """
+        if self.granularity == "request":
+            keys = {None: request_key(judge_request)}
+        else:
+            keys = {instance_id: instance_key(judge_request, instance_id) for instance_id in judge_request.benchmark_instances}
+
+        # Join the evaluations in flight, and start a flight for everything else
+        with self.lock:
+            joined = [self.flights[key] for key in keys.values() if key in self.flights]
+            owned = {instance_id: key for instance_id, key in keys.items() if key not in self.flights}
+            for key in owned.values():
+                self.flights[key] = concurrent.futures.Future()
+
+        judge_results = []
+        if len(owned) > 0:
+            if len(joined) > 0:
+                logger.info(f"Sharing {len(joined)} of {len(keys)} benchmark instances with judge requests in flight")
+                judge_request = judge_request.subset({instance_id: judge_request.benchmark_instances[instance_id] for instance_id in owned})
+
+            judge_results.append(await self.fly(judge_request, evaluate, owned))
+        else:
+            logger.info("Sharing the evaluation of a judge request in flight")
+
+        # Shield the flights, so a cancelled request does not cancel the evaluation shared with other requests
+        shared_results = await asyncio.gather(*(asyncio.shield(asyncio.wrap_future(future)) for future in joined))
+        for shared_result in shared_results:
+            if shared_result.result is not None:
+                judge_request.report_progress(shared_result.result)
+
+        judge_results.extend(shared_results)
+
+        return JudgeResult.merge(judge_results)
+
+    async def fly(self, judge_request: JudgeRequest, evaluate: Callable[[JudgeRequest], Awaitable[JudgeResult]],
+                  owned: dict[str | None, str]) -> JudgeResult:
+        """
+        Evaluate a judge request of which this request owns the flights, resolving them with the result.
+        The evaluation runs in its own task, so cancelling this request does not cancel it for the requests that joined its flights.
+        """
+        task = asyncio.get_running_loop().create_task(self.evaluate_flights(judge_request, evaluate, owned))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+        return await asyncio.shield(task)
+
+    async def evaluate_flights(self, judge_request: JudgeRequest, evaluate: Callable[[JudgeRequest], Awaitable[JudgeResult]],
+                               owned: dict[str | None, str]) -> JudgeResult:
+        try:
+            judge_result = await evaluate(judge_request)
+        except asyncio.CancelledError:
+            # The evaluation itself was cancelled, e.g. as the event loop is closing
+            with self.lock:
+                for key in owned.values():
+                    self.flights.pop(key).cancel()
+            raise
+        except Exception as e:
+            with self.lock:
+                for key in owned.values():
+                    self.flights.pop(key).set_exception(e)
+            raise
+
+        with self.lock:
+            for instance_id, key in owned.items():
+                future = self.flights.pop(key)
+
+                if judge_result.result is None or instance_id is None:
+                    future.set_result(judge_result)
+                elif instance_id in judge_result.result:
+                    future.set_result(JudgeResult.success({instance_id: judge_result.result[instance_id]}))
+                else:
+                    future.set_result(JudgeResult.error(f"The result of benchmark instance {instance_id} is missing"))
+
+        return judge_result
@@ -0,0 +1,108 @@
+"""
+This module contains the Substitutor class, which places judge requests on a substitute machine type
+when their own machine type has no room for them right away.
+"""
+
+import os
+from typing import TYPE_CHECKING
+
+import metrics
+from custom_logger import main_logger
+from models import JudgeRequest, MachineType
+
+if TYPE_CHECKING:
+    from azureevaluator import AzureEvaluator, JudgeVMSS
+
+# Initialize the logger
+logger = main_logger.getChild("substitution")
+
+
+def parse_substitutes(value: str) -> dict[MachineType, list[MachineType]]:
+    """
+    Parse the machine type substitutes setting, formatted as `Standard_B1s=Standard_B2s|Standard_B2ms,Standard_B2s=Standard_B2ms`,
+    giving per machine type the machine types that may be used instead in order of preference.
+    """
+    substitutes = {}
+    for entry in value.split(","):
+        if entry.strip() == "":
+            continue
+
+        name, names = entry.split("=", 1)
+        substitutes[MachineType.from_name(name.strip())] = [MachineType.from_name(substitute.strip()) for substitute in names.split("|")
+                                                            if substitute.strip() != ""]
+
+    return substitutes
+
+
+# The machine types on which a request may be placed when its own machine type has no room for it but a substitute does, see `parse_substitutes`
+MACHINE_TYPE_SUBSTITUTES = parse_substitutes(os.getenv("MACHINE_TYPE_SUBSTITUTES", ""))
+
+SUBSTITUTIONS = metrics.counter("judgequeuer_substitutions_total", "The amount of judge requests placed on a substitute machine type",
+                                ("machine_type", "substitute"))
+
+
+def is_strict(judge_request: JudgeRequest) -> bool:
+    """
+    Check whether the judge request has to be evaluated on its own machine type,
+    requests opt out of substitution by setting `strict` to true in their evaluation settings.
+    """
+    return judge_request.evaluation_settings.get("strict", False) is True
+
+
+class Substitutor:
+    """
+    Selects a substitute machine type for judge requests of which the own machine type has no room, while a substitute does.
+    """
+
+    evaluator: 'AzureEvaluator'
+    substitutes: dict[MachineType, list[MachineType]]
+    """
+    The machine types that may be used instead of a machine type without room, in order of preference.
+    """
+
+    def __init__(self, evaluator: 'AzureEvaluator', substitutes: dict[MachineType, list[MachineType]] = MACHINE_TYPE_SUBSTITUTES):
+        self.evaluator = evaluator
+        self.substitutes = substitutes
+
+    def substitute(self, judge_request: JudgeRequest) -> MachineType | None:
+        """
+        Get the machine type the judge request should be placed on instead of its own, or None if it should wait for its own machine type.
+        """
+        with self.evaluator.scheduler.lock:
+            substitute = self.select(judge_request)
+
+        if substitute is not None:
+            logger.info(f"Placing judge request for {judge_request.machine_type.name} on substitute {substitute.name}, which has room for it")
+            SUBSTITUTIONS.labels(judge_request.machine_type.name, substitute.name).inc()
+
+        return substitute
+
+    def select(self, judge_request: JudgeRequest) -> MachineType | None:
+        """
+        Select the first configured substitute machine type with room for the judge request, if its own machine type has no room for it.
+        Returns None if the request should wait for its own machine type. Should be called while holding the lock of the scheduler.
+        """
+        substitutes = self.substitutes.get(judge_request.machine_type, [])
+        if len(substitutes) == 0 or is_strict(judge_request):
+            return None
+
+        judgevmss = self.evaluator.judgevmss_dict.get(judge_request.machine_type)
+        if judgevmss is not None and self.has_room(judgevmss, judge_request):
+            return None
+
+        for substitute in substitutes:
+            judgevmss = self.evaluator.judgevmss_dict.get(substitute)
+            if judgevmss is not None and self.has_room(judgevmss, judge_request):
+                return substitute
+
+        return None
+
+    def has_room(self, judgevmss: 'JudgeVMSS', judge_request: JudgeRequest) -> bool:
+        """
+        Check whether the judge request can be placed on one of the vms of the vmss right away. Should be called while holding the lock.
+        """
+        scheduler = self.evaluator.scheduler
+        if scheduler.queue_depth(judgevmss.machine_type) > 0:
+            return False
+
+        return any(scheduler.fits(judge_request, judgevm) for judgevm in judgevmss.available_vms())
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from azurewrap import asyncwrap
+from azurewrap.base import Azure
+
+
+class TestAsyncAzure:
+    """Tests for the concurrency of the AsyncAzure class, with the Azure calls replaced"""
+
+    @pytest.fixture(autouse=True)
+    def calls(self, monkeypatch):
+        self.calls = []
+        self.running = {}
+
+        async def set_capacity(azure, capacity, vmss_name):
+            self.running[vmss_name] = self.running.get(vmss_name, 0) + 1
+            self.calls.append(("set_capacity", vmss_name, sum(self.running.values()), self.running[vmss_name]))
+            await asyncio.sleep(0.02)
+            self.running[vmss_name] -= 1
+
+        async def add_capacity(azure, count, vmss_name):
+            await set_capacity(azure, count, vmss_name)
+
+        async def delete_vms(azure, vm_names, vmss_name, block=True):
+            self.calls.append(("delete_vms", vmss_name, sorted(vm_names)))
+
+        monkeypatch.setattr(Azure, "set_capacity", set_capacity)
+        monkeypatch.setattr(Azure, "add_capacity", add_capacity)
+        monkeypatch.setattr(Azure, "delete_vms", delete_vms)
+
+    def run(self, *calls):
+        async def run():
+            azure = asyncwrap.AsyncAzure("subscription", "resource_group")
+            try:
+                await asyncio.gather(*(call(azure) for call in calls))
+            finally:
+                await azure.close()
+
+        asyncio.run(run())
+
+    def test_vmss_operations(self):
+        self.run(lambda azure: azure.set_capacity(1, "a"), lambda azure: azure.add_capacity(2, "a"), lambda azure: azure.set_capacity(1, "b"))
+
+        #Operations of the same VMSS take turns, including capacity increases based on the current capacity, while those of different VMSS's overlap
+        assert all(running_vmss == 1 for _, _, _, running_vmss in self.calls)
+        assert max(running for _, _, running, _ in self.calls) == 2
+
+    def test_delete_batching(self):
+        self.run(lambda azure: azure.set_capacity(1, "a"),
+                 lambda azure: azure.delete_vms(["a_1"], "a"),
+                 lambda azure: azure.delete_vms(["a_2", "a_3"], "a"),
+                 lambda azure: azure.delete_vms(["b_1"], "b"))
+
+        #Deletions waiting for the same VMSS are combined into a single operation
+        assert ("delete_vms", "a", ["a_1", "a_2", "a_3"]) in self.calls
+        assert ("delete_vms", "b", ["b_1"]) in self.calls
+        assert len(self.calls) == 3
+
+    def test_parse_concurrency(self):
+        assert asyncwrap.parse_concurrency("read=16, scale=2") == {"read": 16, "scale": 2}
+        with pytest.raises(ValueError):
+            asyncwrap.parse_concurrency("write=1")
@@ -0,0 +1,56 @@
+import time
+
+from autoscaler import ScaleInController, parse_warm_pool, vms_needed
+from tests.test_scheduler import MACHINE_TYPE, make_request
+
+
+class TestAutoscaler:
+    """Tests for the capacity estimation of the autoscaler"""
+
+    def test_vms_needed(self):
+        #Five requests of one cpu need three VMs with two cpus
+        requests = [make_request(cpus=1, memory=256) for _ in range(5)]
+        assert vms_needed(requests, 0, 0, (2, 4096)) == 3
+        #Free resources on existing VMs are used first
+        assert vms_needed(requests, 4, 2048, (2, 4096)) == 1
+        #Memory can also be the limiting resource
+        assert vms_needed(requests, 0, 0, (8, 512)) == 3
+        #Without a known VM size, each request gets its own VM
+        assert vms_needed(requests, 0, 0, None) == 5
+        #Runners that declare their containers hold at most that many requests, next to their free slots
+        assert vms_needed(requests, 0, 0, (8, 4096), max_containers=2) == 3
+        assert vms_needed(requests, 8, 4096, (8, 4096), max_containers=2, free_slots=1) == 2
+        #Requests larger than a VM never get a VM
+        assert vms_needed([make_request(cpus=4), make_request(memory=8192)], 0, 0, (2, 4096)) == 0
+
+    def test_parse_warm_pool(self):
+        assert parse_warm_pool("") == {}
+        assert parse_warm_pool("Standard_B1s=2, Standard_B2s=1") == {"Standard_B1s": 2, "Standard_B2s": 1}
+
+    def test_idle_vms(self):
+        #Only VMs idle for longer than the grace period are removed, keeping the warm pool
+        class FakeVM:
+            def __init__(self, name, idle_since):
+                self.vm = type("VM", (), {"name": name})
+                self.idle_since = idle_since
+
+            def is_busy(self):
+                return self.idle_since is None
+
+        class FakeVMSS:
+            machine_type = MACHINE_TYPE
+
+        now = time.monotonic()
+        judgevmss = FakeVMSS()
+        judgevmss.judgevm_dict = {
+            "busy": FakeVM("busy", None),
+            "old": FakeVM("old", now - 1000),
+            "older": FakeVM("older", now - 2000),
+            "recent": FakeVM("recent", now - 10),
+        }
+
+        controller = ScaleInController(None, warm_pool={}, grace_period=100)
+        assert sorted(controller.idle_vms(judgevmss)) == ["old", "older"]
+
+        controller = ScaleInController(None, warm_pool={MACHINE_TYPE.name: 2}, grace_period=100)
+        assert controller.idle_vms(judgevmss) == ["older"]
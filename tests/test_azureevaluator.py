@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+
+from azureevaluator import REQUESTS, AzureEvaluator, JudgeVM, JudgeVMSS
+from models import JudgeRequest, JudgeResult, MachineType, Submission, SubmissionType
+from protocol import judge_protocol_handler
+from result_cache import ResultCache
+from simulation import FakeAzure, SimulatedRunner
+from substitution import parse_substitutes
+
+B1S = MachineType("Standard_B1s", "Standard")
+B2S = MachineType("Standard_B2s", "Standard")
+B2MS = MachineType("Standard_B2ms", "Standard")
+
+
+def make_request(evaluation_settings=None):
+    submission = Submission(SubmissionType.CODE, "source", "validator")
+    return JudgeRequest(submission, B1S, 1, 256, evaluation_settings or {}, {"1": "url"})
+
+
+class TestSubstitution:
+    """Tests for placing requests on a substitute machine type"""
+
+    def make_evaluator(self):
+        evaluator = AzureEvaluator(None, substitutes={B1S: [B2S, B2MS]})
+        for machine_type in (B1S, B2S, B2MS):
+            judgevmss = JudgeVMSS(machine_type, machine_type.name, None, None, evaluator.scheduler, evaluator.health_monitor)
+            evaluator.judgevmss_dict[machine_type] = judgevmss
+        return evaluator
+
+    def add_vm(self, evaluator, machine_type, cpus):
+        judgevm = JudgeVM(None, f"{machine_type.name}-runner", None, cpus, 4096)
+        evaluator.judgevmss_dict[machine_type].judgevm_dict[judgevm.machine_name] = judgevm
+        return judgevm
+
+    def test_parse_substitutes(self):
+        assert parse_substitutes("") == {}
+        assert parse_substitutes("Standard_B1s=Standard_B2s|Standard_B2ms, Standard_B2s=Standard_B2ms") == {B1S: [B2S, B2MS], B2S: [B2MS]}
+
+    def test_select_substitute(self):
+        evaluator = self.make_evaluator()
+
+        #Without room anywhere, the request waits for its own machine type
+        assert evaluator.substitutor.select(make_request()) is None
+
+        #The first substitute with room is used, unless the request is strict
+        self.add_vm(evaluator, B2MS, 2)
+        assert evaluator.substitutor.select(make_request()) == B2MS
+        self.add_vm(evaluator, B2S, 2)
+        assert evaluator.substitutor.select(make_request()) == B2S
+        assert evaluator.substitutor.select(make_request({"strict": True})) is None
+
+        #Its own machine type is preferred when it has room
+        self.add_vm(evaluator, B1S, 1)
+        assert evaluator.substitutor.select(make_request()) is None
+
+    def test_substituted_results_are_not_cached(self):
+        result_cache = ResultCache(size=8)
+        judge_result = JudgeResult.success({"1": {}})
+        judge_result.metadata = {"machine_type": B2S.name, "substituted_for": B1S.name}
+
+        #Only results evaluated on the requested machine type are shared
+        result_cache.store_result(make_request(), judge_result)
+        assert result_cache.lookup(make_request())[1] is not None
+        result_cache.store_result(make_request(), JudgeResult.success({"1": {}}))
+        assert result_cache.lookup(make_request())[1] is None
+
+    def test_cached_result_metadata(self):
+        evaluator = AzureEvaluator(None)
+        evaluator.result_cache = ResultCache(size=8)
+        evaluator.result_cache.store_result(make_request(), JudgeResult.success({"1": {"score": 1}}))
+
+        #A cached result reports the machine type it was evaluated on, like a fresh one
+        judge_result = asyncio.run(evaluator.submit(make_request()))
+        assert judge_result.result == {"1": {"score": 1}} and judge_result.metadata == {"machine_type": B1S.name}
+
+
+class TestPreload:
+    """Tests for loading the existing VMs at startup"""
+
+    def test_preload(self):
+        async def run():
+            server = await judge_protocol_handler.start_handler("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            azure = FakeAzure(lambda machine_name: SimulatedRunner(machine_name, "127.0.0.1", port),
+                              operation_delay=0, provisioning_delay=0.01, boot_delay=0.05, deletion_delay=0)
+            for machine_type in (B1S, B2S):
+                await azure.create_vmss(f"benchlab_judge_{machine_type.name}", machine_type_name=machine_type.name)
+                await azure.set_capacity(2, f"benchlab_judge_{machine_type.name}")
+
+            #The VMs of every VMSS can take requests once the evaluator is initialized, even if their runners were still booting
+            evaluator = AzureEvaluator(azure)
+            await evaluator.initialize()
+            sizes = {machine_type: len(judgevmss.judgevm_dict) for machine_type, judgevmss in evaluator.judgevmss_dict.items()}
+
+            #A closed evaluator no longer listens to the runners, so a later evaluator is not dispatched for by stale ones
+            await evaluator.close()
+            assert evaluator.dispatch_all not in judge_protocol_handler.load_listeners
+            assert evaluator.reconciler.on_connection not in judge_protocol_handler.connection_listeners
+            assert evaluator.health_monitor.on_connection not in judge_protocol_handler.connection_listeners
+            await azure.close()
+            server.close()
+            return sizes
+
+        assert asyncio.run(run()) == {B1S: 2, B2S: 2}
+
+
+class TestReservation:
+    """Tests for reserving a VM for a request"""
+
+    def test_cancel_waiting(self):
+        async def run():
+            evaluator = AzureEvaluator(None)
+            judgevmss = JudgeVMSS(B1S, B1S.name, None, None, evaluator.scheduler, evaluator.health_monitor)
+
+            task = asyncio.get_running_loop().create_task(judgevmss.reserve_vm(make_request()))
+            await asyncio.sleep(0)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+            #The cancelled request leaves the queue, and does not take up a VM that arrives later
+            assert evaluator.scheduler.queue_depth(B1S) == 0
+            judgevm = JudgeVM(None, "runner", None, 2, 4096)
+            judgevmss.judgevm_dict["vm"] = judgevm
+            with judgevmss.lock:
+                judgevmss.dispatch()
+            assert judgevm.free_cpu == 2 and judgevm.free_memory == 4096 and judgevm.tasks == []
+
+        asyncio.run(run())
+
+    def test_reject_unplaceable(self):
+        async def run():
+            evaluator = AzureEvaluator(None)
+            judgevmss = JudgeVMSS(B1S, B1S.name, None, None, evaluator.scheduler, evaluator.health_monitor)
+            task = asyncio.get_running_loop().create_task(judgevmss.submit(JudgeRequest(make_request().submission, B1S, 4, 256, {}, {"1": "url"})))
+            await asyncio.sleep(0)
+
+            #Once the size of the VMs is known, requests larger than a VM fail instead of waiting forever
+            assert not task.done()
+            judgevmss.sku_size = (2, 4096)
+            with judgevmss.lock:
+                judgevmss.dispatch()
+            judge_result = await task
+            assert judge_result.cause == "machine_type_too_small" and evaluator.scheduler.queue_depth(B1S) == 0
+
+        asyncio.run(run())
+
+    def test_placement_timeout(self):
+        async def run():
+            evaluator = AzureEvaluator(None)
+            evaluator.scheduler.placement_timeout = 0.05
+            judgevmss = JudgeVMSS(B1S, B1S.name, None, None, evaluator.scheduler, evaluator.health_monitor)
+
+            #A request that no VM takes on fails once the placement timeout passes, instead of waiting forever
+            judge_result = await judgevmss.submit(make_request())
+            assert judge_result.cause == "placement_timeout" and evaluator.scheduler.queue_depth(B1S) == 0
+
+        asyncio.run(run())
+
+    def test_failed_request_is_recorded(self):
+        async def run():
+            evaluator = AzureEvaluator(None)
+            judgevmss = JudgeVMSS(B1S, B1S.name, None, None, evaluator.scheduler, evaluator.health_monitor)
+            evaluator.judgevmss_dict[B1S] = judgevmss
+
+            async def submit(judge_request):
+                raise RuntimeError("The runner went away")
+
+            judgevmss.submit = submit
+            with pytest.raises(RuntimeError):
+                await evaluator.evaluate(make_request())
+
+        #Requests that raise are counted as well, by their own status
+        before = REQUESTS.labels(B1S.name, "exception").get()
+        asyncio.run(run())
+        assert REQUESTS.labels(B1S.name, "exception").get() == before + 1
@@ -0,0 +1,26 @@
+from azurewrap.catalog import VMSizeCatalog
+
+
+class TestVMSizeCatalog:
+    """Tests for the VMSizeCatalog class"""
+
+    def test_lookup(self):
+        catalog = VMSizeCatalog(path="")
+        assert not catalog.is_fresh("uksouth")
+
+        catalog.put("uksouth", {"Standard_B1s": (1, 1024)})
+        assert catalog.is_fresh("uksouth")
+        assert catalog.get("uksouth", "Standard_B1s") == (1, 1024)
+        assert catalog.get("uksouth", "Standard_B2s") is None
+        assert catalog.get("westeurope", "Standard_B1s") is None
+
+    def test_persistence(self, tmp_path):
+        #A new catalog should load the sizes stored by a previous one
+        path = str(tmp_path / "catalog.json")
+        VMSizeCatalog(path=path).put("uksouth", {"Standard_B1s": (1, 1024)})
+        assert VMSizeCatalog(path=path).get("uksouth", "Standard_B1s") == (1, 1024)
+
+    def test_expiry(self, tmp_path):
+        catalog = VMSizeCatalog(path="", ttl=0)
+        catalog.put("uksouth", {"Standard_B1s": (1, 1024)})
+        assert not catalog.is_fresh("uksouth")
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from protocol import Connection, Protocol
+from protocol.encoding import EXTENDED_FLAG, Encoding
+
+
+def receive(data: bytes) -> tuple[dict, Connection]:
+    #Receive a message from a connection that reads the given data
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        connection = Connection("127.0.0.1", 0, reader, None)
+        return await Protocol.receive(connection), connection
+
+    return asyncio.run(run())
+
+
+class TestEncoding:
+    """Tests for the Encoding class and the framing of messages"""
+
+    def test_original_frame(self):
+        #JSON without compression is sent in frames of the original protocol
+        frame = Encoding().encode({"id": 1})
+        size, extended = Encoding.parse_size(frame[:4])
+        assert not extended
+        assert frame[4:] == b'{"id": 1}'
+        assert size == len(frame) - 4
+
+    def test_compression_threshold(self, monkeypatch):
+        monkeypatch.setattr("protocol.encoding.PROTOCOL_COMPRESSION_THRESHOLD", 100)
+        encoding = Encoding("json", "zlib")
+
+        #Small messages are not compressed
+        frame = encoding.encode({"id": 1})
+        _, compressed = Encoding.parse_header(frame[4:8])
+        assert not compressed
+
+        #Large messages are compressed
+        message = {"id": 2, "response": {str(i): "x" * 50 for i in range(100)}}
+        frame = encoding.encode(message)
+        size, extended = Encoding.parse_size(frame[:4])
+        frame_encoding, compressed = Encoding.parse_header(frame[4:8])
+        assert extended and compressed
+        assert frame_encoding == encoding
+        assert size == len(frame) - 8
+        assert encoding.decode(frame[8:], compressed) == message
+
+    def test_msgpack(self):
+        pytest.importorskip("msgpack")
+        encoding = Encoding("msgpack")
+        frame = encoding.encode({"id": 1, "args": {"a": [1, 2]}})
+        assert encoding.decode(frame[8:]) == {"id": 1, "args": {"a": [1, 2]}}
+
+    def test_unknown_header(self):
+        #Unknown extension versions and codecs are rejected
+        with pytest.raises(ValueError):
+            Encoding.parse_header(bytes([2, 0, 0, 0]))
+        with pytest.raises(ValueError):
+            Encoding.parse_header(bytes([1, 9, 0, 0]))
+
+    def test_mirror_encoding(self):
+        #Receiving an original frame keeps the default encoding
+        frame = Encoding().encode({"id": 1, "version": Protocol.VERSION})
+        message, connection = receive(frame)
+        assert message["id"] == 1
+        assert connection.encoding == Encoding()
+
+        #Receiving an extended frame switches the connection to the encoding of the peer
+        frame = Encoding("json", "zlib").encode({"id": 2, "version": Protocol.VERSION})
+        assert int.from_bytes(frame[:4], byteorder="big") & EXTENDED_FLAG
+        message, connection = receive(frame)
+        assert message["id"] == 2
+        assert connection.encoding == Encoding("json", "zlib")
+
+    def test_incomplete_frame(self):
+        #A connection closed halfway through a frame is reported as a reset
+        frame = Encoding().encode({"id": 1, "version": Protocol.VERSION})
+        with pytest.raises(ConnectionResetError):
+            receive(frame[:-1])
@@ -0,0 +1,30 @@
+from health_monitor import HEALTH_DEAD_THRESHOLD, HealthMonitor, RunnerState
+
+
+class TestHealthMonitor:
+    """Tests for the liveness table of the HealthMonitor class"""
+
+    def test_state_transitions(self):
+        monitor = HealthMonitor()
+        changes = []
+        monitor.set_state_listener(lambda machine_name, state: changes.append(state))
+
+        #Unknown runners are assumed to be alive
+        assert monitor.is_alive("runner")
+
+        #A successful check records the round-trip time
+        monitor.record("runner", True, 0.01)
+        assert monitor.table["runner"].rtt == 0.01
+
+        #Failed checks make the runner suspect, and eventually dead
+        monitor.record("runner", False, 3)
+        assert monitor.get_state("runner") == RunnerState.SUSPECT
+        assert not monitor.is_alive("runner")
+        for _ in range(HEALTH_DEAD_THRESHOLD - 1):
+            monitor.record("runner", False, 3)
+        assert monitor.get_state("runner") == RunnerState.DEAD
+
+        #A successful check makes it alive again
+        monitor.record("runner", True, 0.02)
+        assert monitor.is_alive("runner")
+        assert changes == [RunnerState.SUSPECT, RunnerState.DEAD, RunnerState.ALIVE]
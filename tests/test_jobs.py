@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+
+from evaluators import SubmissionEvaluator
+from jobs import JobManager, JobStatus
+from journal import JobJournal
+from models import JudgeRequest, JudgeResult, MachineType, Submission, SubmissionType
+from result_cache import ResultCache
+
+MACHINE_TYPE = MachineType("Standard_B2s", "Standard")
+
+
+class ShardingEvaluator(SubmissionEvaluator):
+    """An evaluator that finishes one benchmark instance at a time"""
+
+    def __init__(self, fail=False):
+        super().__init__()
+        self.result_cache = ResultCache(size=0)
+        self.fail = fail
+
+    async def evaluate(self, judge_request):
+        self.evaluated = judge_request
+        if self.fail:
+            return JudgeResult.error("timeout")
+
+        for shard in judge_request.split(len(judge_request.benchmark_instances)):
+            shard.report_progress({instance_id: {"score": 1} for instance_id in shard.benchmark_instances})
+        return JudgeResult.success({instance_id: {"score": 1} for instance_id in judge_request.benchmark_instances})
+
+
+def run_job(job_manager, benchmark_instances):
+    async def run():
+        submission = Submission(SubmissionType.CODE, "source", "validator")
+        job = job_manager.submit(JudgeRequest(submission, MACHINE_TYPE, 1, 256, {}, benchmark_instances))
+        await job.task
+        return job
+
+    return asyncio.run(run())
+
+
+class TestJobManager:
+    """Tests for the JobManager class"""
+
+    def test_progress_events(self):
+        #Every instance is reported once as it finishes, followed by the outcome of the job
+        ShardingEvaluator()
+        job_manager = JobManager()
+        pushed = []
+        job_manager.add_event_listener(pushed.append)
+        job = run_job(job_manager, {"a": "url", "b": "url"})
+
+        assert [event["event"] for event in pushed] == ["JOB_PROGRESS", "JOB_PROGRESS", "JOB_DONE"]
+        assert [event["args"]["sequence"] for event in pushed] == [1, 2, 3]
+        assert job.status == JobStatus.DONE and set(job.results) == {"a", "b"}
+
+        #Missed events can be collected again
+        assert job.events_since(2) == pushed[2:]
+        assert job_manager.get(job.job_id) is job
+
+    def test_failed_job(self):
+        ShardingEvaluator(fail=True)
+        job = run_job(JobManager(), {"a": "url"})
+        assert job.status == JobStatus.FAILED and job.cause == "timeout"
+        assert job.events[-1]["args"] == {"job_id": job.job_id, "sequence": 1, "status": "error", "cause": "timeout"}
+
+    def test_restore(self, tmp_path):
+        #Journal a job that had finished one of its instances before a restart
+        path = str(tmp_path / "jobs.db")
+        request = JudgeRequest(Submission(SubmissionType.CODE, "source", "validator"), MACHINE_TYPE, 1, 256, {}, {"a": "url", "b": "url"})
+        journal = JobJournal(path)
+        journal.pending = [
+            ("job", "submitted", '{"request": %s}' % json.dumps(request.to_dict()), 0),
+            ("job", "event", '{"event": "JOB_PROGRESS", "args": {"job_id": "job", "sequence": 1, "results": {"a": {"score": 0}}}}', 0),
+            ("job", "placed", '{"machine_name": "vm2", "instances": ["a", "b"]}', 0),
+        ]
+        journal.flush()
+
+        #Only the remaining instance is evaluated, preferably on the same runner
+        evaluator = ShardingEvaluator()
+        job_manager = JobManager()
+
+        async def restore():
+            job_manager.restore(path)
+            await job_manager.get("job").task
+
+        asyncio.run(restore())
+        job = job_manager.get("job")
+        assert list(evaluator.evaluated.benchmark_instances) == ["b"]
+        assert evaluator.evaluated.preferred_machine_name == "vm2"
+        assert job.status == JobStatus.DONE and job.results == {"a": {"score": 0}, "b": {"score": 1}}
+        assert [event["args"]["sequence"] for event in job.events] == [1, 2, 3]
+        job_manager.close()
+
+        #The outcome is journaled as well
+        assert JobManager().restore_job("job", JobJournal(path).replay()["job"]).status == JobStatus.DONE
+
+
+class TestJobJournal:
+    """Tests for the JobJournal class"""
+
+    def test_flush_order(self, tmp_path):
+        path = str(tmp_path / "jobs.db")
+        journal = JobJournal(path, flush_interval=0)
+
+        #The first batch takes longer to write than the next one
+        write = journal.write
+        def write_slowly(batch):
+            if len(batch) > 0 and batch[0][1] == "submitted":
+                time.sleep(0.05)
+            write(batch)
+        journal.write = write_slowly
+
+        async def run():
+            journal.append("job", "submitted", {})
+            await asyncio.sleep(0.01)
+            journal.append("job", "event", {})
+            await asyncio.sleep(0.01)
+            journal.append("job", "finished", {})
+
+        asyncio.run(run())
+        journal.close()
+
+        #Batches are replayed in the order in which they were appended
+        assert [kind for kind, _ in JobJournal(path).replay()["job"]] == ["submitted", "event", "finished"]
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from localevaluator import LocalEvaluator
+from models import JudgeRequest, MachineType, Submission, SubmissionType
+from protocol import judge_protocol_handler
+from protocol.judge.commands import InfoCommand
+from protocol.judge_protocol_handler import protocol_dict, protocol_dict_lock
+from result_cache import ResultCache
+
+
+class FakeProtocol:
+    """A runner connection that answers every START after a short while"""
+
+    def __init__(self, machine_name, max_containers=None):
+        self.info = InfoCommand()
+        self.info.machine_name = machine_name
+        self.info.max_containers = max_containers
+        self.load = 0
+        self.closed = False
+        self.running = 0
+        self.max_running = 0
+        self.started = 0
+
+    async def send_command(self, command, progress_listener=None, **kwargs):
+        self.running += 1
+        self.started += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        command.response({"status": "ok", "results": {instance_id: {"runner": self.info.machine_name} for instance_id in kwargs["benchmark_instances"]}})
+
+
+def make_request(number):
+    submission = Submission(SubmissionType.CODE, f"source{number}", "validator")
+    return JudgeRequest(submission, MachineType("Standard_B2s", "Standard"), 1, 256, {}, {str(number): "url"})
+
+
+class TestLocalEvaluator:
+    """Tests for the dispatch of the LocalEvaluator over several runners"""
+
+    @pytest.fixture(autouse=True)
+    def runners(self):
+        self.protocols = {"runner-a": FakeProtocol("runner-a", 2), "runner-b": FakeProtocol("runner-b", 1)}
+        with protocol_dict_lock:
+            protocol_dict.update(self.protocols)
+        yield
+        with protocol_dict_lock:
+            for machine_name in self.protocols:
+                protocol_dict.pop(machine_name, None)
+
+    def evaluate(self, evaluator, count):
+        async def run():
+            evaluator.result_cache = ResultCache(size=0)
+            await evaluator.initialize()
+            results = await asyncio.gather(*(evaluator.submit(make_request(number)) for number in range(count)))
+            await evaluator.close()
+            return results
+
+        return asyncio.run(run())
+
+    def test_least_loaded(self):
+        #Every runner is used, without running more requests than it declared
+        results = self.evaluate(LocalEvaluator("least_loaded"), 9)
+        assert all(judge_result.result is not None for judge_result in results)
+        assert self.protocols["runner-a"].max_running == 2 and self.protocols["runner-b"].max_running == 1
+        assert self.protocols["runner-a"].started + self.protocols["runner-b"].started == 9
+
+    def test_round_robin(self):
+        evaluator = LocalEvaluator("round_robin", default_max_containers=0)
+        self.protocols["runner-a"].info.max_containers = None
+        self.protocols["runner-b"].info.max_containers = None
+
+        #Runners without a declared limit take turns
+        self.evaluate(evaluator, 4)
+        assert self.protocols["runner-a"].started == 2 and self.protocols["runner-b"].started == 2
+
+    def test_external_load(self):
+        #Containers a runner reports running besides the placed requests take up its room
+        self.protocols["runner-a"].load = 2
+        self.evaluate(LocalEvaluator("least_loaded"), 3)
+        assert self.protocols["runner-a"].started == 0 and self.protocols["runner-b"].started == 3
+
+    def test_load_decrease(self):
+        async def run():
+            evaluator = LocalEvaluator("least_loaded")
+            evaluator.result_cache = ResultCache(size=0)
+            await evaluator.initialize()
+
+            #Every runner is full of containers it reports running besides the placed requests
+            self.protocols["runner-a"].load = 2
+            self.protocols["runner-b"].load = 1
+            task = asyncio.get_running_loop().create_task(evaluator.submit(make_request(0)))
+            await asyncio.sleep(0.05)
+            assert not task.done()
+
+            #Once a runner reports a lower load, the waiting request is placed on it
+            judge_protocol_handler.update_load("runner-b", self.protocols["runner-b"], 0)
+            judge_result = await asyncio.wait_for(task, 1)
+            assert judge_result.result == {"0": {"runner": "runner-b"}}
+            await evaluator.close()
+
+        asyncio.run(run())
+
+    def test_close(self):
+        async def run():
+            evaluator = LocalEvaluator("least_loaded")
+            await evaluator.initialize()
+            await evaluator.close()
+
+            #A closed evaluator no longer listens to the runners, nor health checks them
+            assert evaluator.on_connection not in judge_protocol_handler.connection_listeners
+            assert evaluator.on_load_decrease not in judge_protocol_handler.load_listeners
+            assert evaluator.health_monitor.on_connection not in judge_protocol_handler.connection_listeners
+            await asyncio.sleep(0)
+            assert evaluator.health_monitor.task.done()
+
+        asyncio.run(run())
+
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError):
+            LocalEvaluator("random")
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+import metrics
+from metrics import Registry
+
+
+class TestMetrics:
+    """Tests for the metrics module"""
+
+    def test_render(self):
+        registry = Registry()
+        requests = registry.counter("requests_total", "Requests", ("machine_type",))
+        depth = registry.gauge("depth", "Depth")
+        latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+
+        requests.labels("Standard_B2s").inc()
+        requests.labels("Standard_B2s").inc(2)
+        depth.set(4)
+        latency.observe(0.05)
+        latency.observe(5)
+
+        text = registry.render()
+        assert 'requests_total{machine_type="Standard_B2s"} 3' in text
+        assert "depth 4" in text
+        assert 'latency_seconds_bucket{le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{le="1"} 1' in text
+        assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+        assert "latency_seconds_count 2" in text
+
+    def test_abstract_metric(self):
+        #Every type of metric creates its own values
+        with pytest.raises(TypeError):
+            metrics.Metric("metric", "Metric")
+
+    def test_snapshot(self):
+        registry = Registry()
+        gauge = registry.gauge("runners", "Runners")
+
+        #Collectors and functions are evaluated when the metrics are read
+        runners = []
+        gauge.set_function(lambda: len(runners))
+        registry.add_collector(lambda: runners.append("runner"))
+        assert registry.snapshot()["runners"][()] == 1
+        assert registry.snapshot()["runners"][()] == 2
+
+    def test_register(self):
+        registry = Registry()
+        counter = registry.counter("total", "Total", ("status",))
+
+        #Registering the same metric again gives the existing one
+        assert registry.counter("total", "Total", ("status",)) is counter
+        with pytest.raises(ValueError):
+            registry.gauge("total", "Total")
+        with pytest.raises(ValueError):
+            counter.labels("ok", "extra")
+
+    def test_endpoint(self):
+        metrics.counter("test_endpoint_total", "Test").inc()
+
+        async def get(path):
+            server = await metrics.start_handler("127.0.0.1", 0)
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.sockets[0].getsockname()[1])
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            response = await reader.read()
+            server.close()
+            return response.decode()
+
+        response = asyncio.run(get("/metrics"))
+        assert response.startswith("HTTP/1.1 200 OK") and "test_endpoint_total 1" in response
+        assert asyncio.run(get("/other")).startswith("HTTP/1.1 404")
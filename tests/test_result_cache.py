@@ -0,0 +1,83 @@
+import asyncio
+
+from evaluators import SubmissionEvaluator
+from models import JudgeRequest, JudgeResult, MachineType, Submission, SubmissionType
+from result_cache import ResultCache, request_key
+
+MACHINE_TYPE = MachineType("Standard_B2s", "Standard")
+
+
+def make_request(benchmark_instances, evaluation_settings=None):
+    submission = Submission(SubmissionType.CODE, "source", "validator")
+    return JudgeRequest(submission, MACHINE_TYPE, 1, 256, evaluation_settings or {"time_limit": 60}, benchmark_instances)
+
+
+class CountingEvaluator(SubmissionEvaluator):
+    """An evaluator that remembers which instances it has evaluated"""
+
+    def __init__(self, result_cache):
+        super().__init__()
+        self.result_cache = result_cache
+        self.evaluated = []
+
+    async def evaluate(self, judge_request):
+        self.evaluated.append(sorted(judge_request.benchmark_instances))
+        return JudgeResult.success({instance_id: {"score": 1} for instance_id in judge_request.benchmark_instances})
+
+
+class TestResultCache:
+    """Tests for the ResultCache class"""
+
+    def test_canonical_key(self):
+        #The order of the instances and settings that do not influence the result do not matter
+        first = make_request({"a": "url_a", "b": "url_b"}, {"time_limit": 60, "memory": 256})
+        second = make_request({"b": "url_b", "a": "url_a"}, {"memory": 256, "time_limit": 60, "priority": 5})
+        assert request_key(first) == request_key(second)
+
+        #Other benchmark instances give another key
+        assert request_key(first) != request_key(make_request({"a": "url_a"}))
+
+    def test_request_granularity(self):
+        evaluator = CountingEvaluator(ResultCache(size=10, ttl=60, path="", granularity="request"))
+        asyncio.run(evaluator.submit(make_request({"a": "url"})))
+        result = asyncio.run(evaluator.submit(make_request({"a": "url"})))
+        assert result.result == {"a": {"score": 1}}
+        assert evaluator.evaluated == [["a"]]
+
+    def test_instance_granularity(self):
+        #Only the instances that are not cached yet are evaluated
+        evaluator = CountingEvaluator(ResultCache(size=10, ttl=60, path="", granularity="instance"))
+        asyncio.run(evaluator.submit(make_request({"a": "url", "b": "url"})))
+        result = asyncio.run(evaluator.submit(make_request({"b": "url", "c": "url"})))
+        assert set(result.result) == {"b", "c"}
+        assert evaluator.evaluated == [["a", "b"], ["c"]]
+
+    def test_opt_out(self):
+        evaluator = CountingEvaluator(ResultCache(size=10, ttl=60, path="", granularity="request"))
+        request = make_request({"a": "url"}, {"cache": False})
+        asyncio.run(evaluator.submit(request))
+        asyncio.run(evaluator.submit(request))
+        assert len(evaluator.evaluated) == 2
+
+    def test_eviction(self):
+        #The least recently used result is evicted, and expired results are not returned
+        cache = ResultCache(size=2, ttl=60, path="", granularity="request")
+        cache.store.put("a", {})
+        cache.store.put("b", {})
+        cache.get("a")
+        cache.store.put("c", {})
+        assert cache.get("b") is None and cache.get("a") == {}
+
+        cache.ttl = 0
+        assert cache.get("a") is None
+
+    def test_persistence(self, tmp_path):
+        #Results stored in the database are available after a restart
+        path = str(tmp_path / "results.db")
+        ResultCache(size=2, ttl=60, path=path).store.put("a", {"score": 1})
+        cache = ResultCache(size=2, ttl=60, path=path)
+        assert cache.get("a") == {"score": 1}
+
+        cache.store.put("b", {})
+        cache.store.put("c", {})
+        assert cache.get("a") is None
@@ -0,0 +1,149 @@
+from types import SimpleNamespace
+
+from azureevaluator import JudgeVM
+from models import JudgeRequest, JudgeResult, MachineType, Submission, SubmissionType
+from scheduler import Scheduler
+
+MACHINE_TYPE = MachineType("Standard_B2s", "Standard")
+
+
+class FakeVM:
+    """A VM with just the resource bookkeeping the scheduler uses"""
+
+    def __init__(self, machine_name, cpus, memory):
+        self.machine_name = machine_name
+        self.cpus = cpus
+        self.memory = memory
+        self.free_cpu = cpus
+        self.free_memory = memory
+        self.tasks = []
+
+    def check_capacity(self, cpus, memory):
+        return self.free_cpu >= cpus and self.free_memory >= memory
+
+    def reserve(self, judge_request):
+        self.free_cpu -= judge_request.cpus
+        self.free_memory -= judge_request.memory
+        self.tasks.append(judge_request)
+
+    def release(self, judge_request):
+        self.tasks.remove(judge_request)
+        self.free_cpu += judge_request.cpus
+        self.free_memory += judge_request.memory
+
+
+def make_request(cpus=1, memory=256, priority=0, competition_id=None, benchmark_instances=None):
+    submission = Submission(SubmissionType.CODE, "source", "validator")
+    return JudgeRequest(submission, MACHINE_TYPE, cpus, memory, {}, benchmark_instances or {},
+                        priority=priority, competition_id=competition_id)
+
+
+class TestScheduler:
+    """Tests for the Scheduler class"""
+
+    def test_best_fit(self):
+        #The request should go to the VM it fills up the most
+        scheduler = Scheduler("best_fit")
+        big, small = FakeVM("big", 4, 4096), FakeVM("small", 1, 1024)
+        job = scheduler.enqueue(make_request())
+        scheduler.dispatch(MACHINE_TYPE, [big, small])
+        assert job.future.result() is small
+        assert small.free_cpu == 0
+
+    def test_worst_fit(self):
+        #The request should go to the VM with the most room left
+        scheduler = Scheduler("worst_fit")
+        big, small = FakeVM("big", 4, 4096), FakeVM("small", 1, 1024)
+        job = scheduler.enqueue(make_request())
+        scheduler.dispatch(MACHINE_TYPE, [small, big])
+        assert job.future.result() is big
+
+    def test_queue_until_capacity(self):
+        #A request that does not fit stays queued until resources are freed
+        scheduler = Scheduler()
+        vm = FakeVM("vm", 1, 1024)
+        first = scheduler.enqueue(make_request())
+        second = scheduler.enqueue(make_request())
+        scheduler.dispatch(MACHINE_TYPE, [vm])
+        assert first.is_placed() and not second.is_placed()
+        assert scheduler.stats(MACHINE_TYPE)["depth"] == 1
+
+        vm.release(first.judge_request)
+        scheduler.dispatch(MACHINE_TYPE, [vm])
+        assert second.is_placed()
+        assert scheduler.queue_depth(MACHINE_TYPE) == 0
+
+    def test_priority_and_fairness(self):
+        #Higher priority goes first, and competitions take turns
+        scheduler = Scheduler()
+        a1 = scheduler.enqueue(make_request(competition_id="a"))
+        a2 = scheduler.enqueue(make_request(competition_id="a"))
+        b1 = scheduler.enqueue(make_request(competition_id="b"))
+        urgent = scheduler.enqueue(make_request(priority=1, competition_id="a"))
+
+        order = scheduler.queues[MACHINE_TYPE].ordered()
+        assert order == [urgent, a1, b1, a2]
+
+    def test_cancel(self):
+        #Cancelling a placed job gives its resources back
+        scheduler = Scheduler()
+        vm = FakeVM("vm", 2, 1024)
+        job = scheduler.enqueue(make_request())
+        scheduler.dispatch(MACHINE_TYPE, [vm])
+        scheduler.cancel(job)
+        assert vm.free_cpu == 2
+
+    def test_split_spreads_over_vms(self):
+        #The parts of a split request are not placed on the same VM, even if it has room for both
+        scheduler = Scheduler()
+        big, small = FakeVM("big", 4, 4096), FakeVM("small", 1, 1024)
+        request = make_request(benchmark_instances={"a": "url", "b": "url"})
+        first, second = (scheduler.enqueue(shard) for shard in request.split(2))
+        scheduler.dispatch(MACHINE_TYPE, [big, small])
+        assert {first.future.result(), second.future.result()} == {big, small}
+
+
+class TestSplit:
+    """Tests for splitting judge requests and merging their results"""
+
+    def test_split(self):
+        #The instances are divided over parts of about equal size, in order
+        request = make_request(benchmark_instances={str(i): "url" for i in range(5)})
+        shards = request.split(3)
+        assert [list(shard.benchmark_instances) for shard in shards] == [["0", "1"], ["2", "3"], ["4"]]
+        assert all(shard.parent is request and shard.cpus == request.cpus for shard in shards)
+
+        #There are never more parts than instances
+        assert len(request.split(10)) == 5
+
+    def test_merge(self):
+        merged = JudgeResult.merge([JudgeResult.success({"a": 1}), JudgeResult.success({"b": 2})])
+        assert merged.result == {"a": 1, "b": 2}
+
+        #A single failed part fails the whole request
+        merged = JudgeResult.merge([JudgeResult.success({"a": 1}), JudgeResult.error("timeout")])
+        assert merged.result is None and merged.cause == "timeout"
+
+
+class TestJudgeVM:
+    """Tests for the admission of requests on a JudgeVM"""
+
+    def test_slots(self):
+        protocol = SimpleNamespace(load=0)
+        judgevm = JudgeVM(None, "runner", None, 8, 8192, max_containers=2, protocol=protocol)
+
+        #Besides cpus and memory, every request takes a container slot
+        judgevm.reserve(make_request())
+        assert judgevm.check_capacity(1, 256)
+        judgevm.reserve(make_request())
+        assert not judgevm.check_capacity(1, 256)
+
+        #Containers the runner reports beyond the placed requests take slots as well
+        judgevm.release(judgevm.tasks[0])
+        protocol.load = 2
+        assert judgevm.free_slots() == 0
+        protocol.load = 1
+        assert judgevm.free_slots() == 1
+
+        #Without a declared maximum, only cpus and memory count
+        assert JudgeVM(None, "runner", None, 8, 8192).check_capacity(1, 256)
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from protocol import judge_protocol_handler
+from protocol.judge.commands import StartCommand
+from simulation import FakeAzure, SimulatedRunner
+from simulation.benchmark import make_request, percentile, run_benchmark
+from simulation.runner import instance_duration
+from simulation.website_load import LoadGenerator, histogram, parse_mix, start_server
+
+
+class StubRunner:
+    """A runner that only records whether it runs"""
+
+    def __init__(self, machine_name):
+        self.machine_name = machine_name
+        self.running = False
+
+    async def start(self):
+        self.running = True
+
+    async def stop(self):
+        self.running = False
+
+
+class TestFakeAzure:
+    """Tests for the FakeAzure class"""
+
+    def test_capacity(self):
+        async def run():
+            azure = FakeAzure(StubRunner, operation_delay=0, provisioning_delay=0.01, boot_delay=0.01, deletion_delay=0.01)
+            await azure.create_vmss("set", machine_type_name="Standard_B2s")
+            await azure.set_capacity(3, "set")
+
+            #New VMs are listed right away, and their runners start once they have booted
+            vms = await azure.list_vms("set")
+            assert len(vms) == 3 and (await azure.get_vmss("set")).sku.capacity == 3
+            await asyncio.sleep(0.05)
+            runners = [fake_vm.runner for fake_vm in azure.registry.vms.values()]
+            assert all(runner.running for runner in runners)
+
+            vm = await azure.get_vm(vms[0].name)
+            assert vm.os_profile.computer_name == runners[0].machine_name
+            assert await azure.get_vm_size(vms[0].name) == (2, 4096)
+
+            #Deleted VMs stop their runner, and are no longer billed
+            await azure.delete_vms([vms[0].name], "set")
+            assert not runners[0].running and len(await azure.list_vms("set")) == 2
+            vm_seconds = azure.vm_seconds()
+            await asyncio.sleep(0.05)
+            assert abs(azure.vm_seconds() - vm_seconds - 2 * 0.05) < 0.02
+
+            #Added capacity builds on the VMs that are left after the deletion
+            await azure.add_capacity(1, "set")
+            assert len(await azure.list_vms("set")) == 3 and (await azure.get_vmss("set")).sku.capacity == 3
+
+        asyncio.run(run())
+
+
+class TestSimulatedRunner:
+    """Tests for the SimulatedRunner class"""
+
+    def test_start(self):
+        async def run():
+            server = await judge_protocol_handler.start_handler("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            runner = SimulatedRunner("simulated-test-runner", "127.0.0.1", port, time_scale=0.001)
+            await runner.start()
+            protocol = await judge_protocol_handler.wait_for_connection("simulated-test-runner", 5)
+
+            #Every instance takes its own duration, and is reported as progress
+            progress = {}
+            command = StartCommand()
+            await protocol.send_command(command, progress_listener=progress.update, benchmark_instances={"a": "sim://0/a?duration=10", "b": "sim://0/b"})
+            assert command.success and set(command.result) == {"a", "b"} and progress == command.result
+            assert runner.busy_time == 11
+
+            await runner.stop()
+            server.close()
+
+        asyncio.run(run())
+
+
+class TestBenchmark:
+    """Tests for the helpers of the simulation benchmark"""
+
+    def test_instance_duration(self):
+        #Benchmark instance urls carry their duration
+        judge_request = make_request(3, {"machine_type": "Standard_B2s", "cpus": 1, "memory": 256, "durations": [12.5, 4]})
+        assert [instance_duration(url) for url in judge_request.benchmark_instances.values()] == [12.5, 4]
+        assert instance_duration("sim://3/0", default=7) == 7
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 0.5) == 50
+        assert percentile(values, 0.99) == 99
+        assert percentile([], 0.5) == 0
+
+    def test_scaled_run(self):
+        trace = [{"at": at, "machine_type": "Standard_B2s", "cpus": 1, "memory": 256, "durations": [10]} for at in (0, 1)]
+        report = asyncio.run(run_benchmark(trace, 0.01, operation_delay=5, provisioning_delay=60, boot_delay=30, deletion_delay=10))
+
+        #Requests wait for the VMSS, the autoscaler debounce, provisioning and booting, all in simulated seconds
+        assert report["failed"] == 0
+        assert 90 <= report["queue_latency_p50"] < 120 and report["makespan"] < 140
+
+
+class TestLoadGenerator:
+    """Tests for the load generator of the website protocol server"""
+
+    def test_mix(self):
+        assert parse_mix("check=3, START=1") == {"CHECK": 3, "START": 1}
+        with pytest.raises(ValueError):
+            parse_mix("STOP=1")
+
+    def test_histogram(self):
+        #Only the buckets from the first to the last value are counted
+        assert histogram([0.00015, 0.0003, 0.0003]) == [(0.0002, 1), (0.0004, 2)]
+        assert histogram([]) == []
+
+    def test_run(self):
+        async def run():
+            port, closeables = await start_server("stub", 0)
+            load_generator = LoadGenerator("127.0.0.1", port, {"CHECK": 1, "START": 1, "SUBMIT": 1, "POLL": 1}, concurrency=4, seed=1)
+            report = await load_generator.run(40)
+            for closeable in closeables:
+                closeable.close()
+            return report
+
+        report = asyncio.run(run())
+        assert report["commands"] == 40
+        assert sum(command["count"] for command in report["per_command"].values()) == 40
+        assert report["per_command"]["START"]["errors"] == 0 and report["per_command"]["SUBMIT"]["errors"] == 0
@@ -0,0 +1,77 @@
+import asyncio
+
+from models import JudgeRequest, JudgeResult, MachineType, Submission, SubmissionType
+from single_flight import SingleFlight
+
+MACHINE_TYPE = MachineType("Standard_B2s", "Standard")
+
+
+def make_request(benchmark_instances):
+    submission = Submission(SubmissionType.CODE, "source", "validator")
+    return JudgeRequest(submission, MACHINE_TYPE, 1, 256, {}, benchmark_instances)
+
+
+class TestSingleFlight:
+    """Tests for the SingleFlight class"""
+
+    def setup_method(self):
+        self.evaluated = []
+
+    async def evaluate(self, judge_request):
+        #Evaluate slowly, so other requests arrive while it is in flight
+        self.evaluated.append(sorted(judge_request.benchmark_instances))
+        await asyncio.sleep(0.05)
+        return JudgeResult.success({instance_id: {"score": 1} for instance_id in judge_request.benchmark_instances})
+
+    def run(self, single_flight, *judge_requests):
+        async def run_all():
+            return await asyncio.gather(*(single_flight.run(judge_request, self.evaluate) for judge_request in judge_requests))
+
+        return asyncio.run(run_all())
+
+    def test_identical_requests(self):
+        #Identical requests share a single evaluation
+        results = self.run(SingleFlight("request"), make_request({"a": "url"}), make_request({"a": "url"}))
+        assert self.evaluated == [["a"]]
+        assert results[0].result == results[1].result == {"a": {"score": 1}}
+
+    def test_different_requests(self):
+        self.run(SingleFlight("request"), make_request({"a": "url"}), make_request({"a": "other_url"}))
+        assert len(self.evaluated) == 2
+
+    def test_overlapping_instances(self):
+        #Only the instances that are not in flight yet are evaluated
+        single_flight = SingleFlight("instance")
+        results = self.run(single_flight, make_request({"a": "url", "b": "url"}), make_request({"b": "url", "c": "url"}))
+        assert self.evaluated == [["a", "b"], ["c"]]
+        assert set(results[1].result) == {"b", "c"}
+        assert single_flight.flights == {}
+
+    def test_shared_failure(self):
+        #A failed evaluation fails every request sharing it
+        async def fail(judge_request):
+            await asyncio.sleep(0.05)
+            return JudgeResult.error("timeout")
+
+        async def run_all():
+            single_flight = SingleFlight("instance")
+            return await asyncio.gather(*(single_flight.run(make_request({"a": "url"}), fail) for _ in range(2)))
+
+        assert [result.cause for result in asyncio.run(run_all())] == ["timeout", "timeout"]
+
+    def test_cancelled_owner(self):
+        async def run():
+            single_flight = SingleFlight("request")
+            owner = asyncio.get_running_loop().create_task(single_flight.run(make_request({"a": "url"}), self.evaluate))
+            await asyncio.sleep(0)
+            joined = asyncio.get_running_loop().create_task(single_flight.run(make_request({"a": "url"}), self.evaluate))
+            await asyncio.sleep(0.01)
+
+            #Cancelling the request that started the evaluation does not cancel it for the request that joined
+            owner.cancel()
+            judge_result = await joined
+            assert owner.cancelled() and not joined.cancelled()
+            return judge_result
+
+        assert asyncio.run(run()).result == {"a": {"score": 1}}
+        assert self.evaluated == [["a"]]